@@ -1,5 +1,7 @@
+from functools import cached_property, lru_cache
+from typing import FrozenSet
+
 from pydantic_settings import BaseSettings
-from typing import List
 
 
 class Settings(BaseSettings):
@@ -25,18 +27,25 @@ class Settings(BaseSettings):
     
     # Whisper (Audio transcription)
     WHISPER_MODEL: str = "base"  # tiny, base, small, medium, large
-    WHISPER_DEVICE: str = "cpu"  # cpu, cuda
-    WHISPER_COMPUTE_TYPE: str = "int8"  # int8, float16, float32
+    WHISPER_DEVICE: str = "auto"  # auto, cpu, cuda
+    WHISPER_COMPUTE_TYPE: str = "auto"  # auto, int8, float16, float32
     
     class Config:
         env_file = ".env"
         case_sensitive = True
     
-    @property
-    def api_keys_list(self) -> List[str]:
-        return [key.strip() for key in self.API_KEYS.split(",") if key.strip()]
+    @cached_property
+    def api_keys_set(self) -> FrozenSet[str]:
+        """Parsed API keys, computed once per Settings instance"""
+        return frozenset(key.strip() for key in self.API_KEYS.split(",") if key.strip())
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings instance (.env is parsed only once)"""
+    return Settings()
 
 
-settings = Settings()
+settings = get_settings()
 
 
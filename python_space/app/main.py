@@ -1,29 +1,27 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-import base64
+import asyncio
+import hashlib
+import json
 import logging
-import uuid
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
 
 from app.config import settings
 from app.models.schemas import DownloadRequest, ErrorResponse
-from app.models.video_edit_schemas import EditStyle, CompilationRequest, EditedVideoResult
+from app.models.video_edit_schemas import EditStyle, CompilationRequest, EditedVideoResult, AnalysisResult
 from app.models.story_video_schemas import StoryVideoRequest, StoryVideoResult
 from app.middleware.auth import verify_api_key
-from app.services.download_service import download_service
-from app.services.ai_comments_service import ai_comments_service
-from app.services.text_parser_service import text_parser_service
-from app.services.image_generator_service import image_generator_service
-from app.services.zip_service import zip_service
-from app.services.capcut_service import CapCutAutomationService
-from app.services.video_analyzer_service import VideoAnalyzerService
-from app.services.story_video_service import StoryVideoService
 
 # Configure logging
 logging.basicConfig(
@@ -53,13 +51,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Downloads root is fixed: create it once at startup, not per request
+Path(settings.DOWNLOADS_DIR).mkdir(parents=True, exist_ok=True)
+
+# Maximum number of simultaneous downloads for a single compilation
+MAX_CONCURRENT_DOWNLOADS = 4
+
 # Serve static files (HTML interface)
 static_path = Path(__file__).parent / "static"
 
 
+# Lazy service accessors: heavy modules (yt-dlp, MoviePy, OpenCV, Pillow...)
+# are only imported and instantiated when an endpoint first needs them.
+@lru_cache(maxsize=1)
+def get_download_service():
+    from app.services.download_service import download_service
+    return download_service
+
+
+@lru_cache(maxsize=1)
+def get_ai_comments_service():
+    from app.services.ai_comments_service import ai_comments_service
+    return ai_comments_service
+
+
+@lru_cache(maxsize=1)
+def get_text_parser_service():
+    from app.services.text_parser_service import text_parser_service
+    return text_parser_service
+
+
+@lru_cache(maxsize=1)
+def get_image_generator_service():
+    from app.services.image_generator_service import image_generator_service
+    return image_generator_service
+
+
+@lru_cache(maxsize=1)
+def get_zip_service():
+    from app.services.zip_service import zip_service
+    return zip_service
+
+
+@lru_cache(maxsize=1)
+def get_capcut_service():
+    from app.services.capcut_service import CapCutAutomationService
+    return CapCutAutomationService(analyzer=get_video_analyzer())
+
+
+@lru_cache(maxsize=1)
+def get_video_analyzer():
+    from app.services.video_analyzer_service import VideoAnalyzerService
+    return VideoAnalyzerService()
+
+
+@lru_cache(maxsize=1)
+def get_story_video_service():
+    from app.services.story_video_service import StoryVideoService
+    return StoryVideoService()
+
+
+@app.on_event("shutdown")
+async def close_service_clients():
+    """Close pooled HTTP clients of services that were actually created"""
+    if get_ai_comments_service.cache_info().currsize:
+        await get_ai_comments_service().aclose()
+    if get_download_service.cache_info().currsize:
+        await get_download_service().aclose()
+
+
 @app.post(
     "/download",
-    response_class=FileResponse,
+    response_class=StreamingResponse,
     responses={
         200: {"description": "ZIP package downloaded successfully"},
         400: {"model": ErrorResponse, "description": "Invalid URL or video not available"},
@@ -83,122 +146,97 @@ async def download_video(
     - instagram_01.png to instagram_15.png (comment images)
     - README.txt (disclaimer)
     """
-    url = str(download_request.url)
-    logger.info(f"Download requested for URL: {url}")
+    url = download_request.url
+    logger.info("Download requested for URL: %s", url)
     
-    # Generate unique ID for this download
-    download_id = str(uuid.uuid4())
-    temp_dir = Path(settings.DOWNLOADS_DIR) / download_id
-    temp_dir.mkdir(parents=True, exist_ok=True)
-    
-    temp_files = []
+    # Scratch directory for this download (removed in one pass on cleanup)
+    scratch_dir = tempfile.TemporaryDirectory(prefix="tiktok_", dir=settings.DOWNLOADS_DIR)
+    temp_dir = Path(scratch_dir.name)
     
     try:
-        # 1. Download video
+        # 1. Download video (into the scratch dir, so cleanup is a single rmtree)
         logger.info("Step 1/5: Downloading video...")
-        result = await download_service.download_video(url)
-        video_path = Path(result["file_path"])
+        result = await get_download_service().download_video(url, output_dir=temp_dir)
+        video_path = result["file_path"]
         video_info = result["video_info"]
-        temp_files.append(video_path)
         
         # 2. Extract metadata for AI
         logger.info("Step 2/5: Extracting metadata...")
-        metadata = download_service.get_metadata(video_info)
+        metadata = get_download_service().get_metadata(video_info)
         
         # 3. Generate 15 comments with AI
         logger.info("Step 3/5: Generating AI comments...")
         comments_txt_path = temp_dir / "comentarios.txt"
-        comments, txt_path = await ai_comments_service.generate_comments(
+        comments, txt_path = await get_ai_comments_service().generate_comments(
             video_title=metadata['title'],
             video_description=metadata['description'],
             hashtags=metadata['hashtags'],
             num_comments=15,
             output_file=comments_txt_path
         )
-        temp_files.append(Path(txt_path))
         
         # 4. Parse comments and generate 15 Instagram images
         logger.info("Step 4/5: Generating Instagram images...")
-        parsed_comments = text_parser_service.parse_comments_file(txt_path)
+        # Parse at most 15 comments (the parser stops early)
+        parsed_comments = get_text_parser_service().parse_comments_file(txt_path, max_count=15)
         
         if not parsed_comments:
             logger.warning("No comments parsed, using generated comments directly")
             parsed_comments = comments
         
-        # Ensure we have exactly 15 comments
-        parsed_comments = parsed_comments[:15]
-        
-        # Generate images
+        # Generate images (CPU-bound rendering, kept off the event loop)
         images_dir = temp_dir / "images"
-        image_paths = image_generator_service.generate_images_from_comments(
+        image_paths = await asyncio.to_thread(
+            get_image_generator_service().generate_images_from_comments,
             parsed_comments,
             images_dir
         )
-        temp_files.extend(image_paths)
         
-        # 5. Create ZIP package
-        logger.info("Step 5/5: Creating ZIP package...")
-        zip_filename = f"tiktok_{download_id}.zip"
-        zip_path = temp_dir / zip_filename
+        # 5. Stream ZIP package straight to the client (no intermediate file)
+        logger.info("Step 5/5: Streaming ZIP package...")
+        zip_filename = f"{temp_dir.name}.zip"
         
-        final_zip = zip_service.create_package(
+        zip_stream = get_zip_service().iter_package(
             video_path=video_path,
-            comments_txt_path=Path(txt_path),
-            image_paths=image_paths,
-            output_path=zip_path
+            comments_txt_path=txt_path,
+            image_paths=image_paths
         )
         
-        logger.info(f"ZIP package created successfully: {zip_filename}")
-        
-        # Return ZIP file
         def cleanup_after_send():
-            """Cleanup files after sending"""
+            """Cleanup files after sending (everything lives in the scratch dir)"""
             try:
-                # Clean up all temp files
-                for file in temp_files:
-                    if file.exists():
-                        file.unlink()
-                # Clean up ZIP
-                if final_zip.exists():
-                    final_zip.unlink()
-                # Clean up directories
-                if images_dir.exists():
-                    import shutil
-                    shutil.rmtree(images_dir, ignore_errors=True)
-                if temp_dir.exists():
-                    import shutil
-                    shutil.rmtree(temp_dir, ignore_errors=True)
+                scratch_dir.cleanup()
                 logger.info("Cleaned up temporary files")
             except Exception as e:
-                logger.error(f"Error during cleanup: {str(e)}")
+                logger.error("Error during cleanup: %s", e)
         
-        return FileResponse(
-            path=str(final_zip),
+        return StreamingResponse(
+            zip_stream,
             media_type="application/zip",
-            filename=zip_filename,
-            background=cleanup_after_send
+            headers={"Content-Disposition": f'attachment; filename="{zip_filename}"'},
+            background=BackgroundTask(cleanup_after_send)
         )
         
     except ValueError as e:
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
         # Cleanup on error
-        zip_service.cleanup_temp_files(temp_files)
+        scratch_dir.cleanup()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     except FileNotFoundError as e:
-        logger.error(f"File not found: {str(e)}")
+        logger.error("File not found: %s", e)
         # Cleanup on error
-        zip_service.cleanup_temp_files(temp_files)
+        scratch_dir.cleanup()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Video is unavailable or private"
         )
     except Exception as e:
-        logger.error(f"Download failed: {str(e)}", exc_info=True)
+        logger.error("Download failed: %s", e, exc_info=True)
         # Cleanup on error
-        zip_service.cleanup_temp_files(temp_files)
+        scratch_dir.cleanup()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process video: {str(e)}"
@@ -240,27 +278,24 @@ async def edit_video_endpoint(
     - educational: Explanatory text, strategic pauses
     - minimal: No effects, basic cuts only
     """
-    logger.info(f"Edit video requested: URL={url}, style={style}")
+    logger.info("Edit video requested: URL=%s, style=%s", url, style)
     
-    download_id = str(uuid.uuid4())
-    temp_dir = Path(settings.DOWNLOADS_DIR) / download_id
-    temp_dir.mkdir(parents=True, exist_ok=True)
     temp_files = []
     
     try:
         # 1. Download video
         logger.info("Downloading video...")
-        result = await download_service.download_video(url)
-        video_path = Path(result["file_path"])
+        result = await get_download_service().download_video(url)
+        video_path = result["file_path"]
         video_info = result["video_info"]
         temp_files.append(video_path)
         
         # 2. Extract metadata
-        metadata = download_service.get_metadata(video_info)
+        metadata = get_download_service().get_metadata(video_info)
         
         # 3. Generate AI comments for subtitles
         logger.info("Generating AI comments...")
-        comments, _ = await ai_comments_service.generate_comments(
+        comments, _ = await get_ai_comments_service().generate_comments(
             video_title=metadata['title'],
             video_description=metadata['description'],
             hashtags=metadata['hashtags'],
@@ -270,8 +305,7 @@ async def edit_video_endpoint(
         
         # 4. Edit video
         logger.info("Editing video...")
-        capcut_service = CapCutAutomationService()
-        edited_result = await capcut_service.edit_video(
+        edited_result = await get_capcut_service().edit_video(
             video_path=video_path,
             comments=comments,
             metadata=metadata,
@@ -280,18 +314,29 @@ async def edit_video_endpoint(
             target_duration=target_duration
         )
         
-        logger.info(f"Video edited successfully: {edited_result.video_path}")
+        logger.info("Video edited successfully: %s", edited_result.video_path)
         return edited_result
         
     except Exception as e:
-        logger.error(f"Edit video failed: {str(e)}", exc_info=True)
-        zip_service.cleanup_temp_files(temp_files)
+        logger.error("Edit video failed: %s", e, exc_info=True)
+        get_zip_service().cleanup_temp_files(temp_files)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to edit video: {str(e)}"
         )
 
 
+# LRU cache of /analyze-video results, keyed by canonical URL
+ANALYSIS_CACHE_SIZE = 256
+_analysis_cache: "OrderedDict[str, AnalysisResult]" = OrderedDict()
+
+
+def _analysis_cache_key(url: str) -> str:
+    """Canonical cache key for a video URL (tracking query/fragment dropped)"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), "", ""))
+
+
 @app.post(
     "/analyze-video",
     responses={
@@ -303,6 +348,7 @@ async def edit_video_endpoint(
 @limiter.limit(settings.RATE_LIMIT)
 async def analyze_video_endpoint(
     request: Request,
+    response: Response,
     url: str,
     api_key: str = Depends(verify_api_key),
 ):
@@ -314,29 +360,47 @@ async def analyze_video_endpoint(
     - Optimal cut points
     
     Useful for understanding video structure before editing.
+    Results are cached per URL (videos are immutable), and an ETag is
+    returned so clients can revalidate with If-None-Match.
     """
-    logger.info(f"Analyze video requested: URL={url}")
+    logger.info("Analyze video requested: URL=%s", url)
+    
+    cache_key = _analysis_cache_key(url)
+    etag = f'"{hashlib.sha1(cache_key.encode()).hexdigest()}"'
+    
+    cached = _analysis_cache.get(cache_key)
+    if cached is not None:
+        _analysis_cache.move_to_end(cache_key)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        logger.info("Analysis cache hit for URL=%s", url)
+        response.headers["ETag"] = etag
+        return cached
     
     temp_files = []
     
     try:
         # Download video
-        result = await download_service.download_video(url)
-        video_path = Path(result["file_path"])
+        result = await get_download_service().download_video(url)
+        video_path = result["file_path"]
         temp_files.append(video_path)
         
         # Analyze
-        analyzer = VideoAnalyzerService()
-        analysis = await analyzer.analyze_video(video_path)
+        analysis = await get_video_analyzer().analyze_video(video_path)
         
         # Cleanup
-        zip_service.cleanup_temp_files(temp_files)
+        get_zip_service().cleanup_temp_files(temp_files)
+        
+        _analysis_cache[cache_key] = analysis
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
         
+        response.headers["ETag"] = etag
         return analysis
         
     except Exception as e:
-        logger.error(f"Analyze video failed: {str(e)}", exc_info=True)
-        zip_service.cleanup_temp_files(temp_files)
+        logger.error("Analyze video failed: %s", e, exc_info=True)
+        get_zip_service().cleanup_temp_files(temp_files)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to analyze video: {str(e)}"
@@ -368,35 +432,53 @@ async def create_compilation_endpoint(
     - Unified theme
     - Maximum duration control
     """
-    logger.info(f"Compilation requested: {len(compilation_request.video_paths)} videos")
+    logger.info("Compilation requested: %s videos", len(compilation_request.video_paths))
     
     temp_files = []
     downloaded_paths = []
     
     try:
-        # Download all videos
-        for i, url in enumerate(compilation_request.video_paths):
-            logger.info(f"Downloading video {i+1}/{len(compilation_request.video_paths)}...")
-            result = await download_service.download_video(url)
-            video_path = Path(result["file_path"])
+        # Download all videos concurrently (bounded to avoid TikTok rate limits)
+        download_service = get_download_service()
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        
+        async def download_one(i: int, url: str) -> dict:
+            async with semaphore:
+                logger.info("Downloading video %s/%s...", i + 1, len(compilation_request.video_paths))
+                return await download_service.download_video(url)
+        
+        results = await asyncio.gather(
+            *(download_one(i, url) for i, url in enumerate(compilation_request.video_paths)),
+            return_exceptions=True
+        )
+        
+        # Track every successful download first so failures still clean up
+        errors = []
+        for result in results:
+            if isinstance(result, BaseException):
+                errors.append(result)
+                continue
+            video_path = result["file_path"]
             temp_files.append(video_path)
             downloaded_paths.append(video_path)
         
+        if errors:
+            raise errors[0]
+        
         # Create compilation
         logger.info("Creating compilation...")
-        capcut_service = CapCutAutomationService()
-        compilation_result = await capcut_service.create_compilation(
+        compilation_result = await get_capcut_service().create_compilation(
             video_paths=downloaded_paths,
             theme=compilation_request.theme,
             max_duration=compilation_request.max_duration
         )
         
-        logger.info(f"Compilation created: {compilation_result.video_path}")
+        logger.info("Compilation created: %s", compilation_result.video_path)
         return compilation_result
         
     except Exception as e:
-        logger.error(f"Create compilation failed: {str(e)}", exc_info=True)
-        zip_service.cleanup_temp_files(temp_files)
+        logger.error("Create compilation failed: %s", e, exc_info=True)
+        get_zip_service().cleanup_temp_files(temp_files)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create compilation: {str(e)}"
@@ -445,7 +527,7 @@ async def create_story_video_endpoint(
     O sistema usa IA (Ollama) para fazer matching semântico entre o que é falado
     e os nomes das imagens, criando um vídeo sincronizado automaticamente.
     """
-    logger.info(f"Story video request: {story_request.images_dir}, audio: {story_request.audio_file}")
+    logger.info("Story video request: %s, audio: %s", story_request.images_dir, story_request.audio_file)
     
     try:
         images_dir = Path(story_request.images_dir)
@@ -465,35 +547,38 @@ async def create_story_video_endpoint(
             )
         
         # Criar vídeo
-        story_service = StoryVideoService()
-        result = await story_service.create_story_video(
+        result = await get_story_video_service().create_story_video(
             images_dir=images_dir,
             audio_file=audio_file,
             style=story_request.style,
             resolution=story_request.resolution
         )
         
-        logger.info(f"Story video created: {result.video_path}")
+        logger.info("Story video created: %s", result.video_path)
         return result
         
     except ValueError as e:
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     except Exception as e:
-        logger.error(f"Story video creation failed: {str(e)}", exc_info=True)
+        logger.error("Story video creation failed: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create story video: {str(e)}"
         )
 
 
+# Health payload is static: serialize it once instead of on every probe
+_HEALTH_BODY = json.dumps({"status": "healthy", "version": app.version}).encode()
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "version": "2.0.0"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 # Mount static files at root (must be after all API routes)
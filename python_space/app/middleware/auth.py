@@ -1,7 +1,20 @@
+import hmac
+import logging
+
 from fastapi import Header, HTTPException, status
 from typing import Annotated
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+# With a single configured key, compare in constant time instead of hashing
+_SINGLE_API_KEY = (
+    next(iter(settings.api_keys_set)).encode() if len(settings.api_keys_set) == 1 else None
+)
+
+if _SINGLE_API_KEY is not None:
+    logger.warning("Only one API key configured in API_KEYS; consider issuing one key per client")
+
 
 async def verify_api_key(x_api_key: Annotated[str | None, Header()] = None):
     """
@@ -13,13 +26,15 @@ async def verify_api_key(x_api_key: Annotated[str | None, Header()] = None):
             detail="API key is missing"
         )
     
-    if x_api_key not in settings.api_keys_list:
+    if _SINGLE_API_KEY is not None:
+        is_valid = hmac.compare_digest(x_api_key.encode(), _SINGLE_API_KEY)
+    else:
+        is_valid = x_api_key in settings.api_keys_set
+    
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
         )
     
     return x_api_key
-
-
-
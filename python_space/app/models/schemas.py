@@ -7,8 +7,8 @@ class DownloadRequest(BaseModel):
     @field_validator('url')
     @classmethod
     def validate_tiktok_url(cls, v: HttpUrl) -> HttpUrl:
-        url_str = str(v)
-        if 'tiktok.com' not in url_str:
+        host = (v.host or '').lower()
+        if host != 'tiktok.com' and not host.endswith('.tiktok.com'):
             raise ValueError('URL must be from tiktok.com domain')
         return v
 
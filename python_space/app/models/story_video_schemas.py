@@ -1,6 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Tuple, Optional
-from pathlib import Path
+from typing import List, Tuple
 
 
 class TranscriptionSegment(BaseModel):
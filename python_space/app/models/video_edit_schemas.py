@@ -1,7 +1,7 @@
 """
 Schemas for video editing functionality
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Literal
 from enum import Enum
 
@@ -24,8 +24,9 @@ class VideoEditRequest(BaseModel):
     add_effects: bool = Field(default=True, description="Adicionar efeitos visuais")
     target_duration: Optional[int] = Field(None, description="Duração alvo em segundos")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "video_path": "/path/to/video.mp4",
                 "style": "viral",
@@ -35,6 +36,7 @@ class VideoEditRequest(BaseModel):
                 "target_duration": 60
             }
         }
+    )
 
 
 class SubtitleConfig(BaseModel):
@@ -80,8 +82,9 @@ class EditedVideoResult(BaseModel):
     subtitles_count: int = Field(default=0, description="Número de legendas adicionadas")
     file_size_mb: float = Field(..., description="Tamanho do arquivo em MB")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "video_path": "/downloads/edited_video.mp4",
                 "original_path": "/downloads/video.mp4",
@@ -93,6 +96,7 @@ class EditedVideoResult(BaseModel):
                 "file_size_mb": 15.2
             }
         }
+    )
 
 
 class CompilationRequest(BaseModel):
@@ -103,8 +107,9 @@ class CompilationRequest(BaseModel):
     add_intro: bool = Field(default=True, description="Adicionar intro")
     add_outro: bool = Field(default=True, description="Adicionar outro")
     
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        defer_build=True,
+        json_schema_extra={
             "example": {
                 "video_paths": ["/path/video1.mp4", "/path/video2.mp4"],
                 "theme": "trending",
@@ -113,6 +118,7 @@ class CompilationRequest(BaseModel):
                 "add_outro": True
             }
         }
+    )
 
 
 class AnalysisResult(BaseModel):
@@ -1,15 +1,157 @@
 import ollama
+import asyncio
+import hashlib
+import httpx
 import logging
 import json
 import random
 import re
+from functools import lru_cache
+from itertools import cycle, islice
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
+from pydantic import TypeAdapter, ValidationError
 from app.models.comment_schemas import GeneratedComment
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Comments requested per Ollama call; larger requests are sharded and run concurrently
+COMMENTS_PER_REQUEST = 5
+
+# Sampling temperature for comment generation (high = more creative, less repeatable)
+COMMENT_TEMPERATURE = 0.9
+
+# Maximum number of generated comment lists kept in memory
+RESPONSE_CACHE_SIZE = 512
+
+# Token budget per Ollama call: JSON envelope + up to ~40 words per comment
+NUM_PREDICT_BASE = 100
+NUM_PREDICT_PER_COMMENT = 120
+
+# Connection pool shared by all Ollama calls of the service
+OLLAMA_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+OLLAMA_TIMEOUT = httpx.Timeout(120.0)
+
+# Validator for a whole list of parsed comments, built once at import
+_COMMENT_LIST_ADAPTER = TypeAdapter(List[GeneratedComment])
+
+# Comments used when Ollama is unavailable, built once at import
+_FALLBACK_POOL: tuple[GeneratedComment, ...] = tuple(
+    GeneratedComment(author=author, username=username, text=text, likes=likes, timestamp=timestamp)
+    for author, username, text, likes, timestamp in (
+        ("João Silva", "joao_silva", "Muito bom! 👏", 120, "2h"),
+        ("Maria Santos", "maria_santos", "Amei ❤️", 350, "1h"),
+        ("Pedro Costa", "pedro_costa", "Que incrível! Como faz isso?", 89, "3h"),
+        ("Ana Lima", "ana_lima", "Salvei pra fazer depois 🔖", 45, "5 min"),
+        ("Carlos Mendes", "carlos_mendes", "Top demais! 🔥", 234, "1d"),
+        ("Juliana Alves", "juliana_alves", "Perfeito! Já fiz 3 vezes 😍", 567, "2d"),
+        ("Roberto Dias", "roberto_dias", "Adorei! Vou tentar", 23, "4h"),
+        ("Beatriz Rocha", "beatriz_rocha", "Ficou lindo! 💚", 178, "6h"),
+        ("Lucas Oliveira", "lucas_oliveira", "Parabéns pelo trabalho!", 92, "1d"),
+        ("Camila Fernandes", "camila_fernandes", "Maravilhoso ✨", 145, "3h"),
+        ("Gabriel Souza", "gabriel_souza", "Muito show! 👌", 67, "2h"),
+        ("Patricia Costa", "patricia_costa", "Isso sim é conteúdo de qualidade", 289, "5h"),
+        ("Rafael Martins", "rafael_martins", "Salvando pra assistir depois 📌", 34, "1h"),
+        ("Fernanda Lima", "fernanda_lima", "Sensacional! 🎉", 456, "3d"),
+        ("Thiago Pereira", "thiago_pereira", "Melhor vídeo que vi hoje!", 123, "4h"),
+    )
+)
+
+# Instruções fixas enviadas como mensagem de sistema: o prefixo se repete entre
+# vídeos e o servidor Ollama reaproveita o KV-cache dele; só o contexto muda
+_SYSTEM_PROMPT = """Você é um gerador de comentários realistas para vídeos do TikTok/Instagram.
+
+Gere EXATAMENTE {num_comments} comentários em português do Brasil para o vídeo descrito pelo usuário.
+
+REQUISITOS IMPORTANTES:
+1. Comentários VARIADOS: alguns curtos (5-10 palavras), outros longos (20-40 palavras)
+2. Misture: elogios entusiasmados, perguntas, críticas construtivas, piadas
+3. Use emojis NATURALMENTE (não exagere, 1-3 por comentário)
+4. Alguns comentários com erros de digitação sutis (ex: "vc" ao invés de "você")
+5. Nomes brasileiros DIVERSOS (homens, mulheres, diferentes regiões)
+6. Likes entre 0 e 5000 (maioria entre 10-500)
+7. Timestamps variados: "agora", "5 min", "2h", "1d", "3d", "1sem"
+
+FORMATO DE SAÍDA (JSON):
+{{
+  "comments": [
+    {{
+      "author": "Maria Silva",
+      "username": "maria_silva",
+      "text": "Que vídeo incrível! Amei demais ❤️",
+      "likes": 150,
+      "timestamp": "2h"
+    }},
+    ...
+  ]
+}}
+
+Gere APENAS o JSON válido, sem texto adicional antes ou depois."""
+
+
+@lru_cache(maxsize=None)
+def _system_prompt(num_comments: int) -> str:
+    """System prompt for a shard size; shards are at most COMMENTS_PER_REQUEST, so few variants exist"""
+    return _SYSTEM_PROMPT.format(num_comments=num_comments)
+
+
+class _JsonObjectScanner:
+    """Tracks brace depth of streamed text, ignoring braces inside JSON strings"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str) -> bool:
+        """Consume a chunk; returns True once the first top-level object is closed"""
+        for ch in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == '{':
+                self.depth += 1
+                self.started = True
+            elif ch == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+class _LFUCache:
+    """Small least-frequently-used cache (evicts the entry with fewest hits)"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = {}
+        self._hits = {}
+    
+    def get(self, key):
+        if key not in self._data:
+            return None
+        self._hits[key] += 1
+        return self._data[key]
+    
+    def set(self, key, value) -> None:
+        if key not in self._data and len(self._data) >= self.maxsize:
+            victim = min(self._hits, key=self._hits.get)
+            del self._data[victim]
+            del self._hits[victim]
+        self._data[key] = value
+        self._hits.setdefault(key, 0)
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
 
 class AICommentsService:
     """Service for generating realistic comments using Ollama (local LLM)"""
@@ -17,16 +159,29 @@ class AICommentsService:
     def __init__(self):
         self.model = settings.OLLAMA_MODEL
         self.base_url = settings.OLLAMA_BASE_URL
+        self.temperature = COMMENT_TEMPERATURE
+        self._client = ollama.AsyncClient(
+            host=self.base_url,
+            timeout=OLLAMA_TIMEOUT,
+            limits=OLLAMA_LIMITS
+        )
+        self._cache = _LFUCache(RESPONSE_CACHE_SIZE)
+        self._inflight: Dict[str, asyncio.Future] = {}
         logger.info(f"AICommentsService initialized with model: {self.model}")
     
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections to Ollama"""
+        await self._client.close()
+    
     async def generate_comments(
         self,
         video_title: str,
         video_description: str = "",
         hashtags: List[str] = None,
         num_comments: int = 15,
-        output_file: Optional[Path] = None
-    ) -> tuple[List[GeneratedComment], str]:
+        output_file: Optional[Path] = None,
+        cacheable: Optional[bool] = None
+    ) -> tuple[List[GeneratedComment], Path]:
         """
         Generate realistic comments using Ollama and save to TXT file
         
@@ -36,6 +191,8 @@ class AICommentsService:
             hashtags: List of hashtags
             num_comments: Number of comments to generate (default 15)
             output_file: Path to save comments.txt
+            cacheable: Reuse comments for an identical context. Defaults to
+                True only when generation is deterministic (temperature 0)
             
         Returns:
             Tuple of (list of GeneratedComment objects, path to txt file)
@@ -43,13 +200,15 @@ class AICommentsService:
         logger.info(f"Generating {num_comments} comments for video: {video_title[:50]}...")
         
         hashtags = hashtags or []
+        if cacheable is None:
+            cacheable = self.temperature == 0
         
         try:
             # Build context for AI
             context = self._build_context(video_title, video_description, hashtags)
             
             # Generate comments with Ollama
-            comments = await self._generate_with_ollama(context, num_comments)
+            comments = await self._generate_with_ollama(context, num_comments, cacheable)
             
             # If Ollama fails, use fallback
             if not comments:
@@ -60,14 +219,14 @@ class AICommentsService:
             txt_path = self._save_to_txt(comments, output_file)
             
             logger.info(f"Successfully generated {len(comments)} comments and saved to {txt_path}")
-            return comments, str(txt_path)
+            return comments, txt_path
             
         except Exception as e:
             logger.error(f"Error generating comments: {str(e)}")
             # Use fallback on any error
             comments = self._fallback_comments(num_comments)
             txt_path = self._save_to_txt(comments, output_file)
-            return comments, str(txt_path)
+            return comments, txt_path
     
     def _build_context(self, title: str, description: str, hashtags: List[str]) -> str:
         """Build context string for AI prompt"""
@@ -81,97 +240,160 @@ class AICommentsService:
         
         return "\n".join(context_parts)
     
-    async def _generate_with_ollama(self, context: str, num_comments: int) -> List[GeneratedComment]:
-        """Generate comments using Ollama"""
-        prompt = f"""Você é um gerador de comentários realistas para vídeos do TikTok/Instagram.
-
-Gere EXATAMENTE {num_comments} comentários em português do Brasil para este vídeo:
-
-{context}
-
-REQUISITOS IMPORTANTES:
-1. Comentários VARIADOS: alguns curtos (5-10 palavras), outros longos (20-40 palavras)
-2. Misture: elogios entusiasmados, perguntas, críticas construtivas, piadas
-3. Use emojis NATURALMENTE (não exagere, 1-3 por comentário)
-4. Alguns comentários com erros de digitação sutis (ex: "vc" ao invés de "você")
-5. Nomes brasileiros DIVERSOS (homens, mulheres, diferentes regiões)
-6. Likes entre 0 e 5000 (maioria entre 10-500)
-7. Timestamps variados: "agora", "5 min", "2h", "1d", "3d", "1sem"
-
-FORMATO DE SAÍDA (JSON):
-{{
-  "comments": [
-    {{
-      "author": "Maria Silva",
-      "username": "maria_silva",
-      "text": "Que vídeo incrível! Amei demais ❤️",
-      "likes": 150,
-      "timestamp": "2h"
-    }},
-    ...
-  ]
-}}
-
-Gere APENAS o JSON válido, sem texto adicional antes ou depois."""
-
-        try:
-            # Call Ollama API
-            response = ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                options={
-                    "temperature": 0.9,  # High creativity
-                    "top_p": 0.95,
-                    "num_predict": 2000,  # Max tokens
-                }
-            )
-            
-            response_text = response.get('response', '')
-            
-            # Extract JSON from response
-            comments = self._parse_ollama_response(response_text, num_comments)
-            
-            if len(comments) < num_comments:
-                logger.warning(f"Only generated {len(comments)}/{num_comments} comments, filling with fallback")
-                # Fill remaining with fallback
-                remaining = num_comments - len(comments)
-                comments.extend(self._fallback_comments(remaining))
-            
-            return comments[:num_comments]  # Ensure exact count
-            
-        except Exception as e:
-            logger.error(f"Ollama generation error: {str(e)}")
+    async def _generate_with_ollama(
+        self,
+        context: str,
+        num_comments: int,
+        cacheable: bool = False
+    ) -> List[GeneratedComment]:
+        """
+        Generate comments using Ollama
+        
+        The request is split into shards of COMMENTS_PER_REQUEST comments that
+        run concurrently (set OLLAMA_NUM_PARALLEL on the server to benefit).
+        When cacheable, results are memoized per (context, num_comments) and
+        concurrent calls for the same context are coalesced into one generation.
+        """
+        if not cacheable:
+            return await self._generate_shards(context, num_comments)
+        
+        key = f"{hashlib.blake2b(context.encode()).hexdigest()}:{num_comments}"
+        cached = self._cache.get(key)
+        if cached is not None:
+            logger.info("Using cached comments for this video context")
+            return list(cached)
+        
+        # Identical requests already in flight share one generation
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._generate_shards(context, num_comments))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info("Joining in-flight comment generation for this video context")
+        
+        comments = list(await asyncio.shield(pending))
+        if comments:
+            self._cache.set(key, tuple(comments))
+        return comments
+    
+    async def _generate_shards(self, context: str, num_comments: int) -> List[GeneratedComment]:
+        """Run the concurrent Ollama shards and merge them into num_comments comments"""
+        shard_sizes = [COMMENTS_PER_REQUEST] * (num_comments // COMMENTS_PER_REQUEST)
+        if num_comments % COMMENTS_PER_REQUEST:
+            shard_sizes.append(num_comments % COMMENTS_PER_REQUEST)
+        
+        results = await asyncio.gather(
+            *(self._request_comments(context, size) for size in shard_sizes),
+            return_exceptions=True
+        )
+        
+        comments = []
+        seen = set()
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Ollama generation error: {str(result)}")
+                continue
+            for comment in result:
+                comment_key = (comment.username, comment.text)
+                if comment_key not in seen:
+                    seen.add(comment_key)
+                    comments.append(comment)
+        
+        if not comments:
             return []
+        
+        if len(comments) < num_comments:
+            logger.warning(f"Only generated {len(comments)}/{num_comments} comments, filling with fallback")
+            # Fill remaining with fallback
+            remaining = num_comments - len(comments)
+            comments.extend(self._fallback_comments(remaining))
+        
+        return comments[:num_comments]  # Ensure exact count
+    
+    async def _request_comments(self, context: str, num_comments: int) -> List[GeneratedComment]:
+        """Run a single Ollama generation for num_comments comments"""
+        # Call Ollama API (non-blocking), streaming so we can stop at the end of the JSON
+        stream = await self._client.chat(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": _system_prompt(num_comments)},
+                {"role": "user", "content": context},
+            ],
+            stream=True,
+            options={
+                "temperature": self.temperature,
+                "top_p": 0.95,
+                "num_predict": NUM_PREDICT_BASE + num_comments * NUM_PREDICT_PER_COMMENT,
+            }
+        )
+        
+        parts = []
+        scanner = _JsonObjectScanner()
+        try:
+            async for chunk in stream:
+                piece = chunk['message']['content']
+                parts.append(piece)
+                if scanner.feed(piece):
+                    # JSON object complete: skip whatever the model would append
+                    break
+        finally:
+            await stream.aclose()
+        
+        response_text = "".join(parts)
+        
+        # Extract JSON from response
+        return self._parse_ollama_response(response_text, num_comments)[:num_comments]
     
     def _parse_ollama_response(self, response_text: str, expected_count: int) -> List[GeneratedComment]:
         """Parse Ollama response and extract comments"""
         try:
-            # Try to find JSON in response
-            json_match = re.search(r'\{[\s\S]*"comments"[\s\S]*\}', response_text)
-            
-            if json_match:
-                json_str = json_match.group(0)
-                data = json.loads(json_str)
-                
-                comments = []
-                for item in data.get('comments', []):
-                    try:
-                        comment = GeneratedComment(
-                            author=item.get('author', 'Usuário Anônimo'),
-                            username=item.get('username', 'usuario'),
-                            text=item.get('text', ''),
-                            likes=item.get('likes', random.randint(0, 500)),
-                            timestamp=item.get('timestamp', '2h')
-                        )
-                        comments.append(comment)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse comment item: {e}")
-                        continue
-                
-                return comments
-            else:
+            # The JSON object spans from the first '{' to the last '}'
+            start = response_text.find('{')
+            end = response_text.rfind('}')
+            if start == -1 or end < start:
                 logger.warning("No JSON found in Ollama response")
                 return []
+            
+            try:
+                data = json.loads(response_text[start:end + 1])
+            except json.JSONDecodeError:
+                # Fall back to the stricter search when there is trailing noise
+                json_match = re.search(r'\{[\s\S]*"comments"[\s\S]*\}', response_text)
+                if not json_match:
+                    logger.warning("No JSON found in Ollama response")
+                    return []
+                data = json.loads(json_match.group(0))
+            
+            items = [
+                {
+                    'author': 'Usuário Anônimo',
+                    'username': 'usuario',
+                    'text': '',
+                    'likes': random.randint(0, 500),
+                    'timestamp': '2h',
+                    **item
+                }
+                for item in data.get('comments', [])
+                if isinstance(item, dict)
+            ]
+            
+            try:
+                # One validator call for the whole list (the common case)
+                return _COMMENT_LIST_ADAPTER.validate_python(items)
+            except ValidationError:
+                pass
+            
+            # Some items are malformed: validate one by one and skip the bad ones
+            comments = []
+            for item in items:
+                try:
+                    comments.append(GeneratedComment.model_validate(item))
+                except ValidationError as e:
+                    logger.warning(f"Failed to parse comment item: {e}")
+                    continue
+            
+            return comments
                 
         except Exception as e:
             logger.error(f"Error parsing Ollama response: {str(e)}")
@@ -181,43 +403,13 @@ Gere APENAS o JSON válido, sem texto adicional antes ou depois."""
         """Generate fallback comments when AI fails"""
         logger.info(f"Using fallback comment generation for {num_comments} comments")
         
-        templates = [
-            ("João Silva", "joao_silva", "Muito bom! 👏", 120, "2h"),
-            ("Maria Santos", "maria_santos", "Amei ❤️", 350, "1h"),
-            ("Pedro Costa", "pedro_costa", "Que incrível! Como faz isso?", 89, "3h"),
-            ("Ana Lima", "ana_lima", "Salvei pra fazer depois 🔖", 45, "5 min"),
-            ("Carlos Mendes", "carlos_mendes", "Top demais! 🔥", 234, "1d"),
-            ("Juliana Alves", "juliana_alves", "Perfeito! Já fiz 3 vezes 😍", 567, "2d"),
-            ("Roberto Dias", "roberto_dias", "Adorei! Vou tentar", 23, "4h"),
-            ("Beatriz Rocha", "beatriz_rocha", "Ficou lindo! 💚", 178, "6h"),
-            ("Lucas Oliveira", "lucas_oliveira", "Parabéns pelo trabalho!", 92, "1d"),
-            ("Camila Fernandes", "camila_fernandes", "Maravilhoso ✨", 145, "3h"),
-            ("Gabriel Souza", "gabriel_souza", "Muito show! 👌", 67, "2h"),
-            ("Patricia Costa", "patricia_costa", "Isso sim é conteúdo de qualidade", 289, "5h"),
-            ("Rafael Martins", "rafael_martins", "Salvando pra assistir depois 📌", 34, "1h"),
-            ("Fernanda Lima", "fernanda_lima", "Sensacional! 🎉", 456, "3d"),
-            ("Thiago Pereira", "thiago_pereira", "Melhor vídeo que vi hoje!", 123, "4h"),
-        ]
+        picks = islice(cycle(_FALLBACK_POOL), num_comments)
         
-        comments = []
-        for i in range(num_comments):
-            template = templates[i % len(templates)]
-            author, username, text, likes, timestamp = template
-            
-            # Add variation
-            likes = likes + random.randint(-50, 50)
-            likes = max(0, likes)
-            
-            comment = GeneratedComment(
-                author=author,
-                username=username,
-                text=text,
-                likes=likes,
-                timestamp=timestamp
-            )
-            comments.append(comment)
-        
-        return comments
+        # Add variation
+        return [
+            template.model_copy(update={"likes": max(0, template.likes + random.randint(-50, 50))})
+            for template in picks
+        ]
     
     def _save_to_txt(self, comments: List[GeneratedComment], output_file: Optional[Path] = None) -> Path:
         """Save comments to TXT file in the specified format"""
@@ -227,14 +419,13 @@ Gere APENAS o JSON válido, sem texto adicional antes ou depois."""
         output_file = Path(output_file)
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        lines = []
-        for i, comment in enumerate(comments, 1):
-            line = f"{i}. @{comment.username} ({comment.likes} likes, {comment.timestamp}): {comment.text}"
-            lines.append(line)
-        
-        content = "\n".join(lines)
+        content = "\n".join(
+            f"{i}. @{comment.username} ({comment.likes} likes, {comment.timestamp}): {comment.text}"
+            for i, comment in enumerate(comments, 1)
+        )
         
-        output_file.write_text(content, encoding='utf-8')
+        # Single bulk write, skipping the text layer
+        output_file.write_bytes(content.encode('utf-8'))
         logger.info(f"Saved {len(comments)} comments to {output_file}")
         
         return output_file
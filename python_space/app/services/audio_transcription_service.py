@@ -1,13 +1,123 @@
+import atexit
 import logging
+import os
+import re
+import subprocess
+import threading
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, AsyncIterator, List, Optional, Tuple
 import asyncio
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from app.models.story_video_schemas import TranscriptionSegment
 
 logger = logging.getLogger(__name__)
 
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+# Palavras sem pontuação nas bordas; hífen/apóstrofo internos são mantidos
+# ("guarda-chuva", "d'água"), como no split() + strip() original
+_KEYWORD_RE = re.compile(r"[^\W_](?:[\w'-]*[^\W_])?")
+
+# Segmentos decodificados por lote no BatchedInferencePipeline
+WHISPER_BATCH_SIZE = 16
+
+
+def _extract_keywords(text: str) -> List[str]:
+    """
+    Extrai keywords básicas de um segmento: palavras com 4+ caracteres, sem
+    pontuação nas bordas (hífen/apóstrofo internos mantidos)
+    """
+    return [word for word in _KEYWORD_RE.findall(text.lower()) if len(word) > 3]
+
+
+def _cuda_available() -> bool:
+    """Verifica se há GPU CUDA disponível para o CTranslate2 (backend do faster-whisper)"""
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count() > 0
+    except Exception:
+        return False
+
+
+_model_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _build_whisper_model(model_size: str, device: str, compute_type: str) -> Tuple[Any, Optional[int]]:
+    """Constrói o modelo Whisper; retorna (modelo, batch_size ou None)"""
+    from faster_whisper import WhisperModel
+    logger.info(f"Loading Whisper model: {model_size} ({device}, {compute_type})")
+    
+    model_kwargs = {}
+    if device == "cpu":
+        # Usa todos os núcleos e sobrepõe decodificação de áudio com inferência
+        model_kwargs = {"cpu_threads": os.cpu_count() or 0, "num_workers": 2}
+    
+    model = WhisperModel(
+        model_size,
+        device=device,
+        compute_type=compute_type,
+        **model_kwargs
+    )
+    logger.info("Whisper model loaded successfully")
+    
+    try:
+        # faster-whisper >= 1.1: decodifica vários trechos de uma vez
+        from faster_whisper import BatchedInferencePipeline
+        return BatchedInferencePipeline(model=model), WHISPER_BATCH_SIZE
+    except ImportError:
+        return model, None
+
+
+def _get_whisper_model(model_size: str, device: str, compute_type: str) -> Tuple[Any, Optional[int]]:
+    """
+    Retorna o modelo Whisper compartilhado para a configuração
+    
+    O lock evita que duas threads carreguem os mesmos pesos ao mesmo tempo.
+    """
+    with _model_lock:
+        return _build_whisper_model(model_size, device, compute_type)
+
+
+# Pool dedicado: transcrições longas não ocupam o executor padrão do event loop
+_WHISPER_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whisper")
+
+# Libera os modelos (e a VRAM) ao encerrar o processo
+atexit.register(_build_whisper_model.cache_clear)
+
+
+@lru_cache(maxsize=256)
+def _read_audio_duration(path: str, mtime_ns: int, size: int) -> float:
+    """
+    Lê a duração só a partir do cabeçalho do arquivo (sem decodificar o áudio)
+    
+    mtime_ns e size entram na chave do cache para invalidá-lo se o arquivo mudar.
+    """
+    if sf is not None:
+        try:
+            return sf.info(path).duration
+        except Exception as e:
+            logger.debug(f"soundfile could not read {path} ({e}), falling back to ffprobe")
+    else:
+        logger.warning("soundfile not installed, falling back to ffprobe")
+    
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return float(result.stdout.strip())
+    except Exception as e:
+        logger.error(f"Failed to get audio duration: {e}")
+        raise
+
 
 class AudioTranscriptionService:
     """Serviço para transcrição de áudio usando Whisper"""
@@ -15,34 +125,36 @@ class AudioTranscriptionService:
     def __init__(
         self,
         model_size: str = "base",
-        device: str = "cpu",
-        compute_type: str = "int8"
+        device: str = "auto",
+        compute_type: str = "auto"
     ):
         """
         Inicializa o serviço de transcrição
         
         Args:
             model_size: Tamanho do modelo (tiny, base, small, medium, large)
-            device: Dispositivo (cpu, cuda)
-            compute_type: Tipo de computação (int8, float16, float32)
+            device: Dispositivo (auto, cpu, cuda). "auto" usa CUDA se houver GPU
+            compute_type: Tipo de computação (auto, int8, float16, float32).
+                "auto" usa float16 na GPU e int8 na CPU
         """
+        if device == "auto":
+            device = "cuda" if _cuda_available() else "cpu"
+        if compute_type == "auto":
+            compute_type = "float16" if device == "cuda" else "int8"
+        
         self.model_size = model_size
         self.device = device
         self.compute_type = compute_type
         self._model = None
+        self._batch_size = None
     
     def _load_model(self):
-        """Carrega o modelo Whisper (lazy loading)"""
+        """Carrega o modelo Whisper (lazy loading, compartilhado entre instâncias)"""
         if self._model is None:
             try:
-                from faster_whisper import WhisperModel
-                logger.info(f"Loading Whisper model: {self.model_size}")
-                self._model = WhisperModel(
-                    self.model_size,
-                    device=self.device,
-                    compute_type=self.compute_type
+                self._model, self._batch_size = _get_whisper_model(
+                    self.model_size, self.device, self.compute_type
                 )
-                logger.info("Whisper model loaded successfully")
             except ImportError:
                 logger.error("faster-whisper not installed. Install with: pip install faster-whisper")
                 raise
@@ -66,61 +178,97 @@ class AudioTranscriptionService:
         Returns:
             Lista de TranscriptionSegment com texto e timestamps
         """
+        segments = [segment async for segment in self.stream_segments(audio_path, language)]
+        
+        logger.info(f"Transcription complete: {len(segments)} segments")
+        return segments
+    
+    async def stream_segments(
+        self,
+        audio_path: Path,
+        language: Optional[str] = None
+    ) -> AsyncIterator[TranscriptionSegment]:
+        """
+        Transcreve áudio emitindo cada segmento assim que o Whisper o produz
+        
+        Permite que o consumidor comece a processar os primeiros segmentos
+        enquanto o restante do áudio ainda está sendo decodificado.
+        
+        Args:
+            audio_path: Caminho para o arquivo de áudio
+            language: Idioma (pt, en, es, etc). None para detecção automática
+        
+        Yields:
+            TranscriptionSegment na ordem do áudio
+        """
         if not audio_path.exists():
             raise FileNotFoundError(f"Audio file not found: {audio_path}")
         
         logger.info(f"Transcribing audio: {audio_path}")
         
         # Executar transcrição em thread separada (blocking I/O)
-        loop = asyncio.get_event_loop()
-        transcribe_func = partial(self._transcribe_sync, audio_path, language)
-        segments = await loop.run_in_executor(None, transcribe_func)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        worker = loop.run_in_executor(
+            _WHISPER_POOL, self._drain_into, audio_path, language, queue, loop
+        )
         
-        logger.info(f"Transcription complete: {len(segments)} segments")
-        return segments
+        while True:
+            segment = await queue.get()
+            if segment is None:
+                break
+            yield segment
+        
+        # Propaga erros da thread de transcrição
+        await worker
     
-    def _transcribe_sync(
+    def _drain_into(
         self,
         audio_path: Path,
-        language: Optional[str]
-    ) -> List[TranscriptionSegment]:
-        """Transcrição síncrona (blocking)"""
-        model = self._load_model()
-        
-        # Parâmetros de transcrição
-        transcribe_params = {
-            "audio": str(audio_path),
-            "language": language,
-            "word_timestamps": False,  # Timestamps por segmento (mais rápido)
-            "vad_filter": True,  # Voice Activity Detection
-            "vad_parameters": {
-                "threshold": 0.5,
-                "min_speech_duration_ms": 250,
+        language: Optional[str],
+        queue: asyncio.Queue,
+        loop: asyncio.AbstractEventLoop
+    ) -> None:
+        """Transcrição síncrona (blocking), enviando segmentos para a fila do event loop"""
+        try:
+            model = self._load_model()
+            
+            # Parâmetros de transcrição
+            transcribe_params = {
+                "audio": str(audio_path),
+                "language": language,
+                "word_timestamps": False,  # Timestamps por segmento (mais rápido)
+                "vad_filter": True,  # Voice Activity Detection
+                "vad_parameters": {
+                    "threshold": 0.5,
+                    "min_speech_duration_ms": 250,
+                }
             }
-        }
-        
-        segments_result, info = model.transcribe(**transcribe_params)
-        
-        logger.info(f"Detected language: {info.language} (probability: {info.language_probability:.2f})")
-        
-        # Converter segmentos para nosso modelo
-        segments = []
-        for segment in segments_result:
-            # Extrair keywords básicas (palavras > 3 caracteres)
-            words = segment.text.lower().split()
-            keywords = [w.strip('.,!?;:') for w in words if len(w.strip('.,!?;:')) > 3]
+            if self._batch_size:
+                # O VAD continua valendo: os trechos de fala são agrupados em lotes
+                transcribe_params["batch_size"] = self._batch_size
             
-            seg = TranscriptionSegment(
-                text=segment.text.strip(),
-                start_time=segment.start,
-                end_time=segment.end,
-                keywords=keywords
-            )
-            segments.append(seg)
+            segments_result, info = model.transcribe(**transcribe_params)
             
-            logger.debug(f"[{seg.start_time:.1f}s - {seg.end_time:.1f}s] {seg.text}")
-        
-        return segments
+            logger.info(f"Detected language: {info.language} (probability: {info.language_probability:.2f})")
+            
+            # Converter segmentos para nosso modelo
+            for segment in segments_result:
+                keywords = _extract_keywords(segment.text)
+                
+                # Dados vindos do Whisper já têm os tipos certos: dispensa validação
+                seg = TranscriptionSegment.model_construct(
+                    text=segment.text.strip(),
+                    start_time=segment.start,
+                    end_time=segment.end,
+                    keywords=keywords
+                )
+                loop.call_soon_threadsafe(queue.put_nowait, seg)
+                
+                logger.debug(f"[{seg.start_time:.1f}s - {seg.end_time:.1f}s] {seg.text}")
+        finally:
+            # Sentinela de fim (também em caso de erro)
+            loop.call_soon_threadsafe(queue.put_nowait, None)
     
     def get_audio_duration(self, audio_path: Path) -> float:
         """
@@ -132,19 +280,5 @@ class AudioTranscriptionService:
         Returns:
             Duração em segundos
         """
-        try:
-            import soundfile as sf
-            info = sf.info(str(audio_path))
-            return info.duration
-        except ImportError:
-            logger.warning("soundfile not installed, falling back to moviepy")
-            try:
-                from moviepy.editor import AudioFileClip
-                audio = AudioFileClip(str(audio_path))
-                duration = audio.duration
-                audio.close()
-                return duration
-            except Exception as e:
-                logger.error(f"Failed to get audio duration: {e}")
-                raise
-
+        stat = audio_path.stat()
+        return _read_audio_duration(str(audio_path), stat.st_mtime_ns, stat.st_size)
@@ -1,42 +1,99 @@
 """
 CapCut Automation Service - Edição automática de vídeos
-Usa MoviePy como backend confiável para edição programática
+Edição em um único processo FFmpeg (filtergraph); compilações por segmentos
+FFmpeg paralelos unidos com o concat demuxer
 """
+from functools import lru_cache
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional
+from types import MappingProxyType
+from typing import List, Optional, Tuple
+import asyncio
 import logging
-from moviepy.editor import (
-    VideoFileClip,
-    TextClip,
-    CompositeVideoClip,
-    concatenate_videoclips,
-    AudioFileClip
-)
-from moviepy.video.fx import all as vfx
+import math
+import tempfile
+import textwrap
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from PIL import Image, ImageDraw, ImageFont
 import uuid
 
 from app.models.video_edit_schemas import (
     EditStyle,
-    VideoEditRequest,
-    SubtitleConfig,
-    EditedVideoResult,
-    CompilationRequest
+    EditedVideoResult
 )
+from app.services.ffmpeg_utils import OUTPUT_FPS, probe_streams, run_ffmpeg, zoom_filter
 from app.services.video_analyzer_service import VideoAnalyzerService
 
 logger = logging.getLogger(__name__)
 
+# Codecs de áudio que podem ir para o MP4 sem recodificar
+MP4_AUDIO_CODECS = {"aac", "mp3"}
+
+# Altura máxima de saída (720p vertical); fontes maiores são reduzidas já no
+# decode do FFmpeg, antes dos efeitos e antes de qualquer frame chegar ao Python
+MAX_OUTPUT_HEIGHT = 1280
+
+# Encoder: veryfast fica no nível de qualidade do medium em clipes curtos com
+# CRF fixo; faststart move o moov atom para o início (reprodução imediata)
+X264_PRESET = "veryfast"
+X264_QUALITY_PARAMS = ["-crf", "23", "-movflags", "+faststart"]
+FADE_DURATION = 0.5
+ZOOM_FACTOR = 1.1
+
+# Segmentos de compilação codificados ao mesmo tempo
+MAX_PARALLEL_SEGMENTS = 4
+
+# Metadados de vídeos de entrada mantidos em cache (LRU)
+PROBE_CACHE_SIZE = 256
+
+# Fontes procuradas para legendas/marca d'água (a primeira existente é usada)
+FONT_CANDIDATES = {
+    True: [
+        Path(__file__).parent.parent / "static" / "fonts" / "Roboto-Bold.ttf",
+        Path("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+        Path("/Library/Fonts/Arial Bold.ttf"),
+        Path("C:/Windows/Fonts/arialbd.ttf"),
+    ],
+    False: [
+        Path(__file__).parent.parent / "static" / "fonts" / "Roboto-Regular.ttf",
+        Path("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"),
+        Path("/Library/Fonts/Arial.ttf"),
+        Path("C:/Windows/Fonts/arial.ttf"),
+    ],
+}
+
+# Estilos de legenda (somente leitura)
+FONT_CONFIGS = MappingProxyType({
+    "bold": {"fontsize": 40, "color": "white", "stroke_color": "black", "stroke_width": 2},
+    "outline": {"fontsize": 38, "color": "white", "stroke_color": "blue", "stroke_width": 3},
+    "shadow": {"fontsize": 36, "color": "yellow", "stroke_color": "black", "stroke_width": 1},
+    "minimal": {"fontsize": 32, "color": "white", "stroke_color": None, "stroke_width": 0}
+})
+
+
+@lru_cache(maxsize=16)
+def _load_font(size: int, bold: bool = False) -> ImageFont.ImageFont:
+    """
+    Carrega a primeira fonte TrueType disponível (ou a fonte padrão do Pillow).
+    Cacheada por (tamanho, negrito): legendas e marca d'água reutilizam a mesma fonte
+    """
+    for candidate in FONT_CANDIDATES[bold]:
+        if candidate.exists():
+            return ImageFont.truetype(str(candidate), size)
+    return ImageFont.load_default(size)
+
 
 class CapCutAutomationService:
     """
     Serviço de automação de edição de vídeos
-    Emula funcionalidades do CapCut usando MoviePy
+    Emula funcionalidades do CapCut usando FFmpeg
     """
     
-    def __init__(self):
-        self.analyzer = VideoAnalyzerService()
+    def __init__(self, analyzer: Optional[VideoAnalyzerService] = None):
+        self.analyzer = analyzer or VideoAnalyzerService()
         self.temp_dir = Path("python_space/downloads/temp")
         self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self._probe_cache: "OrderedDict[tuple, dict]" = OrderedDict()
         
         # Configurações de efeitos por estilo
         self.style_configs = {
@@ -82,6 +139,10 @@ class CapCutAutomationService:
         - Efeitos visuais
         - Transições
         
+        Todas as etapas formam um único filtergraph do FFmpeg: o vídeo é
+        decodificado, filtrado e codificado em uma só passada, sem que os
+        frames passem pelo Python.
+        
         Args:
             video_path: Caminho do vídeo original
             comments: Lista de comentários gerados
@@ -96,61 +157,116 @@ class CapCutAutomationService:
         try:
             logger.info(f"Iniciando edição de vídeo: {video_path} (estilo: {style})")
             
-            # Carregar vídeo
-            clip = VideoFileClip(str(video_path))
-            original_duration = clip.duration
+            # Ler metadados (sem decodificar frames)
+            infos = await self._probe(video_path)
+            original_duration = infos["duration"]
+            width, height = infos["video_size"]
+            has_audio = infos.get("audio_found", False)
+            
+            filters = []
+            video_label = "[0:v]"
+            audio_label = "[0:a]" if has_audio else None
+            duration = original_duration
             
             # Aplicar cortes se necessário
             if target_duration and target_duration < original_duration:
                 cuts = await self.analyzer.find_best_cuts(video_path, target_duration)
-                clip = await self._apply_cuts(clip, cuts)
+                if cuts:
+                    cut_filters, video_label, audio_label = self._cut_filters(cuts, has_audio)
+                    filters.extend(cut_filters)
+                    duration = sum(end - start for start, end in cuts)
             
             # Aplicar configurações de estilo
             config = self.style_configs[style]
             effects_applied = []
+            video_chain = []
+            audio_chain = []
+            
+            # Reduzir resolução antes de qualquer efeito por frame
+            if height > MAX_OUTPUT_HEIGHT:
+                video_chain.append(f"scale=-2:{MAX_OUTPUT_HEIGHT}")
+                width, height = self._output_size(width, height)
             
             # Ajustar velocidade
             if config["speed"] != 1.0:
-                clip = clip.fx(vfx.speedx, config["speed"])
+                video_chain.append(f"setpts=PTS/{config['speed']}")
+                audio_chain.append(f"atempo={config['speed']}")
+                duration /= config["speed"]
                 effects_applied.append(f"speed_{config['speed']}x")
             
+            # Normalizar FPS antes dos efeitos baseados em frames
+            video_chain.append(f"fps={OUTPUT_FPS}")
+            
             # Aplicar efeitos
             if "zoom" in config["effects"]:
-                clip = await self._apply_zoom_effect(clip)
+                video_chain.append(zoom_filter(duration, width, height, 1.0, ZOOM_FACTOR))
                 effects_applied.append("zoom")
             
             if "fade" in config["effects"]:
-                clip = clip.fadein(0.5).fadeout(0.5)
+                video_chain.append(self._fade_filter(duration))
                 effects_applied.append("fade")
             
-            # Adicionar legendas
-            subtitles_count = 0
-            if add_subtitles and comments:
-                clip, subtitles_count = await self._add_subtitles(
-                    clip,
-                    comments[:5],  # Top 5 comentários
-                    config["subtitle_style"]
-                )
-                effects_applied.append(f"subtitles_{subtitles_count}")
-            
-            # Adicionar marca d'água
-            clip = await self._add_watermark(clip, metadata.get('author', ''))
-            
-            # Exportar vídeo editado
-            base_name = video_path.stem if video_path.suffix else video_path.name
-            output_filename = f"edited_{uuid.uuid4().hex[:8]}_{base_name}.mp4"
-            output_path = self.temp_dir / output_filename
+            filters.append(f"{video_label}{','.join(video_chain)}[base]")
+            video_label = "[base]"
             
-            clip.write_videofile(
-                str(output_path),
-                codec='libx264',
-                audio_codec='aac',
-                fps=30,
-                preset='medium',
-                threads=4
-            )
+            if audio_label and audio_chain:
+                filters.append(f"{audio_label}{','.join(audio_chain)}[aout]")
+                audio_label = "[aout]"
             
-            clip.close()
+            with tempfile.TemporaryDirectory(prefix="capcut_") as overlay_dir:
+                overlay_dir = Path(overlay_dir)
+                overlays = []
+                
+                # Adicionar legendas
+                subtitles_count = 0
+                if add_subtitles and comments:
+                    subtitle_overlays = self._subtitle_overlays(
+                        comments[:5],  # Top 5 comentários
+                        config["subtitle_style"],
+                        duration,
+                        width,
+                        height,
+                        overlay_dir
+                    )
+                    overlays.extend(subtitle_overlays)
+                    subtitles_count = len(subtitle_overlays)
+                    if subtitles_count:
+                        effects_applied.append(f"subtitles_{subtitles_count}")
+                
+                # Adicionar marca d'água
+                overlays.append(self._watermark_overlay(metadata.get('author', ''), width, overlay_dir))
+                
+                overlay_filters, video_label = self._overlay_filters(overlays, video_label)
+                filters.extend(overlay_filters)
+                
+                # Exportar vídeo editado
+                base_name = video_path.stem if video_path.suffix else video_path.name
+                output_filename = f"edited_{uuid.uuid4().hex[:8]}_{base_name}.mp4"
+                output_path = self.temp_dir / output_filename
+                
+                args = ["-y", "-i", str(video_path)]
+                for image_path, _ in overlays:
+                    args += ["-i", str(image_path)]
+                args += ["-filter_complex", ";".join(filters), "-map", video_label]
+                if audio_label:
+                    args += ["-map", audio_label if audio_label != "[0:a]" else "0:a"]
+                
+                # Áudio sem cortes nem atempo é copiado quando o MP4 o aceita
+                audio_codec = "aac"
+                if audio_label == "[0:a]" and await self._audio_codec(video_path) in MP4_AUDIO_CODECS:
+                    audio_codec = "copy"
+                
+                args += [
+                    "-c:v", "libx264",
+                    "-preset", X264_PRESET,
+                    "-pix_fmt", "yuv420p",
+                    "-threads", "0",
+                    *X264_QUALITY_PARAMS,
+                    "-c:a", audio_codec,
+                    str(output_path)
+                ]
+                
+                await run_ffmpeg(args)
             
             # Calcular tamanho do arquivo
             file_size_mb = output_path.stat().st_size / (1024 * 1024)
@@ -160,7 +276,7 @@ class CapCutAutomationService:
                 original_path=str(video_path),
                 style_applied=style,
                 duration_original=original_duration,
-                duration_edited=VideoFileClip(str(output_path)).duration,
+                duration_edited=await self._probe_duration(output_path, cache=False),
                 effects_applied=effects_applied,
                 subtitles_count=subtitles_count,
                 file_size_mb=round(file_size_mb, 2)
@@ -173,146 +289,188 @@ class CapCutAutomationService:
             logger.error(f"Erro ao editar vídeo: {e}")
             raise
     
-    async def _apply_cuts(
-        self,
-        clip: VideoFileClip,
-        cuts: List[tuple]
-    ) -> VideoFileClip:
-        """Aplica cortes no vídeo"""
-        segments = []
-        for start, end in cuts:
-            segment = clip.subclip(start, end)
-            segments.append(segment)
+    async def _probe(self, video_path: Path, cache: bool = True) -> dict:
+        """
+        Metadados do vídeo (duração, tamanho, áudio) lidos do cabeçalho
         
-        if len(segments) > 1:
-            return concatenate_videoclips(segments, method="compose")
-        return segments[0] if segments else clip
+        O ffmpeg roda numa thread para não bloquear o event loop. O resultado
+        fica em cache LRU por arquivo (invalidado se o arquivo mudar), evitando
+        abrir o mesmo vídeo várias vezes só para ler a duração; vídeos gerados
+        pelo serviço são lidos uma vez só e passam cache=False.
+        """
+        stat = video_path.stat()
+        key = (str(video_path), stat.st_mtime_ns, stat.st_size)
+        infos = self._probe_cache.get(key)
+        if infos is not None:
+            self._probe_cache.move_to_end(key)
+            return infos
+        
+        infos = await asyncio.to_thread(ffmpeg_parse_infos, str(video_path))
+        if cache:
+            self._probe_cache[key] = infos
+            if len(self._probe_cache) > PROBE_CACHE_SIZE:
+                self._probe_cache.popitem(last=False)
+        return infos
     
-    async def _apply_zoom_effect(
+    async def _probe_duration(self, video_path: Path, cache: bool = True) -> float:
+        """Duração do vídeo em segundos (cacheada)"""
+        return (await self._probe(video_path, cache))["duration"]
+
+    def _output_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Dimensões de saída (pares), limitadas a MAX_OUTPUT_HEIGHT mantendo o aspecto"""
+        if height > MAX_OUTPUT_HEIGHT:
+            width, height = width * MAX_OUTPUT_HEIGHT / height, MAX_OUTPUT_HEIGHT
+        return 2 * round(width / 2), 2 * round(height / 2)
+    
+    def _cut_filters(
         self,
-        clip: VideoFileClip,
-        zoom_factor: float = 1.1
-    ) -> VideoFileClip:
-        """Aplica efeito de zoom sutil"""
-        try:
-            # Zoom gradual do início ao fim
-            def zoom(get_frame, t):
-                frame = get_frame(t)
-                # Zoom progressivo baseado no tempo
-                progress = t / clip.duration
-                current_zoom = 1.0 + (zoom_factor - 1.0) * progress
-                
-                h, w = frame.shape[:2]
-                new_h, new_w = int(h / current_zoom), int(w / current_zoom)
-                
-                # Centralizar o crop
-                top = (h - new_h) // 2
-                left = (w - new_w) // 2
-                
-                cropped = frame[top:top+new_h, left:left+new_w]
-                # Redimensionar de volta ao tamanho original
-                import cv2
-                resized = cv2.resize(cropped, (w, h))
-                return resized
-            
-            return clip.fl(zoom)
-        except Exception as e:
-            logger.warning(f"Erro ao aplicar zoom: {e}, retornando clip original")
-            return clip
+        cuts: List[Tuple[float, float]],
+        has_audio: bool
+    ) -> Tuple[List[str], str, Optional[str]]:
+        """Filtros de corte (trim + concat); retorna (filtros, label de vídeo, label de áudio)"""
+        filters = []
+        streams = ""
+        for i, (start, end) in enumerate(cuts):
+            filters.append(f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{i}]")
+            streams += f"[v{i}]"
+            if has_audio:
+                filters.append(f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{i}]")
+                streams += f"[a{i}]"
+        
+        if len(cuts) == 1:
+            return filters, "[v0]", "[a0]" if has_audio else None
+        
+        if has_audio:
+            filters.append(f"{streams}concat=n={len(cuts)}:v=1:a=1[vcut][acut]")
+            return filters, "[vcut]", "[acut]"
+        filters.append(f"{streams}concat=n={len(cuts)}:v=1:a=0[vcut]")
+        return filters, "[vcut]", None
+    
+    def _fade_filter(self, duration: float) -> str:
+        """Fade in/out de vídeo"""
+        fade_out_start = max(0.0, duration - FADE_DURATION)
+        return (
+            f"fade=t=in:st=0:d={FADE_DURATION},"
+            f"fade=t=out:st={fade_out_start:.3f}:d={FADE_DURATION}"
+        )
     
-    async def _add_subtitles(
+    def _subtitle_overlays(
         self,
-        clip: VideoFileClip,
         comments: List[dict],
-        style: str
-    ) -> tuple[VideoFileClip, int]:
-        """Adiciona legendas ao vídeo"""
+        style: str,
+        duration: float,
+        width: int,
+        height: int,
+        output_dir: Path
+    ) -> List[Tuple[Path, str]]:
+        """Renderiza as legendas em PNG; retorna (imagem, parâmetros do overlay)"""
         try:
-            duration_per_subtitle = clip.duration / len(comments)
-            subtitle_clips = []
+            duration_per_subtitle = duration / len(comments)
+            
+            config = FONT_CONFIGS.get(style, FONT_CONFIGS["bold"])
             
+            overlays = []
             for i, comment in enumerate(comments):
                 start_time = i * duration_per_subtitle
+                end_time = start_time + min(2.5, duration_per_subtitle)
                 
                 # Criar texto da legenda
                 text = comment.get('text', comment.get('comment', ''))
                 if len(text) > 80:
                     text = text[:77] + "..."
                 
-                # Configurações de estilo
-                font_configs = {
-                    "bold": {"fontsize": 40, "color": "white", "stroke_color": "black", "stroke_width": 2},
-                    "outline": {"fontsize": 38, "color": "white", "stroke_color": "blue", "stroke_width": 3},
-                    "shadow": {"fontsize": 36, "color": "yellow", "stroke_color": "black", "stroke_width": 1},
-                    "minimal": {"fontsize": 32, "color": "white", "stroke_color": None, "stroke_width": 0}
-                }
-                
-                config = font_configs.get(style, font_configs["bold"])
-                
-                # Criar clip de texto
-                txt_clip = TextClip(
-                    text,
-                    fontsize=config["fontsize"],
-                    color=config["color"],
-                    stroke_color=config["stroke_color"],
-                    stroke_width=config["stroke_width"],
-                    font='Arial-Bold',
-                    method='caption',
-                    size=(clip.w * 0.8, None)
-                ).set_start(start_time).set_duration(min(2.5, duration_per_subtitle))
+                image_path = output_dir / f"subtitle_{i}.png"
+                self._render_text(image_path, text, config, max_width=int(width * 0.8), bold=True)
                 
-                # Posicionar na parte inferior
-                txt_clip = txt_clip.set_position(('center', clip.h * 0.75))
-                subtitle_clips.append(txt_clip)
+                # Centralizado, na parte inferior
+                overlays.append((
+                    image_path,
+                    f"x=(W-w)/2:y={int(height * 0.75)}:enable='between(t,{start_time:.3f},{end_time:.3f})'"
+                ))
             
-            # Compor vídeo com legendas
-            final_clip = CompositeVideoClip([clip] + subtitle_clips)
-            return final_clip, len(subtitle_clips)
+            return overlays
             
         except Exception as e:
             logger.warning(f"Erro ao adicionar legendas: {e}, retornando clip sem legendas")
-            return clip, 0
+            return []
     
-    async def _add_watermark(
+    def _watermark_overlay(self, author: str, width: int, output_dir: Path) -> Tuple[Path, str]:
+        """Renderiza a marca d'água discreta (canto superior direito)"""
+        watermark_text = f"@{author}" if author else "TikTok"
+        image_path = output_dir / "watermark.png"
+        self._render_text(
+            image_path,
+            watermark_text,
+            {"fontsize": 24, "color": "white", "stroke_color": "black", "stroke_width": 1}
+        )
+        return image_path, f"x={int(width * 0.75)}:y=20"
+    
+    def _overlay_filters(
         self,
-        clip: VideoFileClip,
-        author: str
-    ) -> VideoFileClip:
-        """Adiciona marca d'água discreta"""
-        try:
-            watermark_text = f"@{author}" if author else "TikTok"
-            
-            txt_clip = TextClip(
-                watermark_text,
-                fontsize=24,
-                color='white',
-                font='Arial',
-                stroke_color='black',
-                stroke_width=1
-            ).set_duration(clip.duration)
-            
-            # Posicionar no canto superior direito
-            txt_clip = txt_clip.set_position((clip.w * 0.75, 20))
-            
-            return CompositeVideoClip([clip, txt_clip])
-            
-        except Exception as e:
-            logger.warning(f"Erro ao adicionar watermark: {e}")
-            return clip
+        overlays: List[Tuple[Path, str]],
+        video_label: str
+    ) -> Tuple[List[str], str]:
+        """Encadeia um overlay por imagem (entradas 1..N do FFmpeg)"""
+        filters = []
+        for i, (_, params) in enumerate(overlays, 1):
+            output_label = "[vout]" if i == len(overlays) else f"[ov{i}]"
+            filters.append(f"{video_label}[{i}:v]overlay={params}{output_label}")
+            video_label = output_label
+        return filters, video_label
+    
+    def _render_text(
+        self,
+        image_path: Path,
+        text: str,
+        config: dict,
+        max_width: Optional[int] = None,
+        bold: bool = False
+    ) -> None:
+        """Desenha texto com contorno em um PNG transparente"""
+        font = _load_font(config["fontsize"], bold)
+        stroke_width = config["stroke_width"]
+        
+        if max_width:
+            # Quebra de linha aproximada pela largura média dos caracteres
+            chars_per_line = max(10, int(max_width / (config["fontsize"] * 0.55)))
+            text = textwrap.fill(text, width=chars_per_line)
+        
+        measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+        left, top, right, bottom = measure.multiline_textbbox(
+            (0, 0), text, font=font, stroke_width=stroke_width, align="center"
+        )
+        image = Image.new("RGBA", (math.ceil(right - left), math.ceil(bottom - top)), (0, 0, 0, 0))
+        ImageDraw.Draw(image).multiline_text(
+            (-left, -top),
+            text,
+            font=font,
+            fill=config["color"],
+            stroke_width=stroke_width,
+            stroke_fill=config["stroke_color"],
+            align="center"
+        )
+        image.save(image_path)
     
     async def create_compilation(
         self,
         video_paths: List[Path],
         theme: str = "trending",
-        max_duration: int = 60
+        max_duration: int = 60,
+        allow_stream_copy: bool = True
     ) -> EditedVideoResult:
         """
         Cria compilação de múltiplos vídeos
         
+        Quando todos os vídeos têm os mesmos codecs e parâmetros, os pacotes
+        são apenas concatenados (sem recodificar, e sem transições fade).
+        Caso contrário, cada trecho é codificado em paralelo (com fade) e os
+        segmentos são unidos sem nova codificação.
+        
         Args:
             video_paths: Lista de caminhos dos vídeos
             theme: Tema da compilação
             max_duration: Duração máxima em segundos
+            allow_stream_copy: Permite a concatenação sem recodificação
             
         Returns:
             EditedVideoResult da compilação
@@ -320,41 +478,44 @@ class CapCutAutomationService:
         try:
             logger.info(f"Criando compilação de {len(video_paths)} vídeos")
             
-            clips = []
-            total_duration = 0
+            if allow_stream_copy:
+                probes = await asyncio.gather(*(self._probe_streams(p) for p in video_paths))
+                if all(probes) and len({self._stream_signature(p) for p in probes}) == 1:
+                    return await self._concat_stream_copy(video_paths, probes, theme, max_duration)
+            
+            # Uma leitura de cabeçalho por arquivo (cacheada), reaproveitada abaixo
+            input_durations = await asyncio.gather(*(self._probe_duration(p) for p in video_paths))
             
-            for video_path in video_paths:
+            # Quanto de cada vídeo entra na compilação
+            plan = []
+            total_duration = 0
+            for video_path, duration in zip(video_paths, input_durations):
                 if total_duration >= max_duration:
                     break
-                
-                clip = VideoFileClip(str(video_path))
-                remaining = max_duration - total_duration
-                
-                if clip.duration > remaining:
-                    clip = clip.subclip(0, remaining)
-                
-                # Adicionar transição fade
-                clip = clip.fadein(0.5).fadeout(0.5)
-                clips.append(clip)
-                total_duration += clip.duration
+                limit = min(duration, max_duration - total_duration)
+                plan.append((video_path, limit))
+                total_duration += limit
             
-            # Concatenar vídeos
-            final_clip = concatenate_videoclips(clips, method="compose")
+            # Todos os segmentos saem com a resolução do primeiro vídeo
+            width, height = self._output_size(*(await self._probe(video_paths[0]))["video_size"])
             
-            # Exportar
             output_filename = f"compilation_{theme}_{uuid.uuid4().hex[:8]}.mp4"
             output_path = self.temp_dir / output_filename
             
-            final_clip.write_videofile(
-                str(output_path),
-                codec='libx264',
-                audio_codec='aac',
-                fps=30
-            )
-            
-            final_clip.close()
-            for clip in clips:
-                clip.close()
+            with tempfile.TemporaryDirectory(prefix="compilation_") as segment_dir:
+                segment_paths = [Path(segment_dir) / f"segment_{i}.mp4" for i in range(len(plan))]
+                semaphore = asyncio.Semaphore(MAX_PARALLEL_SEGMENTS)
+                
+                async def prepare(video_path: Path, limit: float, segment_path: Path):
+                    async with semaphore:
+                        await self._prepare_segment(video_path, limit, width, height, segment_path)
+                
+                # Segmentos codificados em paralelo; o concat só copia os pacotes
+                await asyncio.gather(*(
+                    prepare(video_path, limit, segment_path)
+                    for (video_path, limit), segment_path in zip(plan, segment_paths)
+                ))
+                await self._concat_demuxer([(path, None) for path in segment_paths], output_path)
             
             file_size_mb = output_path.stat().st_size / (1024 * 1024)
             
@@ -362,7 +523,7 @@ class CapCutAutomationService:
                 video_path=str(output_path),
                 original_path=str(video_paths[0]),
                 style_applied=EditStyle.COMPILATION,
-                duration_original=sum(VideoFileClip(str(p)).duration for p in video_paths),
+                duration_original=sum(input_durations),
                 duration_edited=total_duration,
                 effects_applied=["compilation", "fade_transitions"],
                 subtitles_count=0,
@@ -372,4 +533,123 @@ class CapCutAutomationService:
         except Exception as e:
             logger.error(f"Erro ao criar compilação: {e}")
             raise
-
+    
+    async def _prepare_segment(
+        self,
+        video_path: Path,
+        limit: float,
+        width: int,
+        height: int,
+        output_path: Path
+    ) -> None:
+        """
+        Codifica um trecho da compilação com fade in/out, já na resolução, FPS
+        e parâmetros de áudio comuns (vídeos sem áudio ganham trilha silenciosa)
+        """
+        has_audio = (await self._probe(video_path)).get("audio_found", False)
+        args = ["-y", "-t", f"{limit:.3f}", "-i", str(video_path)]
+        if not has_audio:
+            args += ["-f", "lavfi", "-t", f"{limit:.3f}", "-i", "anullsrc=r=44100:cl=stereo"]
+        
+        video_filter = (
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+            f"fps={OUTPUT_FPS},{self._fade_filter(limit)}"
+        )
+        await run_ffmpeg(args + [
+            "-vf", video_filter,
+            "-map", "0:v:0", "-map", "0:a:0" if has_audio else "1:a:0",
+            "-c:v", "libx264", "-preset", X264_PRESET, "-pix_fmt", "yuv420p",
+            *X264_QUALITY_PARAMS,
+            "-c:a", "aac", "-ar", "44100", "-ac", "2", "-shortest",
+            str(output_path)
+        ])
+    
+    async def _concat_demuxer(
+        self,
+        entries: List[Tuple[Path, Optional[float]]],
+        output_path: Path
+    ) -> None:
+        """Une arquivos (com outpoint opcional) pelo concat demuxer, sem recodificar"""
+        lines = []
+        for video_path, outpoint in entries:
+            escaped = str(video_path.resolve()).replace("'", "'\\''")
+            lines.append(f"file '{escaped}'")
+            if outpoint is not None:
+                lines.append(f"outpoint {outpoint:.3f}")
+        
+        with tempfile.TemporaryDirectory(prefix="concat_") as list_dir:
+            list_path = Path(list_dir) / "concat.txt"
+            list_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            await run_ffmpeg([
+                "-y", "-f", "concat", "-safe", "0", "-i", str(list_path),
+                "-c", "copy", "-movflags", "+faststart", str(output_path)
+            ])
+    
+    async def _probe_streams(self, video_path: Path) -> Optional[dict]:
+        """Lê streams e formato com ffprobe; None se o ffprobe não estiver disponível ou falhar"""
+        return await probe_streams(video_path)
+    
+    async def _audio_codec(self, video_path: Path) -> Optional[str]:
+        """Codec da primeira faixa de áudio (None se não houver ou sem ffprobe)"""
+        probe = await self._probe_streams(video_path)
+        for stream in (probe or {}).get("streams", []):
+            if stream.get("codec_type") == "audio":
+                return stream.get("codec_name")
+        return None
+    
+    def _stream_signature(self, probe: dict) -> tuple:
+        """Parâmetros que precisam coincidir para concatenar com -c copy"""
+        return tuple(
+            (
+                stream.get("codec_type"),
+                stream.get("codec_name"),
+                stream.get("profile"),
+                stream.get("width"),
+                stream.get("height"),
+                stream.get("pix_fmt"),
+                stream.get("sample_rate"),
+                stream.get("channels"),
+            )
+            for stream in probe.get("streams", [])
+            if stream.get("codec_type") in ("video", "audio")
+        )
+    
+    async def _concat_stream_copy(
+        self,
+        video_paths: List[Path],
+        probes: List[dict],
+        theme: str,
+        max_duration: int
+    ) -> EditedVideoResult:
+        """Concatena com o concat demuxer do FFmpeg, copiando os pacotes"""
+        durations = [float(probe["format"]["duration"]) for probe in probes]
+        
+        entries = []
+        total_duration = 0.0
+        for video_path, duration in zip(video_paths, durations):
+            if total_duration >= max_duration:
+                break
+            
+            remaining = max_duration - total_duration
+            outpoint = remaining if duration > remaining else None
+            entries.append((video_path, outpoint))
+            total_duration += min(duration, remaining)
+        
+        output_filename = f"compilation_{theme}_{uuid.uuid4().hex[:8]}.mp4"
+        output_path = self.temp_dir / output_filename
+        await self._concat_demuxer(entries, output_path)
+        
+        file_size_mb = output_path.stat().st_size / (1024 * 1024)
+        logger.info(f"Compilação criada sem recodificação: {output_path}")
+        
+        return EditedVideoResult(
+            video_path=str(output_path),
+            original_path=str(video_paths[0]),
+            style_applied=EditStyle.COMPILATION,
+            duration_original=sum(durations),
+            duration_edited=total_duration,
+            effects_applied=["compilation", "stream_copy"],
+            subtitles_count=0,
+            file_size_mb=round(file_size_mb, 2)
+        )
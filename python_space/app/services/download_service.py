@@ -1,12 +1,19 @@
 import yt_dlp
-import os
+import asyncio
+import atexit
+import heapq
+import threading
 import uuid
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Tuple, Union
+from pydantic import HttpUrl
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Try to import TikTokApi for comment extraction
 try:
     from TikTokApi import TikTokApi as TikTokApiClass
@@ -15,7 +22,14 @@ except ImportError:
     TIKTOK_API_AVAILABLE = False
     logger.warning("TikTokApi not available. Comment extraction will be limited.")
 
-logger = logging.getLogger(__name__)
+_HASHTAG_RE = re.compile(r'#(\w+)')
+_VIDEO_ID_RE = re.compile(r'/video/(\d+)')
+
+# Recreate the TikTokApi browser session after this many uses (token expiry)
+TIKTOK_SESSION_MAX_USES = 50
+
+# yt-dlp is blocking (network + disk): run it off the event loop
+_YTDLP_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ytdlp")
 
 
 class DownloadService:
@@ -23,80 +37,80 @@ class DownloadService:
         self.downloads_dir = Path(settings.DOWNLOADS_DIR)
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"Downloads directory ready: {self.downloads_dir}")
-    
-    async def download_video(self, url: str) -> Dict[str, any]:
-        """
-        Download TikTok video using yt-dlp
-        Returns dict with file_path, filename, and size
-        """
-        video_id = str(uuid.uuid4())
-        output_path = self.downloads_dir / f"{video_id}.mp4"
-        
-        logger.info(f"Starting download for video ID: {video_id}")
         
-        ydl_opts = {
+        self._ydl_download_opts = {
             'format': 'best[ext=mp4]/best',
-            'outtmpl': str(output_path.with_suffix('')),  # yt-dlp adds extension
             'merge_output_format': 'mp4',
             'no_warnings': True,
             'quiet': False,
         }
+        # Info-only: comments are all we need, so no info JSON and no playlist expansion
+        self._ydl_info_opts = {
+            'skip_download': True,
+            'writeinfojson': False,
+            'getcomments': True,
+            'noplaylist': True,
+            'playlist_items': '1',
+            'no_warnings': True,
+            'quiet': True,
+        }
         
         # Add cookies if configured
         if settings.YTDLP_COOKIES_BROWSER:
             # Format: (browser, profile, keyring, container)
             # Profile 2 is where the user is logged into TikTok
-            ydl_opts['cookiesfrombrowser'] = (settings.YTDLP_COOKIES_BROWSER, 'Profile 2', None, None)
+            cookies_from_browser = (settings.YTDLP_COOKIES_BROWSER, 'Profile 2', None, None)
+            self._ydl_download_opts['cookiesfrombrowser'] = cookies_from_browser
+            self._ydl_info_opts['cookiesfrombrowser'] = cookies_from_browser
             logger.info(f"Using cookies from browser: {settings.YTDLP_COOKIES_BROWSER} (Profile 2)")
         
+        # YoutubeDL instances are reused per pool thread (they are not thread-safe),
+        # so the browser cookie jar is read once per instance instead of per request
+        self._ydl_local = threading.local()
+        self._ydl_instances = []
+        self._ydl_lock = threading.Lock()
+        
+        # TikTokApi session (headless Chromium) is created lazily and shared
+        self._tiktok_api = None
+        self._tiktok_api_uses = 0
+        self._tiktok_api_lock = asyncio.Lock()
+    
+    async def download_video(self, url: Union[str, HttpUrl], output_dir: Optional[Path] = None) -> Dict[str, any]:
+        """
+        Download TikTok video using yt-dlp
+        Returns dict with file_path (Path), filename, and size
+        
+        Args:
+            url: TikTok video URL (already-validated HttpUrl or plain string)
+            output_dir: Directory to save the video (defaults to DOWNLOADS_DIR)
+        """
+        video_id = str(uuid.uuid4())
+        output_path = Path(output_dir or self.downloads_dir) / f"{video_id}.mp4"
+        
+        logger.info(f"Starting download for video ID: {video_id}")
+        
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                
-                # Find the actual downloaded file
-                # Try multiple possibilities since yt-dlp behavior varies
-                base_path = output_path.with_suffix('')  # Without extension
-                possible_files = [
-                    base_path,  # No extension (most common with outtmpl without extension)
-                    output_path,  # With .mp4 extension
-                    Path(str(base_path) + '.mp4'),
-                    Path(str(base_path) + '.webm'),
-                    Path(str(base_path) + '.mkv'),
-                ]
-                
-                actual_file = None
-                for test_path in possible_files:
-                    if test_path.exists() and test_path.stat().st_size > 0:
-                        actual_file = test_path
-                        logger.info(f"Found downloaded file: {test_path.name}")
-                        break
-                
-                if not actual_file or not actual_file.exists():
-                    # List files in download directory for debugging
-                    logger.error(f"Could not find downloaded file. Searched for: {[str(p) for p in possible_files]}")
-                    raise FileNotFoundError(f"Downloaded file not found. Expected around: {output_path}")
-                
-                file_size = actual_file.stat().st_size
-                
-                if file_size == 0:
-                    raise ValueError("Downloaded file is empty")
-                
-                logger.info(f"Video downloaded successfully: {actual_file.name} ({file_size} bytes)")
-                
-                return {
-                    "file_path": str(actual_file),
-                    "filename": f"tiktok_{video_id}.mp4",
-                    "size": file_size,
-                    "video_info": info
-                }
+            loop = asyncio.get_running_loop()
+            actual_file, info = await loop.run_in_executor(
+                _YTDLP_POOL, self._download_sync, str(url), output_path
+            )
+            file_size = actual_file.stat().st_size
+            
+            logger.info(f"Video downloaded successfully: {actual_file.name} ({file_size} bytes)")
+            
+            return {
+                "file_path": actual_file,
+                "filename": f"tiktok_{video_id}.mp4",
+                "size": file_size,
+                "video_info": info
+            }
                 
         except yt_dlp.utils.DownloadError as e:
             error_msg = str(e)
             logger.error(f"yt-dlp download error: {error_msg}")
             
             # Cleanup on error
-            if output_path.exists():
-                output_path.unlink()
+            output_path.unlink(missing_ok=True)
             
             # Handle specific TikTok authentication errors
             if "requiring login" in error_msg.lower() or "use --cookies" in error_msg.lower():
@@ -123,10 +137,89 @@ class DownloadService:
         except Exception as e:
             logger.error(f"Download failed: {str(e)}")
             # Cleanup on error
-            if output_path.exists():
-                output_path.unlink()
+            output_path.unlink(missing_ok=True)
             raise
     
+    def _get_ydl(self, kind: str) -> yt_dlp.YoutubeDL:
+        """
+        Return the calling thread's YoutubeDL for `kind` ("download" or "info"),
+        creating it on first use
+        """
+        ydl = getattr(self._ydl_local, kind, None)
+        if ydl is None:
+            opts = self._ydl_download_opts if kind == "download" else self._ydl_info_opts
+            ydl = yt_dlp.YoutubeDL(dict(opts))
+            setattr(self._ydl_local, kind, ydl)
+            with self._ydl_lock:
+                self._ydl_instances.append(ydl)
+        return ydl
+    
+    def close(self):
+        """Close reused YoutubeDL instances (saves cookies, closes HTTP handlers)"""
+        with self._ydl_lock:
+            instances, self._ydl_instances = self._ydl_instances, []
+        for ydl in instances:
+            ydl.close()
+    
+    def _download_sync(self, url: str, output_path: Path) -> Tuple[Path, dict]:
+        """
+        Blocking part of the download (runs on _YTDLP_POOL)
+        
+        Returns:
+            Tuple of (downloaded file, yt-dlp info dict)
+        """
+        ydl = self._get_ydl("download")
+        ydl.params['outtmpl']['default'] = str(output_path.with_suffix(''))  # yt-dlp adds extension
+        info = ydl.extract_info(url, download=True)
+        
+        # yt-dlp reports the final path (after merge/remux); prepare_filename is the fallback
+        requested = info.get('requested_downloads') or [{}]
+        filepath = requested[0].get('filepath') or ydl.prepare_filename(info)
+        actual_file = Path(filepath)
+        
+        if not actual_file.exists():
+            logger.error(f"Could not find downloaded file reported by yt-dlp: {actual_file}")
+            raise FileNotFoundError(f"Downloaded file not found. Expected around: {output_path}")
+        
+        if actual_file.stat().st_size == 0:
+            raise ValueError("Downloaded file is empty")
+        
+        return actual_file, info
+    
+    async def _get_tiktok_api(self):
+        """
+        Return the shared TikTokApi instance, creating its browser session on
+        first use and recreating it every TIKTOK_SESSION_MAX_USES calls
+        """
+        async with self._tiktok_api_lock:
+            if self._tiktok_api is not None and self._tiktok_api_uses >= TIKTOK_SESSION_MAX_USES:
+                logger.info("TikTokApi: recycling browser session")
+                await self._close_tiktok_api()
+            
+            if self._tiktok_api is None:
+                api = TikTokApiClass()
+                await api.create_sessions(num_sessions=1, sleep_after=3, headless=True)
+                self._tiktok_api = api
+                self._tiktok_api_uses = 0
+            
+            self._tiktok_api_uses += 1
+            return self._tiktok_api
+    
+    async def _close_tiktok_api(self):
+        """Close the TikTokApi sessions and its Playwright instance"""
+        api, self._tiktok_api = self._tiktok_api, None
+        if api is not None:
+            try:
+                await api.close_sessions()
+                await api.stop_playwright()
+            except Exception as e:
+                logger.warning(f"Failed to close TikTokApi session: {str(e)}")
+    
+    async def aclose(self):
+        """Close the shared TikTokApi session (if one was created)"""
+        async with self._tiktok_api_lock:
+            await self._close_tiktok_api()
+    
     async def extract_comments_with_tiktokapi(self, video_id: str, max_comments: int = 15) -> Optional[str]:
         """
         Extract comments using TikTokApi library
@@ -138,49 +231,49 @@ class DownloadService:
         try:
             logger.info(f"Attempting to extract comments with TikTokApi for video: {video_id}")
             
-            async with TikTokApiClass() as api:
-                await api.create_sessions(num_sessions=1, sleep_after=3, headless=True)
-                
-                video = api.video(id=video_id)
-                comments_list = []
-                
-                async for comment in video.comments(count=max_comments):
-                    comments_list.append(comment)
-                    if len(comments_list) >= max_comments:
-                        break
-                
-                if not comments_list:
-                    logger.warning(f"TikTokApi: No comments found for video {video_id}")
-                    return None
-                
-                # Format comments
-                formatted_lines = []
-                for i, comment in enumerate(comments_list, 1):
-                    author = comment.get('user', {}).get('uniqueId', 'Unknown')
-                    text = comment.get('text', '')
-                    likes = comment.get('digg_count', 0)
-                    
-                    # Limit comment length
-                    if len(text) > 200:
-                        text = text[:200] + '...'
-                    
-                    formatted_lines.append(f"{i}. @{author} ({likes} likes): {text}")
-                
-                content = '\n\n'.join(formatted_lines)
-                
-                # Limit total size
-                max_size = 5000
-                if len(content) > max_size:
-                    content = content[:max_size] + '\n\n[... comentários truncados devido ao tamanho]'
+            api = await self._get_tiktok_api()
+            video = api.video(id=video_id)
+            comments_list = []
+            
+            async for comment in video.comments(count=max_comments):
+                comments_list.append(comment)
+                if len(comments_list) >= max_comments:
+                    break
+            
+            if not comments_list:
+                logger.warning(f"TikTokApi: No comments found for video {video_id}")
+                return None
+            
+            # Format comments
+            formatted_lines = []
+            for i, comment in enumerate(comments_list, 1):
+                author = comment.get('user', {}).get('uniqueId', 'Unknown')
+                text = comment.get('text', '')
+                likes = comment.get('digg_count', 0)
                 
-                logger.info(f"TikTokApi: Successfully extracted {len(comments_list)} comments")
-                return content
+                # Limit comment length
+                if len(text) > 200:
+                    text = text[:200] + '...'
                 
+                formatted_lines.append(f"{i}. @{author} ({likes} likes): {text}")
+            
+            content = '\n\n'.join(formatted_lines)
+            
+            # Limit total size
+            max_size = 5000
+            if len(content) > max_size:
+                content = content[:max_size] + '\n\n[... comentários truncados devido ao tamanho]'
+            
+            logger.info(f"TikTokApi: Successfully extracted {len(comments_list)} comments")
+            return content
+            
         except Exception as e:
             logger.error(f"TikTokApi comment extraction failed: {str(e)}")
+            # The session may be broken: recreate it on the next call
+            self._tiktok_api_uses = TIKTOK_SESSION_MAX_USES
             return None
     
-    async def extract_comments(self, url: str, max_comments: int = 15) -> Optional[str]:
+    async def extract_comments(self, url: Union[str, HttpUrl], max_comments: int = 15) -> Optional[str]:
         """
         Extract comments from TikTok video
         Tries yt-dlp first, then falls back to TikTokApi
@@ -189,48 +282,13 @@ class DownloadService:
         logger.info(f"Starting comment extraction for URL: {url}")
         
         # Method 1: Try yt-dlp first (faster if it works)
-        video_id_temp = str(uuid.uuid4())
-        ydl_opts = {
-            'skip_download': True,
-            'writeinfojson': True,
-            'getcomments': True,
-            'outtmpl': str(self.downloads_dir / video_id_temp),
-            'no_warnings': True,
-            'quiet': True,
-        }
-        
-        if settings.YTDLP_COOKIES_BROWSER:
-            ydl_opts['cookiesfrombrowser'] = (settings.YTDLP_COOKIES_BROWSER, 'Profile 2', None, None)
-        
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                comments = info.get('comments', [])
-                
-                if comments:
-                    logger.info("yt-dlp: Comments found, using yt-dlp extraction")
-                    sorted_comments = sorted(
-                        comments, 
-                        key=lambda x: x.get('like_count', 0), 
-                        reverse=True
-                    )[:max_comments]
-                    
-                    formatted_lines = []
-                    for i, comment in enumerate(sorted_comments, 1):
-                        author = comment.get('author', 'Unknown')
-                        text = comment.get('text', '')
-                        if len(text) > 200:
-                            text = text[:200] + '...'
-                        formatted_lines.append(f"{i}. {author}: {text}")
-                    
-                    content = '\n\n'.join(formatted_lines)
-                    if len(content) > 5000:
-                        content = content[:5000] + '\n\n[... comentários truncados]'
-                    
-                    logger.info(f"yt-dlp: Successfully extracted {len(sorted_comments)} comments")
-                    return content
-                else:
-                    logger.warning(f"yt-dlp: No comments in response. Count: {info.get('comment_count', 0)}")
+            loop = asyncio.get_running_loop()
+            content = await loop.run_in_executor(
+                _YTDLP_POOL, self._extract_comments_sync, str(url), max_comments
+            )
+            if content:
+                return content
         except Exception as e:
             logger.warning(f"yt-dlp comment extraction failed: {str(e)}")
         
@@ -238,7 +296,8 @@ class DownloadService:
         logger.info("Falling back to TikTokApi for comment extraction")
         
         # Extract video ID from URL
-        video_id_match = re.search(r'/video/(\d+)', url)
+        url_path = (url.path or '') if isinstance(url, HttpUrl) else url
+        video_id_match = _VIDEO_ID_RE.search(url_path)
         if video_id_match:
             video_id = video_id_match.group(1)
             result = await self.extract_comments_with_tiktokapi(video_id, max_comments)
@@ -250,6 +309,40 @@ class DownloadService:
         logger.warning("All comment extraction methods failed")
         return None
     
+    def _extract_comments_sync(self, url: str, max_comments: int) -> Optional[str]:
+        """Blocking yt-dlp comment extraction (runs on _YTDLP_POOL)"""
+        info = self._get_ydl("info").extract_info(url, download=False)
+        comments = info.get('comments') or []
+        comment_count = info.get('comment_count', 0)
+        del info  # the rest of the manifest (formats, thumbnails...) is not needed
+        
+        if not comments:
+            logger.warning(f"yt-dlp: No comments in response. Count: {comment_count}")
+            return None
+        
+        logger.info("yt-dlp: Comments found, using yt-dlp extraction")
+        # Top-k by likes without sorting every comment
+        sorted_comments = heapq.nlargest(
+            max_comments,
+            comments,
+            key=lambda x: x.get('like_count') or 0
+        )
+        
+        formatted_lines = []
+        for i, comment in enumerate(sorted_comments, 1):
+            author = comment.get('author', 'Unknown')
+            text = comment.get('text', '')
+            if len(text) > 200:
+                text = text[:200] + '...'
+            formatted_lines.append(f"{i}. {author}: {text}")
+        
+        content = '\n\n'.join(formatted_lines)
+        if len(content) > 5000:
+            content = content[:5000] + '\n\n[... comentários truncados]'
+        
+        logger.info(f"yt-dlp: Successfully extracted {len(sorted_comments)} comments")
+        return content
+    
     def get_metadata(self, video_info: dict) -> dict:
         """
         Extract metadata from video info for AI comment generation
@@ -267,9 +360,7 @@ class DownloadService:
             # Extract hashtags from description
             hashtags = []
             if description:
-                import re
-                hashtag_pattern = r'#(\w+)'
-                found_tags = re.findall(hashtag_pattern, description)
+                found_tags = _HASHTAG_RE.findall(description)
                 hashtags = [f"#{tag}" for tag in found_tags[:10]]  # Limit to 10 hashtags
             
             # Also check tags field
@@ -304,4 +395,5 @@ class DownloadService:
 
 # Singleton instance
 download_service = DownloadService()
+atexit.register(download_service.close)
 
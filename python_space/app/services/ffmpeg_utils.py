@@ -0,0 +1,90 @@
+"""
+FFmpeg compartilhado - binários, execução assíncrona e filtros comuns aos
+serviços de edição (CapCut), vídeos de história e análise
+"""
+import asyncio
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+from moviepy.config import get_setting
+
+# Mesmo binário do FFmpeg usado pelo MoviePy (imageio-ffmpeg ou FFMPEG_BINARY)
+FFMPEG_BINARY = get_setting("FFMPEG_BINARY")
+
+OUTPUT_FPS = 30
+
+
+def _ffprobe_binary(ffmpeg_binary: str) -> str:
+    """
+    ffprobe do mesmo build do FFmpeg configurado: FFPROBE_BINARY do ambiente,
+    o executável ao lado do ffmpeg ou, por fim, o ffprobe do PATH
+    """
+    configured = os.getenv("FFPROBE_BINARY")
+    if configured:
+        return configured
+
+    ffmpeg_path = Path(ffmpeg_binary)
+    sibling = ffmpeg_path.with_name(ffmpeg_path.name.replace("ffmpeg", "ffprobe", 1))
+    if sibling != ffmpeg_path and sibling.is_file():
+        return str(sibling)
+
+    return shutil.which("ffprobe") or "ffprobe"
+
+
+FFPROBE_BINARY = _ffprobe_binary(FFMPEG_BINARY)
+
+
+def zoom_filter(
+    duration: float,
+    width: int,
+    height: int,
+    zoom_start: float = 1.0,
+    zoom_end: float = 1.1
+) -> str:
+    """
+    Zoom linear (zoom_start -> zoom_end) centralizado, via zoompan.
+    O progresso é limitado a 1: a duração estimada pode ficar alguns frames
+    abaixo da real e o zoom para em zoom_end
+    """
+    total_frames = max(1, round(duration * OUTPUT_FPS))
+    return (
+        f"zoompan=z='{zoom_start}{zoom_end - zoom_start:+.4f}*min(on/{total_frames},1)'"
+        f":x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+        f":d=1:s={width}x{height}:fps={OUTPUT_FPS}"
+    )
+
+
+async def run_ffmpeg(args: List[str]) -> None:
+    """Executa o FFmpeg sem bloquear o event loop"""
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"FFmpeg falhou (código {process.returncode}): {stderr.decode(errors='replace')[-500:]}"
+        )
+
+
+async def probe_streams(video_path: Path) -> Optional[dict]:
+    """Lê streams e formato com ffprobe; None se o ffprobe não estiver disponível ou falhar"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            FFPROBE_BINARY, "-v", "error", "-show_streams", "-show_format", "-of", "json", str(video_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        return None
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    try:
+        return json.loads(stdout)
+    except ValueError:
+        return None
@@ -1,13 +1,25 @@
-import hashlib
+import io
 import logging
+import zlib
 from pathlib import Path
 from typing import List
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image, ImageDraw, ImageFont
 from app.models.comment_schemas import GeneratedComment
 
 logger = logging.getLogger(__name__)
 
 
+def _build_exif() -> bytes:
+    """EXIF marking every card as AI generated (static, serialized once)"""
+    exif = Image.Exif()
+    exif[0x010E] = "AI Generated - Not Real Screenshot"  # ImageDescription
+    exif[0x0131] = "TikTok Downloader + AI Comments"  # Software
+    return exif.tobytes()
+
+
+_EXIF_BYTES = _build_exif()
+
+
 class InstagramCommentImageGenerator:
     """Service for generating Instagram-style comment images"""
     
@@ -15,6 +27,8 @@ class InstagramCommentImageGenerator:
     WIDTH = 1080
     HEIGHT = 200
     AVATAR_SIZE = 60
+    AVATAR_SUPERSAMPLE = 4  # Circles drawn at 4x and downscaled (antialiased edge)
+    AVATAR_CACHE_SIZE = 256  # Rendered avatars kept per instance (commenters repeat)
     
     # Colors (Instagram style)
     COLOR_BG = (255, 255, 255)  # White
@@ -23,6 +37,9 @@ class InstagramCommentImageGenerator:
     COLOR_META = (142, 142, 142)  # Light gray
     COLOR_WATERMARK = (199, 199, 199)  # Very light gray
     
+    # zlib level for PNG output: fastest deflate, flat white cards barely grow
+    PNG_COMPRESS_LEVEL = 1
+    
     # Avatar colors (for initials)
     AVATAR_COLORS = [
         (255, 87, 87),   # Red
@@ -58,6 +75,17 @@ class InstagramCommentImageGenerator:
             self.font_regular = ImageFont.load_default()
             self.font_bold = ImageFont.load_default()
             self.font_small = ImageFont.load_default()
+        
+        # One filled circle per avatar color; avatars only add their initials
+        self._circle_cache = {
+            color: self._render_avatar_circle(color) for color in self.AVATAR_COLORS
+        }
+        
+        # Rendered avatars by name (oldest evicted past AVATAR_CACHE_SIZE)
+        self._avatar_cache = {}
+        
+        # Background, heart icon and watermark are the same on every card
+        self._template = self._build_template()
     
     def generate_comment_image(self, comment: GeneratedComment, output_path: Path) -> Path:
         """
@@ -65,14 +93,14 @@ class InstagramCommentImageGenerator:
         
         Args:
             comment: GeneratedComment object
-            output_path: Path to save the PNG file
+            output_path: Path to save the PNG file (its directory must exist)
             
         Returns:
             Path to the generated image
         """
         try:
-            # Create blank image
-            img = Image.new('RGB', (self.WIDTH, self.HEIGHT), color=self.COLOR_BG)
+            # Start from the static template (background, heart icon, watermark)
+            img = self._template.copy()
             draw = ImageDraw.Draw(img)
             
             # 1. Draw avatar (circular with initials)
@@ -93,11 +121,12 @@ class InstagramCommentImageGenerator:
             comment_x = 120
             comment_y = 85
             wrapped_text = self._wrap_text(comment.text, max_width=900)
-            draw.text(
+            draw.multiline_text(
                 (comment_x, comment_y),
                 wrapped_text,
                 font=self.font_regular,
-                fill=self.COLOR_TEXT
+                fill=self.COLOR_TEXT,
+                spacing=4
             )
             
             # 4. Draw metadata (timestamp and likes)
@@ -111,30 +140,12 @@ class InstagramCommentImageGenerator:
                 fill=self.COLOR_META
             )
             
-            # 5. Draw heart icon (simplified)
-            self._draw_heart_icon(draw, (950, 75))
-            
-            # 6. Draw watermark (discrete)
-            watermark_text = "Gerado por IA"
-            watermark_x = self.WIDTH - 180
-            watermark_y = self.HEIGHT - 35
-            draw.text(
-                (watermark_x, watermark_y),
-                watermark_text,
-                font=self.font_small,
-                fill=self.COLOR_WATERMARK
-            )
-            
-            # Save image
+            # Encode in memory (with EXIF metadata), then write the file in one go
+            buffer = io.BytesIO()
+            img.save(buffer, "PNG", exif=_EXIF_BYTES, compress_level=self.PNG_COMPRESS_LEVEL)
             output_path = Path(output_path)
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Add EXIF metadata
-            exif_data = img.getexif()
-            exif_data[0x010E] = "AI Generated - Not Real Screenshot"  # ImageDescription
-            exif_data[0x0131] = "TikTok Downloader + AI Comments"  # Software
-            
-            img.save(output_path, "PNG", exif=exif_data)
+            with open(output_path, "wb") as f:
+                f.write(buffer.getbuffer())
             logger.info(f"Generated image: {output_path.name}")
             
             return output_path
@@ -143,6 +154,19 @@ class InstagramCommentImageGenerator:
             logger.error(f"Error generating image for comment: {str(e)}")
             raise
     
+    def _build_template(self) -> Image.Image:
+        """Blank card with the parts that never change: heart icon and watermark"""
+        template = Image.new('RGB', (self.WIDTH, self.HEIGHT), color=self.COLOR_BG)
+        
+        # Heart icon (simplified)
+        self._draw_heart_icon(ImageDraw.Draw(template), (950, 75))
+        
+        # Watermark (discrete)
+        watermark = self._render_text_layer("Gerado por IA", "font_small", self.COLOR_WATERMARK)
+        template.paste(watermark, (self.WIDTH - 180, self.HEIGHT - 35), watermark)
+        
+        return template
+    
     def generate_images_from_comments(
         self, 
         comments: List[GeneratedComment], 
@@ -161,6 +185,8 @@ class InstagramCommentImageGenerator:
         output_dir = Path(output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
         
+        # Serial on purpose: a card renders in a few ms, far less than starting
+        # worker processes that re-import the app and reload fonts
         image_paths = []
         for i, comment in enumerate(comments, 1):
             output_path = output_dir / f"instagram_{i:02d}.png"
@@ -175,41 +201,53 @@ class InstagramCommentImageGenerator:
         return image_paths
     
     def _create_avatar(self, name: str) -> Image.Image:
-        """Create circular avatar with initials"""
-        # Create square image
-        avatar = Image.new('RGBA', (self.AVATAR_SIZE, self.AVATAR_SIZE), (0, 0, 0, 0))
+        """Create circular avatar with initials (rendered once per name, callers get a copy)"""
+        avatar = self._avatar_cache.get(name)
+        if avatar is None:
+            avatar = self._render_avatar(name)
+            if len(self._avatar_cache) >= self.AVATAR_CACHE_SIZE:
+                del self._avatar_cache[next(iter(self._avatar_cache))]
+            self._avatar_cache[name] = avatar
+        return avatar.copy()
+    
+    def _render_avatar(self, name: str) -> Image.Image:
+        """Draw the initials for name on the prebuilt circle of its color"""
+        # Start from the prebuilt circle for this name's color
+        avatar = self._circle_cache[self._get_color_from_name(name)].copy()
         draw = ImageDraw.Draw(avatar)
         
-        # Get color based on name
-        color = self._get_color_from_name(name)
-        
-        # Draw circle
-        draw.ellipse(
-            [(0, 0), (self.AVATAR_SIZE, self.AVATAR_SIZE)],
-            fill=color
-        )
-        
         # Get initials
         initials = self._get_initials(name)
         
-        # Draw initials
-        # Try to center text (approximate)
-        bbox = draw.textbbox((0, 0), initials, font=self.font_bold)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        
-        x = (self.AVATAR_SIZE - text_width) // 2
-        y = (self.AVATAR_SIZE - text_height) // 2 - 5  # Slight adjustment
-        
+        # Draw initials centered on the circle (middle anchor, no measuring pass)
         draw.text(
-            (x, y),
+            (self.AVATAR_SIZE / 2, self.AVATAR_SIZE / 2 - 2),  # Slight adjustment
             initials,
             font=self.font_bold,
-            fill=(255, 255, 255)  # White text
+            fill=(255, 255, 255),  # White text
+            anchor="mm"
         )
         
         return avatar
     
+    def _render_avatar_circle(self, color: tuple) -> Image.Image:
+        """Transparent square with a filled, antialiased circle of the given color"""
+        size = self.AVATAR_SIZE * self.AVATAR_SUPERSAMPLE
+        circle = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        ImageDraw.Draw(circle).ellipse([(0, 0), (size - 1, size - 1)], fill=color)
+        return circle.resize((self.AVATAR_SIZE, self.AVATAR_SIZE), Image.LANCZOS)
+    
+    def _render_text_layer(self, text: str, font_name: str, fill: tuple) -> Image.Image:
+        """
+        Rasterize static text onto a transparent layer; paste it at the
+        position draw.text would have used (built once, into the card template)
+        """
+        font = getattr(self, font_name)
+        _, _, right, bottom = font.getbbox(text)
+        layer = Image.new('RGBA', (right, bottom), (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((0, 0), text, font=font, fill=fill)
+        return layer
+    
     def _get_initials(self, name: str) -> str:
         """Get initials from name (first letter of first and last name)"""
         parts = name.strip().split()
@@ -222,38 +260,29 @@ class InstagramCommentImageGenerator:
     
     def _get_color_from_name(self, name: str) -> tuple:
         """Generate consistent color based on name hash"""
-        hash_value = int(hashlib.md5(name.encode()).hexdigest(), 16)
-        return self.AVATAR_COLORS[hash_value % len(self.AVATAR_COLORS)]
+        # CRC32 is stable across processes (unlike hash()) and much cheaper than MD5
+        return self.AVATAR_COLORS[zlib.crc32(name.encode()) % len(self.AVATAR_COLORS)]
     
-    def _wrap_text(self, text: str, max_width: int) -> str:
-        """Wrap text to fit within max width (simple word wrap)"""
-        # For simplicity, we'll limit to 2 lines
-        if len(text) <= 80:
-            return text
-        
-        # Try to break at a good point
-        words = text.split()
-        line1 = []
-        line2 = []
-        current_line = line1
-        char_count = 0
-        
-        for word in words:
-            if char_count + len(word) + 1 > 80 and current_line == line1:
-                current_line = line2
-                char_count = 0
-            
-            current_line.append(word)
-            char_count += len(word) + 1
+    def _wrap_text(self, text: str, max_width: int, max_lines: int = 2) -> str:
+        """Wrap text by rendered width (at most max_lines, ellipsis when truncated)"""
+        font = self.font_regular
+        lines = [""]
         
-        result = ' '.join(line1)
-        if line2:
-            result += '\n' + ' '.join(line2)
-            # Limit second line
-            if len(' '.join(line2)) > 80:
-                result = result[:160] + '...'
+        for word in text.split():
+            candidate = f"{lines[-1]} {word}" if lines[-1] else word
+            if not lines[-1] or font.getlength(candidate) <= max_width:
+                lines[-1] = candidate
+            elif len(lines) < max_lines:
+                lines.append(word)
+            else:
+                # Out of lines: drop trailing words until the ellipsis fits
+                last = lines[-1]
+                while " " in last and font.getlength(last + "...") > max_width:
+                    last = last.rsplit(" ", 1)[0]
+                lines[-1] = last + "..."
+                break
         
-        return result
+        return "\n".join(lines)
     
     def _draw_heart_icon(self, draw: ImageDraw.Draw, position: tuple):
         """Draw a simple heart icon"""
@@ -1,8 +1,12 @@
+import json
 import logging
+import os
 import re
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 import asyncio
+import numpy as np
 import ollama
 
 from app.models.story_video_schemas import (
@@ -14,9 +18,21 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Imagens listadas no prompt
+PROMPT_MAX_IMAGES = 20
+
+# Candidatas por segmento enviadas ao Ollama (pré-filtro por keywords)
+PROMPT_CANDIDATES_PER_SEGMENT = 8
+
+# Segmentos por chamada ao Ollama: a lista de imagens vai uma vez por chamada
+OLLAMA_BATCH_SIZE = 10
+
+# Chamadas simultâneas ao Ollama quando há mais de um lote
+OLLAMA_MAX_CONCURRENCY = 4
+
 
 # Stopwords comuns em português
-PORTUGUESE_STOPWORDS = {
+PORTUGUESE_STOPWORDS = frozenset({
     'a', 'o', 'e', 'de', 'da', 'do', 'em', 'um', 'uma', 'os', 'as', 'dos', 'das',
     'para', 'com', 'por', 'na', 'no', 'ao', 'aos', 'à', 'às', 'pelo', 'pela',
     'este', 'esta', 'esse', 'essa', 'isto', 'isso', 'aquele', 'aquela', 'aquilo',
@@ -24,7 +40,61 @@ PORTUGUESE_STOPWORDS = {
     'que', 'qual', 'quais', 'quando', 'onde', 'como', 'porque', 'se',
     'mais', 'menos', 'muito', 'pouco', 'todo', 'toda', 'tudo',
     'já', 'ainda', 'também', 'apenas', 'só', 'sempre', 'nunca'
-}
+})
+
+_SEP_RE = re.compile(r'[_\-\.]')
+_NONWORD_RE = re.compile(r'[^\w\s]')
+_WORD_RE = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=4096)
+def _extract_keywords(filename: str) -> Tuple[str, ...]:
+    """Keywords de um nome de arquivo (cacheado: as mesmas imagens se repetem entre lotes)"""
+    # Remove extensão
+    name = Path(filename).stem
+    
+    # Substitui separadores por espaços
+    name = _SEP_RE.sub(' ', name)
+    
+    # Remove caracteres especiais
+    name = _NONWORD_RE.sub('', name)
+    
+    # Split e normaliza
+    words = name.lower().split()
+    
+    # Remove stopwords e palavras muito curtas
+    return tuple(
+        w for w in words
+        if len(w) > 2 and w not in PORTUGUESE_STOPWORDS
+    )
+
+
+def _score_fallback(
+    keyword_matches: np.ndarray,
+    kw_lens: np.ndarray,
+    usage_counts: np.ndarray
+) -> Tuple[int, float]:
+    """
+    Score do fallback para todas as imagens de uma vez
+    
+    score = penalidade_de_uso * (0.3 + 0.7 * fração_de_keywords_no_texto)
+    
+    Calculado in-place sobre keyword_matches (sem arrays temporários).
+    
+    Returns:
+        Tuple (índice da melhor imagem, score); empates ficam com a primeira
+    """
+    scores = np.divide(keyword_matches, kw_lens, out=keyword_matches)
+    scores *= 0.7
+    scores += 0.3
+    
+    # Penaliza imagens já usadas
+    usage_penalty = np.multiply(usage_counts, 0.5, out=usage_counts)
+    usage_penalty += 1
+    scores /= usage_penalty
+    
+    best_index = int(np.argmax(scores))
+    return best_index, float(scores[best_index])
 
 
 class ImageMatcherService:
@@ -39,6 +109,14 @@ class ImageMatcherService:
         """
         self.min_confidence = min_confidence
         self.supported_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+        self._supported_suffixes = frozenset(ext.lstrip('.') for ext in self.supported_extensions)
+        
+        # Arrays paralelos da lista de imagens atual: índice invertido
+        # keyword -> índices, nº de keywords e path -> índices
+        self._kw_index_images: Optional[List[ImageInfo]] = None
+        self._kw_index: Dict[str, np.ndarray] = {}
+        self._kw_lens: Optional[np.ndarray] = None
+        self._path_index: Dict[str, List[int]] = {}
     
     def find_images(self, images_dir: Path) -> List[ImageInfo]:
         """
@@ -53,16 +131,14 @@ class ImageMatcherService:
         if not images_dir.exists():
             raise FileNotFoundError(f"Images directory not found: {images_dir}")
         
-        images = []
-        for ext in self.supported_extensions:
-            for img_path in images_dir.rglob(f"*{ext}"):
-                if img_path.is_file():
-                    keywords = self.extract_keywords_from_filename(img_path.name)
-                    images.append(ImageInfo(
-                        path=str(img_path),
-                        filename=img_path.name,
-                        keywords=keywords
-                    ))
+        images = [
+            ImageInfo(
+                path=entry.path,
+                filename=entry.name,
+                keywords=self.extract_keywords_from_filename(entry.name)
+            )
+            for entry in self._scan_image_files(str(images_dir))
+        ]
         
         # Ordenar por nome
         images.sort(key=lambda x: x.filename)
@@ -70,6 +146,19 @@ class ImageMatcherService:
         logger.info(f"Found {len(images)} images in {images_dir}")
         return images
     
+    def _scan_image_files(self, directory: str) -> Iterator[os.DirEntry]:
+        """
+        Percorre o diretório recursivamente uma única vez (os.scandir),
+        filtrando pela extensão sem stat extra por arquivo
+        """
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan_image_files(entry.path)
+                elif (entry.is_file(follow_symlinks=False)
+                        and entry.name.rpartition('.')[2].lower() in self._supported_suffixes):
+                    yield entry
+    
     def extract_keywords_from_filename(self, filename: str) -> List[str]:
         """
         Extrai keywords do nome do arquivo
@@ -80,25 +169,7 @@ class ImageMatcherService:
         Returns:
             Lista de keywords (ex: ["carro", "vermelho", "2024"])
         """
-        # Remove extensão
-        name = Path(filename).stem
-        
-        # Substitui separadores por espaços
-        name = re.sub(r'[_\-\.]', ' ', name)
-        
-        # Remove caracteres especiais
-        name = re.sub(r'[^\w\s]', '', name)
-        
-        # Split e normaliza
-        words = name.lower().split()
-        
-        # Remove stopwords e palavras muito curtas
-        keywords = [
-            w for w in words
-            if len(w) > 2 and w not in PORTUGUESE_STOPWORDS
-        ]
-        
-        return keywords
+        return list(_extract_keywords(filename))
     
     async def find_best_matches(
         self,
@@ -120,17 +191,21 @@ class ImageMatcherService:
         
         logger.info(f"Matching {len(segments)} segments with {len(available_images)} images")
         
+        # Matching semântico de todos os segmentos em lotes (poucas chamadas ao Ollama)
+        ollama_results = await self._ollama_match_batch(segments, available_images)
+        
         matches = []
         used_images = {}  # Track usage count for each image
         
-        for i, segment in enumerate(segments):
+        for i, (segment, ollama_result) in enumerate(zip(segments, ollama_results)):
             logger.debug(f"Processing segment {i+1}/{len(segments)}: {segment.text[:50]}...")
             
             # Encontrar melhor imagem para este segmento
             match = await self._match_segment_to_image(
                 segment,
                 available_images,
-                used_images
+                used_images,
+                ollama_result
             )
             
             matches.append(match)
@@ -155,7 +230,8 @@ class ImageMatcherService:
         self,
         segment: TranscriptionSegment,
         available_images: List[ImageInfo],
-        used_images: Dict[str, int]
+        used_images: Dict[str, int],
+        ollama_result: Optional[Tuple[ImageInfo, float]] = None
     ) -> ImageMatch:
         """
         Encontra a melhor imagem para um segmento específico
@@ -164,12 +240,15 @@ class ImageMatcherService:
             segment: Segmento de transcrição
             available_images: Imagens disponíveis
             used_images: Dicionário com contagem de uso de cada imagem
+            ollama_result: Resultado já obtido em lote (se None, consulta o Ollama)
             
         Returns:
             ImageMatch com a melhor correspondência
         """
         # Tentar match com Ollama
-        best_image, confidence = await self._ollama_match(segment, available_images)
+        if ollama_result is None:
+            ollama_result = await self._ollama_match(segment, available_images)
+        best_image, confidence = ollama_result
         
         # Se confidence muito baixa, usar fallback
         if confidence < self.min_confidence:
@@ -200,11 +279,9 @@ class ImageMatcherService:
         Returns:
             Tuple (melhor_imagem, confidence_score)
         """
-        # Preparar lista de imagens para o prompt
-        image_list = "\n".join([
-            f"{i+1}. {img.filename} (keywords: {', '.join(img.keywords)})"
-            for i, img in enumerate(available_images[:20])  # Limitar a 20 para o prompt
-        ])
+        # Só as candidatas mais próximas por keywords vão para o prompt
+        candidates = self._keyword_candidates([segment], available_images)
+        image_list = self._format_image_list(candidates)
         
         prompt = f"""Você está ajudando a criar um vídeo sincronizado com narração.
 
@@ -217,7 +294,7 @@ Qual imagem é mais relevante para o texto?
 Responda APENAS com: número|score
 
 Onde:
-- número: o número da imagem (1-{min(len(available_images), 20)})
+- número: o número da imagem (1-{len(candidates)})
 - score: confiança de 0.0 a 1.0
 
 Exemplo: 3|0.85
@@ -247,8 +324,8 @@ Se nenhuma imagem for relevante, use score baixo (0.1-0.3) e escolha a mais gen
                 score = float(match.group(2))
                 
                 # Validar índice
-                if 0 <= image_idx < len(available_images):
-                    return available_images[image_idx], score
+                if 0 <= image_idx < len(candidates):
+                    return candidates[image_idx], score
                 else:
                     logger.warning(f"Invalid image index: {image_idx}")
             else:
@@ -260,6 +337,159 @@ Se nenhuma imagem for relevante, use score baixo (0.1-0.3) e escolha a mais gen
         # Fallback: primeira imagem com score baixo
         return available_images[0], 0.2
     
+    async def _ollama_match_batch(
+        self,
+        segments: List[TranscriptionSegment],
+        available_images: List[ImageInfo]
+    ) -> List[Tuple[ImageInfo, float]]:
+        """
+        Matching semântico de vários segmentos: lotes de OLLAMA_BATCH_SIZE
+        segmentos por prompt, com até OLLAMA_MAX_CONCURRENCY chamadas simultâneas
+        
+        Returns:
+            Lista (melhor_imagem, confidence_score) alinhada com segments
+        """
+        semaphore = asyncio.Semaphore(OLLAMA_MAX_CONCURRENCY)
+        
+        async def run(batch: List[TranscriptionSegment]) -> List[Tuple[ImageInfo, float]]:
+            async with semaphore:
+                return await self._ollama_match_chunk(batch, available_images)
+        
+        chunks = await asyncio.gather(*(
+            run(segments[i:i + OLLAMA_BATCH_SIZE])
+            for i in range(0, len(segments), OLLAMA_BATCH_SIZE)
+        ))
+        return [result for chunk in chunks for result in chunk]
+    
+    async def _ollama_match_chunk(
+        self,
+        batch: List[TranscriptionSegment],
+        available_images: List[ImageInfo]
+    ) -> List[Tuple[ImageInfo, float]]:
+        """
+        Um único prompt para um lote de segmentos
+        
+        Returns:
+            Lista alinhada com batch; segmentos sem resposta válida recebem
+            (primeira imagem, 0.2), o que aciona o fallback
+        """
+        candidates = self._keyword_candidates(batch, available_images)
+        image_list = self._format_image_list(candidates)
+        segment_list = "\n".join(
+            f'{i+1}. "{segment.text}"' for i, segment in enumerate(batch)
+        )
+        
+        prompt = f"""Você está ajudando a criar um vídeo sincronizado com narração.
+
+Trechos falados:
+{segment_list}
+
+Imagens disponíveis:
+{image_list}
+
+Para cada trecho, qual imagem é mais relevante?
+Responda APENAS com JSON no formato:
+{{"matches": [{{"segment": 1, "image": 3, "score": 0.85}}]}}
+
+Onde:
+- segment: o número do trecho (1-{len(batch)})
+- image: o número da imagem (1-{len(candidates)})
+- score: confiança de 0.0 a 1.0
+
+Se nenhuma imagem for relevante para um trecho, use score baixo (0.1-0.3) e escolha a mais genérica."""
+        
+        results = [(available_images[0], 0.2)] * len(batch)
+        
+        try:
+            # Chamar Ollama em thread separada
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                None,
+                lambda: ollama.generate(
+                    model=settings.OLLAMA_MODEL,
+                    prompt=prompt,
+                    format="json",
+                    options={"temperature": 0.3}  # Baixa temperatura para respostas mais determinísticas
+                )
+            )
+            
+            response_text = response['response'].strip()
+            logger.debug(f"Ollama batch response: {response_text}")
+            
+            for item in self._parse_batch_response(response_text):
+                try:
+                    segment_idx = int(item["segment"]) - 1
+                    image_idx = int(item["image"]) - 1
+                    score = float(item["score"])
+                except (KeyError, TypeError, ValueError):
+                    logger.warning(f"Invalid match entry: {item}")
+                    continue
+                
+                # Validar índices
+                if 0 <= segment_idx < len(batch) and 0 <= image_idx < len(candidates):
+                    results[segment_idx] = (candidates[image_idx], score)
+                else:
+                    logger.warning(f"Invalid match indices: segment {segment_idx}, image {image_idx}")
+        
+        except Exception as e:
+            logger.error(f"Ollama batch matching failed: {e}")
+        
+        return results
+    
+    def _parse_batch_response(self, response_text: str) -> List[dict]:
+        """Extrai a lista "matches" do JSON retornado pelo Ollama"""
+        start = response_text.find('{')
+        end = response_text.rfind('}')
+        if start == -1 or end == -1:
+            logger.warning(f"Could not parse Ollama response: {response_text}")
+            return []
+        
+        try:
+            data = json.loads(response_text[start:end + 1])
+        except ValueError:
+            logger.warning(f"Could not parse Ollama response: {response_text}")
+            return []
+        
+        matches = data.get("matches", []) if isinstance(data, dict) else []
+        return [item for item in matches if isinstance(item, dict)]
+    
+    def _keyword_candidates(
+        self,
+        segments: List[TranscriptionSegment],
+        available_images: List[ImageInfo]
+    ) -> List[ImageInfo]:
+        """
+        Pré-filtro para os prompts: as PROMPT_CANDIDATES_PER_SEGMENT imagens
+        com mais keywords no texto de cada segmento (empates na ordem original),
+        unidas na ordem de relevância e limitadas a PROMPT_MAX_IMAGES
+        """
+        self._ensure_keyword_index(available_images)
+        
+        selected: Dict[int, None] = {}
+        for segment in segments:
+            keyword_score = self._keyword_matches(segment.text) / self._kw_lens
+            ranking = np.argsort(-keyword_score, kind="stable")[:PROMPT_CANDIDATES_PER_SEGMENT]
+            selected.update((int(idx), None) for idx in ranking)
+        
+        return [available_images[idx] for idx in list(selected)[:PROMPT_MAX_IMAGES]]
+    
+    def _keyword_matches(self, text: str) -> np.ndarray:
+        """Quantas keywords de cada imagem aparecem como palavra no texto (usa o índice atual)"""
+        keyword_matches = np.zeros(len(self._kw_lens))
+        # Texto tokenizado uma vez; cada palavra é um lookup no índice
+        for token in frozenset(_WORD_RE.findall(text.lower())):
+            image_indices = self._kw_index.get(token)
+            if image_indices is not None:
+                np.add.at(keyword_matches, image_indices, 1)
+        return keyword_matches
+    
+    def _format_image_list(self, images: List[ImageInfo]) -> str:
+        """Lista numerada de imagens para os prompts"""
+        return "\n".join(
+            f"{i+1}. {img.filename} (keywords: {', '.join(img.keywords)})"
+            for i, img in enumerate(images)
+        )
+    
     def _fallback_match(
         self,
         segment: TranscriptionSegment,
@@ -273,29 +503,19 @@ Se nenhuma imagem for relevante, use score baixo (0.1-0.3) e escolha a mais gen
         1. Imagens menos usadas
         2. Similaridade léxica simples
         """
-        # Calcular scores simples baseado em keywords
-        scores = []
-        for img in available_images:
-            # Score base: penaliza imagens já usadas
-            usage_count = used_images.get(img.path, 0)
-            usage_penalty = 1.0 / (1 + usage_count * 0.5)
-            
-            # Score de keywords: conta quantas keywords da imagem aparecem no texto
-            segment_text_lower = segment.text.lower()
-            keyword_matches = sum(
-                1 for keyword in img.keywords
-                if keyword in segment_text_lower
-            )
-            keyword_score = keyword_matches / max(len(img.keywords), 1)
-            
-            # Score final
-            final_score = usage_penalty * (0.3 + keyword_score * 0.7)
-            scores.append((img, final_score))
+        self._ensure_keyword_index(available_images)
         
-        # Ordenar por score
-        scores.sort(key=lambda x: x[1], reverse=True)
+        # Só as imagens já usadas são visitadas (não a lista inteira)
+        usage_counts = np.zeros(len(available_images))
+        for path, count in used_images.items():
+            usage_counts[self._path_index.get(path, [])] = count
         
-        best_image, best_score = scores[0]
+        best_index, best_score = _score_fallback(
+            self._keyword_matches(segment.text),
+            self._kw_lens,
+            usage_counts
+        )
+        best_image = available_images[best_index]
         
         logger.debug(
             f"Fallback selected: {best_image.filename} "
@@ -303,4 +523,27 @@ Se nenhuma imagem for relevante, use score baixo (0.1-0.3) e escolha a mais gen
         )
         
         return best_image, min(best_score, 0.5)  # Cap at 0.5 for fallback
+    
+    def _ensure_keyword_index(self, available_images: List[ImageInfo]) -> None:
+        """Reconstrói os arrays paralelos quando a lista de imagens muda"""
+        if self._kw_index_images is available_images:
+            return
+        
+        postings: Dict[str, List[int]] = {}
+        path_index: Dict[str, List[int]] = {}
+        for idx, img in enumerate(available_images):
+            path_index.setdefault(img.path, []).append(idx)
+            for keyword in img.keywords:
+                postings.setdefault(keyword, []).append(idx)
+        
+        self._kw_index = {
+            keyword: np.array(indices, dtype=np.intp)
+            for keyword, indices in postings.items()
+        }
+        self._kw_lens = np.array(
+            [max(len(img.keywords), 1) for img in available_images],
+            dtype=float
+        )
+        self._path_index = path_index
+        self._kw_index_images = available_images
 
@@ -1,25 +1,60 @@
+import asyncio
 import logging
+import subprocess
 import uuid
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple
 import numpy as np
-from PIL import Image
-from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips
-from moviepy.video.fx.all import fadein, fadeout
 
 from app.models.story_video_schemas import (
-    TranscriptionSegment,
-    ImageInfo,
     ImageMatch,
     TimelineItem,
     StoryVideoResult
 )
 from app.services.audio_transcription_service import AudioTranscriptionService
+from app.services.ffmpeg_utils import FFMPEG_BINARY, OUTPUT_FPS, run_ffmpeg, zoom_filter
 from app.services.image_matcher_service import ImageMatcherService
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Fade geral no início e no fim do vídeo
+VIDEO_FADE_DURATION = 0.5
+
+# Encoder por hardware (NVENC) quando houver GPU; senão x264 em todos os núcleos
+NVENC_ARGS = ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq", "-b:v", "6M"]
+X264_ARGS = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-threads", "0"]
+
+# Estilos com zoom animado; os demais são imagens paradas com fades, onde o
+# x264 com -tune stillimage gasta menos bits e menos tempo
+ZOOM_STYLES = frozenset({"dynamic", "ken_burns"})
+
+
+@lru_cache(maxsize=1)
+def _video_encoder_args() -> Tuple[str, ...]:
+    """
+    Escolhe o encoder uma vez por processo: codifica um frame de teste com
+    h264_nvenc (o encoder pode existir no build sem GPU/driver disponível)
+    """
+    try:
+        probe = subprocess.run(
+            [
+                FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1",
+                *NVENC_ARGS, "-f", "null", "-"
+            ],
+            capture_output=True,
+            timeout=30
+        )
+        if probe.returncode == 0:
+            logger.info("Using NVENC hardware encoder")
+            return tuple(NVENC_ARGS)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"NVENC probe failed: {e}")
+    
+    return tuple(X264_ARGS)
+
 
 class StoryVideoService:
     """Serviço principal para criar vídeos a partir de narração + imagens"""
@@ -29,9 +64,9 @@ class StoryVideoService:
         self.temp_dir.mkdir(parents=True, exist_ok=True)
         
         self.transcription_service = AudioTranscriptionService(
-            model_size=getattr(settings, 'WHISPER_MODEL', 'base'),
-            device=getattr(settings, 'WHISPER_DEVICE', 'cpu'),
-            compute_type=getattr(settings, 'WHISPER_COMPUTE_TYPE', 'int8')
+            model_size=settings.WHISPER_MODEL,
+            device=settings.WHISPER_DEVICE,
+            compute_type=settings.WHISPER_COMPUTE_TYPE
         )
         
         self.matcher_service = ImageMatcherService(min_confidence=0.3)
@@ -86,7 +121,7 @@ class StoryVideoService:
         timeline = self._build_timeline(matches)
         
         # 6. Gerar vídeo
-        logger.info("Step 5/5: Generating video with MoviePy...")
+        logger.info("Step 5/5: Generating video with FFmpeg...")
         output_path = self.temp_dir / f"story_video_{uuid.uuid4().hex[:8]}.mp4"
         
         audio_duration = self.transcription_service.get_audio_duration(audio_file)
@@ -100,8 +135,13 @@ class StoryVideoService:
         )
         
         # 7. Calcular estatísticas
-        unique_images = len(set(item.image_path for item in timeline))
-        avg_confidence = sum(item.confidence for item in timeline) / len(timeline)
+        unique_images = len({item.image_path for item in timeline})
+        confidences = np.fromiter(
+            (item.confidence for item in timeline),
+            dtype=np.float64,
+            count=len(timeline)
+        )
+        avg_confidence = float(confidences.mean())
         
         result = StoryVideoResult(
             video_path=str(output_path),
@@ -131,19 +171,23 @@ class StoryVideoService:
         Returns:
             Lista de TimelineItem ordenada por tempo
         """
-        timeline = []
-        
-        for match in matches:
-            item = TimelineItem(
-                start_time=match.segment.start_time,
-                end_time=match.segment.end_time,
-                image_path=match.image.path,
-                confidence=match.confidence_score
+        # Ordenar por tempo (já deve estar ordenado, mas garantir) via argsort estável
+        start_times = np.fromiter(
+            (match.segment.start_time for match in matches),
+            dtype=np.float64,
+            count=len(matches)
+        )
+        order = np.argsort(start_times, kind="stable")
+        
+        timeline = [
+            TimelineItem(
+                start_time=matches[i].segment.start_time,
+                end_time=matches[i].segment.end_time,
+                image_path=matches[i].image.path,
+                confidence=matches[i].confidence_score
             )
-            timeline.append(item)
-        
-        # Ordenar por tempo (já deve estar ordenado, mas garantir)
-        timeline.sort(key=lambda x: x.start_time)
+            for i in order.tolist()
+        ]
         
         # Log da timeline
         logger.debug("Video timeline:")
@@ -166,7 +210,12 @@ class StoryVideoService:
         resolution: Tuple[int, int]
     ):
         """
-        Gera o vídeo final usando MoviePy
+        Gera o vídeo final em um único processo FFmpeg
+        
+        Cada imagem distinta entra uma vez como input e é enquadrada uma vez;
+        o split a reparte entre os trechos que a usam, onde o frame é repetido
+        pela duração do trecho com zoom e fades. Os clips são concatenados com
+        o fade geral. O áudio da narração é mapeado direto.
         
         Args:
             timeline: Timeline com imagens e timestamps
@@ -175,157 +224,124 @@ class StoryVideoService:
             style: Estilo de edição
             resolution: Resolução do vídeo
         """
-        # Carregar áudio
-        audio = AudioFileClip(str(audio_file))
+        # Um input por imagem distinta (o timeline costuma repetir imagens)
+        inputs = {}
+        uses = []
+        for item in timeline:
+            input_idx = inputs.setdefault(item.image_path, len(inputs))
+            uses.append(input_idx)
+        
+        args = []
+        filters = []
+        for image_path, input_idx in inputs.items():
+            args += ["-i", str(image_path)]
+            outputs = "".join(
+                f"[s{input_idx}_{i}]" for i, used in enumerate(uses) if used == input_idx
+            )
+            filters.append(
+                f"[{input_idx}:v]{self._cover_filter(resolution)},"
+                f"split={uses.count(input_idx)}{outputs}"
+            )
         
-        # Criar clips para cada item da timeline
-        clips = []
-        for i, item in enumerate(timeline):
+        streams = ""
+        total_duration = 0.0
+        for i, (item, input_idx) in enumerate(zip(timeline, uses)):
             duration = item.end_time - item.start_time
+            total_duration += duration
             
-            # Criar clip de imagem
-            clip = self._create_image_clip(
-                image_path=Path(item.image_path),
-                duration=duration,
-                resolution=resolution,
-                style=style,
-                position=i
+            filters.append(
+                f"[s{input_idx}_{i}]{self._clip_filter(duration, resolution, style, i)}[v{i}]"
             )
-            
-            clips.append(clip)
-        
-        # Concatenar todos os clips
-        logger.info(f"Concatenating {len(clips)} clips...")
-        final_video = concatenate_videoclips(clips, method="compose")
-        
-        # Adicionar áudio
-        final_video = final_video.set_audio(audio)
-        
-        # Aplicar fade geral no início e fim
-        final_video = fadein(final_video, 0.5)
-        final_video = fadeout(final_video, 0.5)
-        
-        # Exportar
-        logger.info(f"Exporting video to {output_path}...")
-        final_video.write_videofile(
-            str(output_path),
-            fps=30,
-            codec='libx264',
-            audio_codec='aac',
-            preset='medium',
-            threads=4,
-            logger=None  # Suprimir logs verbosos do MoviePy
+            streams += f"[v{i}]"
+        
+        # Concatenar todos os clips + fade geral no início e fim
+        fade_out_start = max(0.0, total_duration - VIDEO_FADE_DURATION)
+        filters.append(
+            f"{streams}concat=n={len(timeline)}:v=1:a=0,"
+            f"fade=t=in:st=0:d={VIDEO_FADE_DURATION},"
+            f"fade=t=out:st={fade_out_start:.3f}:d={VIDEO_FADE_DURATION},"
+            f"format=yuv420p[vout]"
         )
         
-        # Cleanup
-        audio.close()
-        final_video.close()
-        for clip in clips:
-            clip.close()
+        encoder_args = list(await asyncio.to_thread(_video_encoder_args))
+        if encoder_args == X264_ARGS and style not in ZOOM_STYLES:
+            encoder_args += ["-tune", "stillimage"]
+        
+        logger.info(f"Exporting {len(timeline)} clips ({len(inputs)} images) to {output_path}...")
+        await run_ffmpeg(args + [
+            "-i", str(audio_file),
+            "-filter_complex", ";".join(filters),
+            "-map", "[vout]", "-map", f"{len(inputs)}:a",
+            "-r", str(OUTPUT_FPS),
+            *encoder_args,
+            "-c:a", "aac",
+            "-t", f"{total_duration:.3f}",
+            "-movflags", "+faststart",
+            "-y", str(output_path)
+        ])
         
         logger.info("Video export complete")
     
-    def _create_image_clip(
+    def _clip_filter(
         self,
-        image_path: Path,
         duration: float,
         resolution: Tuple[int, int],
         style: str,
         position: int
-    ) -> ImageClip:
+    ) -> str:
         """
-        Cria um clip de imagem com efeitos
+        Filtros de um clip a partir do frame já enquadrado: repetição pela
+        duração do trecho, zoom do estilo e fades
         
         Args:
-            image_path: Caminho da imagem
             duration: Duração do clip em segundos
             resolution: Resolução alvo (width, height)
             style: Estilo de edição
             position: Posição na sequência (para alternar efeitos)
             
         Returns:
-            ImageClip com efeitos aplicados
+            Cadeia de filtros FFmpeg
         """
-        # Carregar e ajustar imagem
-        img = Image.open(image_path)
-        img = self._fit_image_to_resolution(img, resolution)
+        width, height = resolution
+        total_frames = max(1, round(duration * OUTPUT_FPS))
         
-        # Criar clip
-        clip = ImageClip(np.array(img), duration=duration)
-        clip = clip.set_fps(30)
+        # Repete o único frame da imagem e gera timestamps a OUTPUT_FPS
+        chain = [
+            f"loop=loop={total_frames - 1}:size=1:start=0",
+            f"setpts=N/({OUTPUT_FPS}*TB)"
+        ]
         
-        # Aplicar efeitos baseado no estilo
+        # Efeitos baseado no estilo: duração do fade e zoom (inicial, final)
         if style == "smooth":
             # Transições suaves e longas
             fade_duration = min(0.5, duration * 0.3)
-            clip = fadein(clip, fade_duration)
-            clip = fadeout(clip, fade_duration)
-        
+            zoom = None
         elif style == "dynamic":
             # Transições rápidas + zoom leve
             fade_duration = min(0.3, duration * 0.2)
-            clip = fadein(clip, fade_duration)
-            clip = fadeout(clip, fade_duration)
-            # Adicionar zoom sutil
-            clip = clip.resize(lambda t: 1 + 0.05 * (t / duration))
-        
+            zoom = (1.0, 1.05)
         elif style == "ken_burns":
-            # Efeito Ken Burns (zoom + pan)
+            # Efeito Ken Burns: alterna zoom in e zoom out
             fade_duration = min(0.4, duration * 0.25)
-            clip = fadein(clip, fade_duration)
-            clip = fadeout(clip, fade_duration)
-            
-            # Alternar entre zoom in e zoom out
-            if position % 2 == 0:
-                # Zoom in
-                clip = clip.resize(lambda t: 1 + 0.15 * (t / duration))
-            else:
-                # Zoom out
-                clip = clip.resize(lambda t: 1.15 - 0.15 * (t / duration))
-        
+            zoom = (1.0, 1.15) if position % 2 == 0 else (1.15, 1.0)
         else:
             # Default: fade simples
             fade_duration = min(0.3, duration * 0.2)
-            clip = fadein(clip, fade_duration)
-            clip = fadeout(clip, fade_duration)
+            zoom = None
         
-        return clip
-    
-    def _fit_image_to_resolution(
-        self,
-        img: Image.Image,
-        resolution: Tuple[int, int]
-    ) -> Image.Image:
-        """
-        Ajusta imagem para caber na resolução mantendo aspect ratio
+        if zoom is not None:
+            chain.append(zoom_filter(duration, width, height, *zoom))
         
-        Usa estratégia de "cover" - redimensiona para cobrir toda a área
-        e faz crop no centro se necessário
+        fade_out_start = max(0.0, duration - fade_duration)
+        chain.append(f"fade=t=in:st=0:d={fade_duration:.3f}")
+        chain.append(f"fade=t=out:st={fade_out_start:.3f}:d={fade_duration:.3f}")
         
-        Args:
-            img: Imagem PIL
-            resolution: Resolução alvo (width, height)
-            
-        Returns:
-            Imagem ajustada
-        """
-        target_w, target_h = resolution
-        img_w, img_h = img.size
-        
-        # Calcular scale para cobrir toda a área (usar o maior)
-        scale_w = target_w / img_w
-        scale_h = target_h / img_h
-        scale = max(scale_w, scale_h)
-        
-        # Redimensionar
-        new_w = int(img_w * scale)
-        new_h = int(img_h * scale)
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        
-        # Crop para a resolução exata (centralizado)
-        left = (new_w - target_w) // 2
-        top = (new_h - target_h) // 2
-        img = img.crop((left, top, left + target_w, top + target_h))
-        
-        return img
-
+        return ",".join(chain)
+    
+    def _cover_filter(self, resolution: Tuple[int, int]) -> str:
+        """Redimensiona para cobrir toda a área e faz crop no centro"""
+        width, height = resolution
+        return (
+            f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},setsar=1"
+        )
@@ -1,16 +1,20 @@
 import re
 import logging
+from itertools import islice
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from app.models.comment_schemas import GeneratedComment
 
 logger = logging.getLogger(__name__)
 
+# Pattern: number. @username (likes likes, timestamp): text
+_LINE_RE = re.compile(r'^\d+\.\s*@(\w+)\s*\((\d+)\s*likes?,\s*([^)]+)\):\s*(.+)$')
+
 
 class TextParserService:
     """Service for parsing comments from TXT file"""
     
-    def parse_comments_file(self, file_path: str) -> List[GeneratedComment]:
+    def parse_comments_file(self, file_path: str, max_count: Optional[int] = None) -> List[GeneratedComment]:
         """
         Parse comments from TXT file
         
@@ -20,6 +24,7 @@ class TextParserService:
         
         Args:
             file_path: Path to comentarios.txt file
+            max_count: Stop after this many valid comments (None = parse all)
             
         Returns:
             List of GeneratedComment objects
@@ -32,13 +37,14 @@ class TextParserService:
         
         try:
             content = file_path.read_text(encoding='utf-8')
-            lines = content.strip().split('\n')
+            # splitlines() also handles CRLF files
+            lines = content.strip().splitlines()
             
-            comments = []
-            for line_num, line in enumerate(lines, 1):
-                comment = self._parse_line(line, line_num)
-                if comment:
-                    comments.append(comment)
+            parsed = (
+                self._parse_line(line.strip(), line_num)
+                for line_num, line in enumerate(lines, 1)
+            )
+            comments = list(islice(filter(None, parsed), max_count))
             
             logger.info(f"Successfully parsed {len(comments)} comments from {file_path}")
             return comments
@@ -49,15 +55,13 @@ class TextParserService:
     
     def _parse_line(self, line: str, line_num: int) -> GeneratedComment | None:
         """
-        Parse a single line into a GeneratedComment
+        Parse a single (already stripped) line into a GeneratedComment
         
         Format: N. @username (LIKES likes, TIMESTAMP): Comment text
         Example: 1. @maria_silva (150 likes, 2h): Que vídeo incrível! ❤️
         """
         try:
-            # Pattern: number. @username (likes likes, timestamp): text
-            pattern = r'^\d+\.\s*@(\w+)\s*\((\d+)\s*likes?,\s*([^)]+)\):\s*(.+)$'
-            match = re.match(pattern, line.strip())
+            match = _LINE_RE.match(line)
             
             if match:
                 username = match.group(1)
@@ -68,7 +72,8 @@ class TextParserService:
                 # Generate author name from username
                 author = self._username_to_author(username)
                 
-                return GeneratedComment(
+                # The regex already guarantees the field types (likes is \d+)
+                return GeneratedComment.model_construct(
                     author=author,
                     username=username,
                     text=text,
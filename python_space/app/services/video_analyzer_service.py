@@ -1,15 +1,43 @@
 """
 Video Analysis Service - Detecta momentos-chave e características do vídeo
 """
+import asyncio
 import cv2
 import numpy as np
+import queue
+import threading
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import logging
 from app.models.video_edit_schemas import KeyMoment, AnalysisResult
+from app.services.ffmpeg_utils import probe_streams
 
 logger = logging.getLogger(__name__)
 
+# Limites de itens retornados na análise
+MAX_KEY_MOMENTS = 20
+MAX_SCENE_CHANGES = 15
+
+# Amostragem de cada métrica
+SCENE_FRAME_STEP = 10  # Mudanças de cena: um frame a cada 10
+BRIGHTNESS_SAMPLES = 20
+MOTION_SAMPLES = 30
+
+# Frames são reduzidos (lado maior) antes das métricas: diferenças e médias
+# de um 1080p cabem no cache nesse tamanho e as estatísticas se mantêm
+ANALYSIS_MAX_SIDE = 320
+
+# Frames decodificados aguardando análise (limita a memória do pipeline)
+FRAME_QUEUE_SIZE = 16
+
+# Decodificação por hardware (NVDEC/QSV/VAAPI) quando o backend FFmpeg do
+# OpenCV suporta; sem aceleração disponível o OpenCV volta ao decoder de software.
+# CAP_PROP_HW_DEVICE não é aceito junto com VIDEO_ACCELERATION_ANY
+HW_DECODE_PARAMS = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+# Item da fila: (índice, frame BGR, want_key, want_scene, want_brightness, want_motion)
+_FrameItem = Tuple[int, np.ndarray, bool, bool, bool, bool]
+
 
 class VideoAnalyzerService:
     """Serviço para análise de vídeos e detecção de momentos-chave"""
@@ -29,22 +57,35 @@ class VideoAnalyzerService:
             AnalysisResult com dados da análise
         """
         try:
-            cap = cv2.VideoCapture(str(video_path))
+            # Extrair informações básicas (ffprobe lê só o container)
+            metadata = await self._probe_metadata(video_path)
             
-            # Extrair informações básicas
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            duration = frame_count / fps if fps > 0 else 0
+            cap = self._open_capture(video_path)
             
-            # Detectar momentos-chave
-            key_moments = await self._detect_key_moments(cap, fps)
-            scene_changes = await self._detect_scene_changes(cap, fps)
+            if metadata is not None:
+                fps = metadata["fps"]
+                frame_count = metadata["frame_count"]
+                width = metadata["width"]
+                height = metadata["height"]
+                duration = metadata["duration"]
+                has_audio = metadata["has_audio"]
+            else:
+                # Sem ffprobe: propriedades do OpenCV, que não detecta áudio
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                duration = frame_count / fps if fps > 0 else 0
+                has_audio = True
             
-            # Calcular métricas
-            avg_brightness = await self._calculate_average_brightness(cap)
-            motion_intensity = await self._calculate_motion_intensity(cap)
+            # Momentos-chave, mudanças de cena e métricas em uma única decodificação
+            # (fora do event loop: decodificação e análise bloqueiam)
+            (
+                key_moments,
+                scene_changes,
+                avg_brightness,
+                motion_intensity
+            ) = await asyncio.to_thread(self._analyze_single_pass, cap, fps, frame_count)
             
             cap.release()
             
@@ -53,7 +94,7 @@ class VideoAnalyzerService:
                 duration=duration,
                 resolution=f"{width}x{height}",
                 fps=fps,
-                has_audio=self._has_audio(video_path),
+                has_audio=has_audio,
                 key_moments=key_moments,
                 scene_changes=scene_changes,
                 average_brightness=avg_brightness,
@@ -64,145 +105,265 @@ class VideoAnalyzerService:
             logger.error(f"Erro ao analisar vídeo {video_path}: {e}")
             raise
     
-    async def _detect_key_moments(
-        self,
-        cap: cv2.VideoCapture,
-        fps: float
-    ) -> List[KeyMoment]:
-        """Detecta momentos-chave no vídeo"""
-        key_moments = []
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        
-        frame_idx = 0
-        prev_frame = None
+    def _open_capture(self, video_path: Path) -> cv2.VideoCapture:
+        """
+        Abre o vídeo pelo backend FFmpeg pedindo decodificação por hardware
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Converter para escala de cinza
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Detectar mudança de cena
-            if prev_frame is not None:
-                diff = cv2.absdiff(gray, prev_frame)
-                mean_diff = np.mean(diff)
-                
-                if mean_diff > self.scene_threshold:
-                    timestamp = frame_idx / fps
-                    key_moments.append(KeyMoment(
-                        timestamp=timestamp,
-                        type="scene_change",
-                        confidence=min(mean_diff / 100.0, 1.0),
-                        description=f"Scene change at {timestamp:.2f}s"
-                    ))
-            
-            prev_frame = gray
-            frame_idx += 1
+        Args:
+            video_path: Caminho do vídeo
             
-            # Processar apenas a cada 10 frames para performance
-            if frame_idx % 10 != 0:
-                continue
+        Returns:
+            VideoCapture aberto (decoder padrão se o backend FFmpeg falhar)
+        """
+        cap = cv2.VideoCapture(str(video_path), cv2.CAP_FFMPEG, HW_DECODE_PARAMS)
+        if cap.isOpened():
+            return cap
         
-        return key_moments[:20]  # Limitar a 20 momentos-chave
+        logger.debug(f"Backend FFmpeg indisponível para {video_path}, usando decoder padrão")
+        cap.release()
+        return cv2.VideoCapture(str(video_path))
     
-    async def _detect_scene_changes(
+    def _analyze_single_pass(
         self,
         cap: cv2.VideoCapture,
-        fps: float
-    ) -> List[float]:
-        """Detecta timestamps de mudanças de cena"""
-        scene_changes = []
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        fps: float,
+        frame_count: int
+    ) -> Tuple[List[KeyMoment], List[float], float, float]:
+        """
+        Calcula todas as métricas em uma única leitura sequencial do vídeo
         
-        frame_idx = 0
-        prev_frame = None
+        Pipeline em duas threads: _read_frames decodifica (grab em todo frame,
+        retrieve só nos frames que alguma métrica usa, sem seeks) e entrega por
+        uma fila limitada; esta thread reduz, converte para cinza uma vez e
+        calcula as métricas em buffers alocados no primeiro frame. Só esta
+        thread altera o estado das métricas.
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        - momentos-chave: diferença entre frames consecutivos (até MAX_KEY_MOMENTS)
+        - mudanças de cena: diferença a cada SCENE_FRAME_STEP frames (até MAX_SCENE_CHANGES)
+        - brilho médio: ~BRIGHTNESS_SAMPLES frames espaçados
+        - intensidade de movimento: diferença entre ~MOTION_SAMPLES frames espaçados
+        
+        Args:
+            cap: VideoCapture aberto
+            fps: Frames por segundo
+            frame_count: Total de frames informado pelo container
             
-            if prev_frame is not None:
-                diff = cv2.absdiff(gray, prev_frame)
-                mean_diff = np.mean(diff)
+        Returns:
+            Tupla (key_moments, scene_changes, average_brightness, motion_intensity)
+        """
+        brightness_step = max(1, frame_count // max(1, min(BRIGHTNESS_SAMPLES, frame_count)))
+        motion_step = max(1, frame_count // max(1, min(MOTION_SAMPLES, frame_count)))
+        
+        # Colunas paralelas; os KeyMoment só são criados no retorno
+        key_timestamps: List[float] = []
+        key_confidences: List[float] = []
+        scene_changes: List[float] = []
+        brightness_values: List[float] = []
+        motion_values: List[float] = []
+        
+        # Buffers reutilizados (alocados no primeiro frame decodificado)
+        small = gray = None
+        prev_key = prev_scene = prev_motion = None
+        has_prev_key = has_prev_scene = has_prev_motion = False
+        
+        frames: "queue.Queue[Optional[_FrameItem]]" = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        stop = threading.Event()
+        key_done = threading.Event()
+        scene_done = threading.Event()
+        reader_errors: List[Exception] = []
+        
+        reader = threading.Thread(
+            target=self._read_frames,
+            args=(
+                cap, frame_count, brightness_step, motion_step,
+                frames, stop, key_done, scene_done, reader_errors
+            ),
+            name="video-analyzer-reader",
+            daemon=True
+        )
+        reader.start()
+        
+        try:
+            while (item := frames.get()) is not None:
+                frame_idx, frame, want_key, want_scene, want_brightness, want_motion = item
+                # O leitor pode estar alguns frames atrás dos limites
+                want_key = want_key and len(key_timestamps) < MAX_KEY_MOMENTS
+                want_scene = want_scene and len(scene_changes) < MAX_SCENE_CHANGES
                 
-                if mean_diff > self.scene_threshold:
-                    timestamp = frame_idx / fps
-                    scene_changes.append(round(timestamp, 2))
-            
-            prev_frame = gray
-            frame_idx += 10  # Skip frames
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                if small is None:
+                    analysis_size = self._analysis_size(frame.shape[1], frame.shape[0])
+                    small = np.empty((analysis_size[1], analysis_size[0], 3), np.uint8)
+                    gray, prev_key, prev_scene, prev_motion = (
+                        np.empty(small.shape[:2], np.uint8) for _ in range(4)
+                    )
+                
+                cv2.resize(frame, analysis_size, dst=small, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=gray)
+                
+                if want_key:
+                    if has_prev_key:
+                        mean_diff = self._mean_abs_diff(gray, prev_key)
+                        if mean_diff > self.scene_threshold:
+                            key_timestamps.append(frame_idx / fps)
+                            key_confidences.append(min(mean_diff / 100.0, 1.0))
+                            if len(key_timestamps) >= MAX_KEY_MOMENTS:
+                                key_done.set()
+                    np.copyto(prev_key, gray)
+                    has_prev_key = True
+                
+                if want_scene:
+                    if has_prev_scene:
+                        mean_diff = self._mean_abs_diff(gray, prev_scene)
+                        if mean_diff > self.scene_threshold:
+                            scene_changes.append(round(frame_idx / fps, 2))
+                            if len(scene_changes) >= MAX_SCENE_CHANGES:
+                                scene_done.set()
+                    np.copyto(prev_scene, gray)
+                    has_prev_scene = True
+                
+                if want_brightness:
+                    brightness_values.append(cv2.mean(gray)[0])
+                
+                if want_motion:
+                    if has_prev_motion:
+                        motion_values.append(self._mean_abs_diff(gray, prev_motion))
+                    np.copyto(prev_motion, gray)
+                    has_prev_motion = True
+        finally:
+            # Libera o leitor caso esteja bloqueado na fila cheia
+            stop.set()
+            reader.join()
         
-        return scene_changes[:15]  # Limitar a 15 mudanças
-    
-    async def _calculate_average_brightness(
-        self,
-        cap: cv2.VideoCapture
-    ) -> float:
-        """Calcula brilho médio do vídeo"""
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        brightness_values = []
+        if reader_errors:
+            raise reader_errors[0]
         
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        sample_frames = min(20, frame_count)  # Sample 20 frames
-        step = max(1, frame_count // sample_frames)
+        # Valores calculados aqui já respeitam o schema: dispensa validação
+        key_moments = [
+            KeyMoment.model_construct(
+                timestamp=timestamp,
+                type="scene_change",
+                confidence=confidence,
+                description=f"Scene change at {timestamp:.2f}s"
+            )
+            for timestamp, confidence in zip(key_timestamps, key_confidences)
+        ]
         
-        for i in range(0, frame_count, step):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            ret, frame = cap.read()
-            if ret:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                brightness_values.append(np.mean(gray))
+        avg_brightness = float(np.mean(brightness_values)) if brightness_values else 0.0
+        # Normalizar movimento para 0-1
+        motion_intensity = min(float(np.mean(motion_values)) / 50.0, 1.0) if motion_values else 0.0
         
-        return float(np.mean(brightness_values)) if brightness_values else 0.0
+        return key_moments, scene_changes, avg_brightness, motion_intensity
     
-    async def _calculate_motion_intensity(
+    def _read_frames(
         self,
-        cap: cv2.VideoCapture
-    ) -> float:
-        """Calcula intensidade de movimento no vídeo (0-1)"""
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        motion_values = []
-        
-        prev_frame = None
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        sample_frames = min(30, frame_count)
-        step = max(1, frame_count // sample_frames)
-        
-        for i in range(0, frame_count, step):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            ret, frame = cap.read()
-            if ret:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        cap: cv2.VideoCapture,
+        frame_count: int,
+        brightness_step: int,
+        motion_step: int,
+        frames: "queue.Queue[Optional[_FrameItem]]",
+        stop: threading.Event,
+        key_done: threading.Event,
+        scene_done: threading.Event,
+        errors: List[Exception]
+    ) -> None:
+        """
+        Thread leitora do pipeline: decodifica em ordem e enfileira os frames
+        que alguma métrica usa, com as métricas que os querem. None marca o fim
+        """
+        try:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            frame_idx = 0
+            
+            while not stop.is_set():
+                want_key = not key_done.is_set()
+                want_scene = not scene_done.is_set()
+                sampling = frame_idx < frame_count
+                
+                # Nada mais a medir: não há por que ler o resto do vídeo
+                if not (want_key or want_scene or sampling):
+                    break
                 
-                if prev_frame is not None:
-                    diff = cv2.absdiff(gray, prev_frame)
-                    motion_values.append(np.mean(diff))
+                want_scene = want_scene and frame_idx % SCENE_FRAME_STEP == 0
+                want_brightness = sampling and frame_idx % brightness_step == 0
+                want_motion = sampling and frame_idx % motion_step == 0
                 
-                prev_frame = gray
+                if not cap.grab():
+                    break
+                
+                if want_key or want_scene or want_brightness or want_motion:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    item = (frame_idx, frame, want_key, want_scene, want_brightness, want_motion)
+                    if not self._put_frame(frames, item, stop):
+                        return
+                
+                frame_idx += 1
+        except Exception as e:
+            errors.append(e)
         
-        if motion_values:
-            avg_motion = np.mean(motion_values)
-            # Normalizar para 0-1
-            return min(avg_motion / 50.0, 1.0)
-        return 0.0
+        self._put_frame(frames, None, stop)
+    
+    def _put_frame(
+        self,
+        frames: "queue.Queue[Optional[_FrameItem]]",
+        item: Optional[_FrameItem],
+        stop: threading.Event
+    ) -> bool:
+        """Enfileira respeitando o limite da fila; False se a análise foi interrompida"""
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _mean_abs_diff(self, current: np.ndarray, previous: np.ndarray) -> float:
+        """
+        Diferença absoluta média entre dois frames em cinza. cv2.norm L1 soma
+        |a - b| em uma só passada SIMD, sem materializar a imagem de diferença
+        """
+        return cv2.norm(current, previous, cv2.NORM_L1) / current.size
+    
+    def _analysis_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Tamanho (w, h) de análise: lado maior até ANALYSIS_MAX_SIDE, mantendo a proporção"""
+        scale = min(1.0, ANALYSIS_MAX_SIDE / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
     
-    def _has_audio(self, video_path: Path) -> bool:
-        """Verifica se o vídeo tem áudio"""
+    async def _probe_metadata(self, video_path: Path) -> Optional[dict]:
+        """
+        Metadados do vídeo via ffprobe (fps, frame_count, width, height,
+        duration, has_audio); None se o ffprobe não estiver disponível ou falhar
+        """
+        probe = await probe_streams(video_path)
+        if probe is None:
+            return None
+        
         try:
-            # Simples verificação com opencv (não é 100% precisa)
-            cap = cv2.VideoCapture(str(video_path))
-            # OpenCV não detecta áudio diretamente, retornar True por padrão
-            # Em produção, usar ffprobe ou moviepy para detecção precisa
-            cap.release()
-            return True
-        except:
-            return False
+            streams = probe.get("streams", [])
+            video = next(s for s in streams if s.get("codec_type") == "video")
+            
+            num, _, den = video.get("avg_frame_rate", "0/0").partition("/")
+            fps = float(num) / float(den) if float(den or 0) else 0.0
+            duration = float(probe.get("format", {}).get("duration") or video.get("duration") or 0.0)
+            # A duração do container é mais confiável que nb_frames (ausente em
+            # mkv/webm, errado em VFR ou arquivos mal muxados) e define a amostragem
+            if duration > 0 and fps > 0:
+                frame_count = round(duration * fps)
+            else:
+                frame_count = int(video.get("nb_frames") or 0)
+            
+            return {
+                "fps": fps,
+                "frame_count": frame_count,
+                "width": int(video["width"]),
+                "height": int(video["height"]),
+                "duration": duration,
+                "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+            }
+        except (ValueError, KeyError, StopIteration):
+            return None
     
     async def find_best_cuts(
         self,
@@ -1,77 +1,26 @@
+import asyncio
+import os
+import shutil
 import zipfile
 import logging
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Extensions whose payload is already compressed (deflating them again is wasted CPU)
+PRECOMPRESSED_SUFFIXES = frozenset({'.mp4', '.png', '.jpg', '.jpeg'})
 
-class ZipService:
-    """Service for creating ZIP packages with video, comments, and images"""
-    
-    def create_package(
-        self,
-        video_path: Path,
-        comments_txt_path: Path,
-        image_paths: List[Path],
-        output_path: Path
-    ) -> Path:
-        """
-        Create a ZIP package containing video, comments txt, images, and README
-        
-        Args:
-            video_path: Path to video file
-            comments_txt_path: Path to comentarios.txt
-            image_paths: List of paths to Instagram PNG images
-            output_path: Path for the output ZIP file
-            
-        Returns:
-            Path to the created ZIP file
-        """
-        try:
-            output_path = Path(output_path)
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # Add video with fixed name "video.mp4"
-                if video_path.exists():
-                    zipf.write(video_path, "video.mp4")
-                    logger.info("Added video.mp4 to ZIP")
-                else:
-                    logger.warning(f"Video file not found: {video_path}")
-                
-                # Add comments txt
-                if comments_txt_path.exists():
-                    zipf.write(comments_txt_path, "comentarios.txt")
-                    logger.info("Added comentarios.txt to ZIP")
-                else:
-                    logger.warning(f"Comments file not found: {comments_txt_path}")
-                
-                # Add all images
-                for i, image_path in enumerate(image_paths, 1):
-                    if image_path.exists():
-                        zipf.write(image_path, image_path.name)
-                    else:
-                        logger.warning(f"Image file not found: {image_path}")
-                
-                logger.info(f"Added {len(image_paths)} images to ZIP")
-                
-                # Add README disclaimer
-                readme_content = self._generate_readme()
-                zipf.writestr("README.txt", readme_content)
-                logger.info("Added README.txt to ZIP")
-            
-            logger.info(f"ZIP package created successfully: {output_path}")
-            return output_path
-            
-        except Exception as e:
-            logger.error(f"Error creating ZIP package: {str(e)}")
-            raise
-    
-    def _generate_readme(self) -> str:
-        """Generate README content with disclaimer"""
-        return f"""╔═══════════════════════════════════════════════════════════════╗
+# Deflate level for every deflated member (the text files: fastest level is enough)
+TEXT_COMPRESS_LEVEL = 1
+
+# Read size used when streaming files into a ZIP
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+# README disclaimer; only the generation timestamp between the two parts varies
+_README_PREFIX = """╔═══════════════════════════════════════════════════════════════╗
 ║          CONTEÚDO GERADO POR INTELIGÊNCIA ARTIFICIAL          ║
 ╚═══════════════════════════════════════════════════════════════╝
 
@@ -119,7 +68,9 @@ geradas artificialmente.
 INFORMAÇÕES TÉCNICAS
 ═══════════════════════════════════════════════════════════════
 
-Gerado em: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+Gerado em: """
+
+_README_SUFFIX = """
 Ferramenta: TikTok Downloader + AI Comments
 IA: Ollama (Llama 3)
 Imagens: Pillow (Python Imaging Library)
@@ -130,6 +81,175 @@ Para mais informações ou suporte, consulte a documentação do projeto.
 
 ═══════════════════════════════════════════════════════════════
 """
+
+
+class _ChunkBuffer:
+    """Write-only sink that lets ZipFile output be drained chunk by chunk"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipService:
+    """Service for creating ZIP packages with video, comments, and images"""
+    
+    def create_package(
+        self,
+        video_path: Path,
+        comments_txt_path: Path,
+        image_paths: List[Path],
+        output_path: Path
+    ) -> Path:
+        """
+        Create a ZIP package containing video, comments txt, images, and README
+        
+        Args:
+            video_path: Path to video file
+            comments_txt_path: Path to comentarios.txt
+            image_paths: List of paths to Instagram PNG images
+            output_path: Path for the output ZIP file
+            
+        Returns:
+            Path to the created ZIP file
+        """
+        try:
+            output_path = Path(output_path)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=TEXT_COMPRESS_LEVEL) as zipf:
+                # Add video ("video.mp4"), comments txt and all images
+                for source, arcname in self._package_entries(video_path, comments_txt_path, image_paths):
+                    with open(source, 'rb') as src, zipf.open(self._member_info(source, arcname), 'w') as dest:
+                        shutil.copyfileobj(src, dest, STREAM_CHUNK_SIZE)
+                
+                logger.info(f"Added {len(image_paths)} images to ZIP")
+                
+                # Add README disclaimer
+                readme_content = self._generate_readme()
+                zipf.writestr("README.txt", readme_content)
+                logger.info("Added README.txt to ZIP")
+            
+            logger.info(f"ZIP package created successfully: {output_path}")
+            return output_path
+            
+        except Exception as e:
+            logger.error(f"Error creating ZIP package: {str(e)}")
+            raise
+    
+    async def create_package_async(
+        self,
+        video_path: Path,
+        comments_txt_path: Path,
+        image_paths: List[Path],
+        output_path: Path
+    ) -> Path:
+        """
+        Create the ZIP package in a worker thread so async handlers keep the event loop free
+        
+        Args:
+            video_path: Path to video file
+            comments_txt_path: Path to comentarios.txt
+            image_paths: List of paths to Instagram PNG images
+            output_path: Path for the output ZIP file
+            
+        Returns:
+            Path to the created ZIP file
+        """
+        return await asyncio.to_thread(
+            self.create_package, video_path, comments_txt_path, image_paths, output_path
+        )
+    
+    def iter_package(
+        self,
+        video_path: Path,
+        comments_txt_path: Path,
+        image_paths: List[Path],
+        chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        Stream a ZIP package (same layout as create_package) without touching disk
+        
+        Args:
+            video_path: Path to video file
+            comments_txt_path: Path to comentarios.txt
+            image_paths: List of paths to Instagram PNG images
+            chunk_size: Read size used when copying each file
+            
+        Yields:
+            Consecutive chunks of the ZIP archive
+        """
+        buffer = _ChunkBuffer()
+        
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=TEXT_COMPRESS_LEVEL) as zipf:
+            for source, arcname in self._package_entries(video_path, comments_txt_path, image_paths):
+                with open(source, 'rb') as src, zipf.open(self._member_info(source, arcname), 'w') as dest:
+                    while chunk := src.read(chunk_size):
+                        dest.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            
+            zipf.writestr("README.txt", self._generate_readme())
+        
+        yield buffer.drain()
+        logger.info("ZIP package streamed successfully")
+    
+    def _member_info(self, source: Path, arcname: str) -> zipfile.ZipInfo:
+        """ZipInfo for a file member (mtime from disk, per-member compression)"""
+        info = zipfile.ZipInfo.from_file(source, arcname)
+        info.compress_type = self._compress_type(arcname)
+        # ZipInfo.from_file leaves the level unset (zlib default 6), not the archive's
+        info._compresslevel = TEXT_COMPRESS_LEVEL
+        return info
+    
+    def _compress_type(self, arcname: str) -> int:
+        """Store already-compressed media as-is, deflate everything else"""
+        if Path(arcname).suffix.lower() in PRECOMPRESSED_SUFFIXES:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+    
+    def _package_entries(
+        self,
+        video_path: Path,
+        comments_txt_path: Path,
+        image_paths: List[Path]
+    ) -> List[Tuple[Path, str]]:
+        """List (source, arcname) pairs for the package, skipping missing files"""
+        entries = []
+        
+        if video_path.exists():
+            entries.append((video_path, "video.mp4"))
+        else:
+            logger.warning(f"Video file not found: {video_path}")
+        
+        if comments_txt_path.exists():
+            entries.append((comments_txt_path, "comentarios.txt"))
+        else:
+            logger.warning(f"Comments file not found: {comments_txt_path}")
+        
+        for image_path in image_paths:
+            if image_path.exists():
+                entries.append((image_path, image_path.name))
+            else:
+                logger.warning(f"Image file not found: {image_path}")
+        
+        return entries
+    
+    def _generate_readme(self) -> str:
+        """Generate README content with disclaimer"""
+        return f"{_README_PREFIX}{datetime.now():%Y-%m-%d %H:%M:%S}{_README_SUFFIX}"
     
     def cleanup_temp_files(self, file_paths: List[Path]):
         """
@@ -140,10 +260,11 @@ Para mais informações ou suporte, consulte a documentação do projeto.
         """
         for file_path in file_paths:
             try:
-                file_path = Path(file_path)
-                if file_path.exists():
-                    file_path.unlink()
-                    logger.debug(f"Deleted temp file: {file_path}")
+                # One syscall; a missing file is already cleaned up
+                os.unlink(file_path)
+                logger.debug(f"Deleted temp file: {file_path}")
+            except FileNotFoundError:
+                continue
             except Exception as e:
                 logger.warning(f"Failed to delete temp file {file_path}: {str(e)}")
 
@@ -3,13 +3,89 @@
 Script para verificar se a autenticação do TikTok está funcionando
 """
 
+import os
 import yt_dlp
 import sys
 from pathlib import Path
+from yt_dlp.cookies import YoutubeDLCookieJar
 
-def check_tiktok_auth(browser='chrome'):
+# Cookies extraídos do navegador ficam em cache: ler um cookies.txt é muito mais
+# rápido que abrir (e descriptografar) o banco de cookies do perfil a cada execução
+COOKIE_CACHE_DIR = Path.home() / ".cache" / "tiktok-downloader"
+
+# Só os cookies do TikTok vão para o cache (nunca o jar inteiro do navegador)
+COOKIE_DOMAIN = "tiktok.com"
+
+
+def _cookie_cache_file(browser):
+    """Caminho do cookies.txt em cache para o navegador"""
+    return COOKIE_CACHE_DIR / f"cookies-{browser}.txt"
+
+
+def _build_ydl_opts(browser, cookie_file, use_cache):
+    """
+    Configuração mínima do yt-dlp: só o JSON do vídeo, sem resolver/testar formatos
+    
+    Com cache, lê o cookies.txt (só TikTok, modo 0600); sem cache, lê o navegador
+    sem 'cookiefile', para o yt-dlp não gravar o jar do navegador ao fechar
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,  # Não baixar, só extrair info
+        'check_formats': False,
+    }
+    if use_cache:
+        ydl_opts['cookiefile'] = str(cookie_file)
+    else:
+        ydl_opts['cookiesfrombrowser'] = (browser, None, None, None)
+    return ydl_opts
+
+
+def _is_tiktok_cookie(cookie):
+    """Cookie de tiktok.com ou de um subdomínio"""
+    domain = cookie.domain.lstrip('.')
+    return domain == COOKIE_DOMAIN or domain.endswith(f".{COOKIE_DOMAIN}")
+
+
+def _save_tiktok_cookies(cookiejar, cookie_file):
+    """
+    Grava apenas os cookies do TikTok no cache
+    
+    O arquivo é criado já com modo 0600 (nunca fica legível por outros usuários)
+    """
+    tiktok_jar = YoutubeDLCookieJar()
+    for cookie in cookiejar:
+        if _is_tiktok_cookie(cookie):
+            tiktok_jar.set_cookie(cookie)
+    
+    cookie_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    fd = os.open(cookie_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)  # Arquivo pré-existente: corrige o modo também
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        tiktok_jar.save(f)
+
+
+def _extract_test_info(test_url, ydl_opts, cookie_file=None):
+    """
+    Extrai as informações do vídeo de teste (process=False pula o processamento de formatos)
+    
+    Com cookie_file, grava no cache os cookies do TikTok após uma extração bem-sucedida
+    """
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(test_url, download=False, process=False)
+        if cookie_file is not None:
+            _save_tiktok_cookies(ydl.cookiejar, cookie_file)
+        return info
+
+
+def check_tiktok_auth(browser='chrome', refresh_cookies=False):
     """
     Testa se conseguimos acessar vídeos do TikTok usando cookies do navegador
+    
+    Args:
+        browser: Navegador de onde ler os cookies
+        refresh_cookies: Ignora o cookies.txt em cache e relê o navegador
     """
     print("=" * 60)
     print("🔍 Verificador de Autenticação TikTok")
@@ -23,33 +99,43 @@ def check_tiktok_auth(browser='chrome'):
     print(f"🎬 URL de teste: {test_url}")
     print()
     
-    # Configuração mínima do yt-dlp
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'skip_download': True,  # Não baixar, só extrair info
-        'cookiesfrombrowser': (browser, None, None, None),
-    }
+    cookie_file = _cookie_cache_file(browser)
+    use_cache = cookie_file.exists() and not refresh_cookies
     
-    print("⏳ Tentando acessar TikTok com cookies do navegador...")
+    if use_cache:
+        # Cache de versões anteriores pode ter sido criado com o umask padrão
+        cookie_file.chmod(0o600)
+        print(f"⏳ Tentando acessar TikTok com cookies em cache ({cookie_file})...")
+    else:
+        print("⏳ Tentando acessar TikTok com cookies do navegador...")
     print()
     
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(test_url, download=False)
+        try:
+            if use_cache:
+                info = _extract_test_info(test_url, _build_ydl_opts(browser, cookie_file, True))
+            else:
+                info = _extract_test_info(test_url, _build_ydl_opts(browser, cookie_file, False), cookie_file)
+        except yt_dlp.utils.DownloadError:
+            if not use_cache:
+                raise
+            # Cache expirado: tenta de novo lendo o navegador
+            print("⚠️  Cookies em cache falharam, relendo o navegador...")
+            print()
+            info = _extract_test_info(test_url, _build_ydl_opts(browser, cookie_file, False), cookie_file)
+        
+        if info:
+            print("✅ SUCESSO! Autenticação funcionando!")
+            print()
+            print("📊 Informações do vídeo:")
+            print(f"   Título: {info.get('title', 'N/A')}")
+            print(f"   Autor: {info.get('uploader', 'N/A')}")
+            print(f"   Views: {info.get('view_count', 'N/A'):,}")
+            print(f"   Likes: {info.get('like_count', 'N/A'):,}")
+            print()
+            print("🎉 Você pode baixar vídeos do TikTok!")
+            return True
             
-            if info:
-                print("✅ SUCESSO! Autenticação funcionando!")
-                print()
-                print("📊 Informações do vídeo:")
-                print(f"   Título: {info.get('title', 'N/A')}")
-                print(f"   Autor: {info.get('uploader', 'N/A')}")
-                print(f"   Views: {info.get('view_count', 'N/A'):,}")
-                print(f"   Likes: {info.get('like_count', 'N/A'):,}")
-                print()
-                print("🎉 Você pode baixar vídeos do TikTok!")
-                return True
-                
     except yt_dlp.utils.DownloadError as e:
         error_msg = str(e)
         print("❌ FALHA na autenticação!")
@@ -100,9 +186,15 @@ def main():
         help='Navegador a ser usado (padrão: chrome)'
     )
     
+    parser.add_argument(
+        '--refresh-cookies',
+        action='store_true',
+        help='Ignora o cookies.txt em cache e relê os cookies do navegador'
+    )
+    
     args = parser.parse_args()
     
-    success = check_tiktok_auth(args.browser)
+    success = check_tiktok_auth(args.browser, refresh_cookies=args.refresh_cookies)
     
     print()
     print("=" * 60)
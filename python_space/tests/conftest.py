@@ -1,20 +1,22 @@
 import pytest
-import tempfile
-import shutil
-from pathlib import Path
+from pytest_asyncio import is_async_test
 from app.models.comment_schemas import GeneratedComment
 
 
-@pytest.fixture
-def temp_dir():
-    """Create a temporary directory for tests"""
-    tmpdir = tempfile.mkdtemp()
-    yield Path(tmpdir)
-    # Cleanup
-    shutil.rmtree(tmpdir, ignore_errors=True)
+def pytest_configure(config):
+    """Register custom markers (run the suite in parallel with: pytest -n auto)"""
+    config.addinivalue_line("markers", "slow: CPU-heavy tests (image rendering); skip with -m 'not slow'")
 
 
-@pytest.fixture
+def pytest_collection_modifyitems(items):
+    """Run every async test on one session-wide event loop (no loop setup/teardown per test)"""
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
+
+@pytest.fixture(scope="session")
 def sample_video_info():
     """Sample video info from yt-dlp"""
     return {
@@ -29,7 +31,7 @@ def sample_video_info():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_metadata():
     """Sample extracted metadata"""
     return {
@@ -39,10 +41,10 @@ def sample_metadata():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_comments():
-    """Sample generated comments"""
-    return [
+    """Sample generated comments (shared by the session: a tuple, so tests can't mutate it)"""
+    return (
         GeneratedComment(
             author="Maria Silva",
             username="maria_silva",
@@ -64,13 +66,12 @@ def sample_comments():
             likes=320,
             timestamp="1d"
         ),
-    ]
+    )
 
 
-@pytest.fixture
-def sample_comments_txt(temp_dir):
-    """Create a sample comentarios.txt file"""
-    txt_path = temp_dir / "comentarios.txt"
+@pytest.fixture(scope="session")
+def _comments_txt_bytes():
+    """UTF-8 content of the sample comentarios.txt, encoded once per session"""
     content = """1. @maria_silva (150 likes, 2h): Que vídeo incrível! Amei demais ❤️
 2. @joao_pedro (45 likes, 5 min): Como faz isso? Me ensina!
 3. @ana_costa (320 likes, 1d): Salvei pra fazer depois 🔖
@@ -86,12 +87,18 @@ def sample_comments_txt(temp_dir):
 13. @fernanda_lima (456 likes, 3d): Sensacional! 🎉
 14. @thiago_pereira (123 likes, 4h): Melhor vídeo que vi hoje!
 15. @amanda_santos (201 likes, 2h): Vou fazer agora mesmo! ❤️"""
-    
-    txt_path.write_text(content, encoding='utf-8')
-    return txt_path
+    return content.encode('utf-8')
 
 
 @pytest.fixture
+def sample_comments_txt(tmp_path, _comments_txt_bytes):
+    """Create a sample comentarios.txt file"""
+    txt_path = tmp_path / "comentarios.txt"
+    txt_path.write_bytes(_comments_txt_bytes)
+    return txt_path
+
+
+@pytest.fixture(scope="session")
 def mock_ollama_response():
     """Mock Ollama API response"""
     return {
@@ -121,9 +128,9 @@ def mock_ollama_response():
 
 
 @pytest.fixture
-def sample_video_file(temp_dir):
+def sample_video_file(tmp_path):
     """Create a dummy video file for testing"""
-    video_path = temp_dir / "test_video.mp4"
+    video_path = tmp_path / "test_video.mp4"
     # Create a minimal valid MP4 file (just header)
     video_path.write_bytes(b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom')
     return video_path
@@ -0,0 +1,142 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.ai_comments_service import AICommentsService
+from app.models.comment_schemas import GeneratedComment
+
+
+@pytest.fixture
+def ai_service():
+    """Fixture para o serviço de comentários"""
+    return AICommentsService()
+
+
+def _chat_stream(content: str, chunk_size: int = 16):
+    """Build a fake streamed Ollama chat response for content"""
+    async def stream():
+        for i in range(0, len(content), chunk_size):
+            yield {"message": {"role": "assistant", "content": content[i:i + chunk_size]}}
+    return stream()
+
+
+@pytest.fixture
+def mock_ollama_chat(mock_ollama_response):
+    """Mock of AsyncClient.chat streaming the same JSON payload on every call"""
+    return AsyncMock(side_effect=lambda **kwargs: _chat_stream(mock_ollama_response["response"]))
+
+
+def test_parse_ollama_response(ai_service, mock_ollama_response):
+    """Test parsing comments out of an Ollama response"""
+    comments = ai_service._parse_ollama_response(mock_ollama_response["response"], 2)
+    
+    assert len(comments) == 2
+    assert all(isinstance(c, GeneratedComment) for c in comments)
+    assert comments[0].username == "maria_silva"
+    assert comments[1].likes == 45
+
+
+def test_parse_ollama_response_without_json(ai_service):
+    """Test that a response without JSON yields no comments"""
+    assert ai_service._parse_ollama_response("Desculpe, não posso ajudar.", 5) == []
+
+
+@pytest.mark.asyncio
+async def test_generate_with_ollama_shards_requests(ai_service, mock_ollama_chat):
+    """Test that a large request is split into concurrent shards"""
+    with patch.object(ai_service._client, 'chat', new=mock_ollama_chat) as mock_chat:
+        comments = await ai_service._generate_with_ollama("Título: Teste", 15)
+    
+    # 15 comments -> 3 shards of 5
+    assert mock_chat.await_count == 3
+    assert len(comments) == 15
+    # Identical comments from different shards are kept once, the rest is fallback
+    assert [c.username for c in comments].count("maria_silva") == 1
+    assert [c.username for c in comments[:2]] == ["maria_silva", "joao_pedro"]
+
+
+@pytest.mark.asyncio
+async def test_request_comments_uses_static_system_prompt(ai_service, mock_ollama_chat):
+    """Test that instructions go in the system message and only the context varies"""
+    with patch.object(ai_service._client, 'chat', new=mock_ollama_chat) as mock_chat:
+        await ai_service._request_comments("Título: Vídeo A", 5)
+        await ai_service._request_comments("Título: Vídeo B", 5)
+    
+    first, second = (call.kwargs["messages"] for call in mock_chat.await_args_list)
+    assert first[0] == second[0]
+    assert first[0]["role"] == "system"
+    assert first[1] == {"role": "user", "content": "Título: Vídeo A"}
+
+
+@pytest.mark.asyncio
+async def test_request_comments_stops_after_json(ai_service, mock_ollama_response):
+    """Test that streaming stops once the JSON object is complete"""
+    content = mock_ollama_response["response"].strip() + "\n\nEspero que goste! {nota}"
+    with patch.object(ai_service._client, 'chat', new=AsyncMock(return_value=_chat_stream(content))) as mock_chat:
+        comments = await ai_service._request_comments("Título: Teste", 5)
+    
+    assert [c.username for c in comments] == ["maria_silva", "joao_pedro"]
+    assert mock_chat.await_args.kwargs["stream"] is True
+    assert mock_chat.await_args.kwargs["options"]["num_predict"] < 2000
+
+
+@pytest.mark.asyncio
+async def test_generate_with_ollama_all_shards_fail(ai_service):
+    """Test that Ollama failures produce an empty list (caller falls back)"""
+    with patch.object(ai_service._client, 'chat', new=AsyncMock(side_effect=ConnectionError("offline"))):
+        comments = await ai_service._generate_with_ollama("Título: Teste", 10)
+    
+    assert comments == []
+
+
+@pytest.mark.asyncio
+async def test_generate_with_ollama_cacheable(ai_service, mock_ollama_chat):
+    """Test that cacheable requests reuse comments for the same context"""
+    with patch.object(ai_service._client, 'chat', new=mock_ollama_chat) as mock_chat:
+        first = await ai_service._generate_with_ollama("Título: Teste", 5, cacheable=True)
+        second = await ai_service._generate_with_ollama("Título: Teste", 5, cacheable=True)
+        await ai_service._generate_with_ollama("Título: Teste", 5)
+    
+    assert first == second
+    # The cached call skips Ollama, the non-cacheable one does not
+    assert mock_chat.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_with_ollama_coalesces_concurrent_calls(ai_service, mock_ollama_chat):
+    """Test that identical concurrent requests share a generation only when cacheable"""
+    with patch.object(ai_service._client, 'chat', new=mock_ollama_chat) as mock_chat:
+        first, second = await asyncio.gather(
+            ai_service._generate_with_ollama("Título: Teste", 5, cacheable=True),
+            ai_service._generate_with_ollama("Título: Teste", 5, cacheable=True),
+        )
+    
+    assert first == second
+    assert mock_chat.await_count == 1
+    assert ai_service._inflight == {}
+    
+    # Sampling at temperature > 0: each caller gets its own generation
+    mock_ollama_chat.reset_mock()
+    with patch.object(ai_service._client, 'chat', new=mock_ollama_chat) as mock_chat:
+        await asyncio.gather(
+            ai_service._generate_with_ollama("Título: Outro", 5),
+            ai_service._generate_with_ollama("Título: Outro", 5),
+        )
+    
+    assert mock_chat.await_count == 2
+
+
+def test_fallback_comments(ai_service):
+    """Test fallback comment generation"""
+    comments = ai_service._fallback_comments(20)
+    
+    assert len(comments) == 20
+    assert all(c.likes >= 0 for c in comments)
+
+
+def test_save_to_txt(ai_service, sample_comments, tmp_path):
+    """Test saving comments in the comentarios.txt format"""
+    txt_path = ai_service._save_to_txt(sample_comments, tmp_path / "comentarios.txt")
+    
+    lines = txt_path.read_text(encoding='utf-8').split("\n")
+    assert len(lines) == 3
+    assert lines[0] == "1. @maria_silva (150 likes, 2h): Que vídeo incrível! Amei demais ❤️"
@@ -1,6 +1,7 @@
 import pytest
 from pathlib import Path
-from unittest.mock import Mock, patch, MagicMock
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
 from app.services.audio_transcription_service import AudioTranscriptionService
 from app.models.story_video_schemas import TranscriptionSegment
 
@@ -22,28 +23,25 @@ def mock_audio_file(tmp_path):
 @pytest.fixture
 def mock_whisper_segments():
     """Mock de segmentos retornados pelo Whisper"""
-    segment1 = Mock()
-    segment1.text = "Olá, este é o primeiro segmento do áudio."
-    segment1.start = 0.0
-    segment1.end = 3.5
-    
-    segment2 = Mock()
-    segment2.text = "Aqui temos o segundo segmento com mais informações."
-    segment2.start = 3.5
-    segment2.end = 8.2
+    segment1 = SimpleNamespace(text="Olá, este é o primeiro segmento do áudio.", start=0.0, end=3.5)
+    segment2 = SimpleNamespace(text="Aqui temos o segundo segmento com mais informações.", start=3.5, end=8.2)
     
     return [segment1, segment2]
 
 
-@pytest.mark.asyncio
-async def test_transcribe_audio_success(transcription_service, mock_audio_file, mock_whisper_segments):
-    """Testa transcrição bem-sucedida de áudio"""
+@pytest.fixture
+def whisper_mock_pair(mock_whisper_segments):
+    """Modelo Whisper mock (transcribe devolve os segmentos mock) e o info da transcrição"""
     mock_model = MagicMock()
-    mock_info = Mock()
-    mock_info.language = "pt"
-    mock_info.language_probability = 0.95
-    
+    mock_info = SimpleNamespace(language="pt", language_probability=0.95)
     mock_model.transcribe.return_value = (mock_whisper_segments, mock_info)
+    return mock_model, mock_info
+
+
+@pytest.mark.asyncio
+async def test_transcribe_audio_success(transcription_service, mock_audio_file, whisper_mock_pair):
+    """Testa transcrição bem-sucedida de áudio"""
+    mock_model, _ = whisper_mock_pair
     
     with patch.object(transcription_service, '_load_model', return_value=mock_model):
         segments = await transcription_service.transcribe_audio(mock_audio_file)
@@ -72,15 +70,14 @@ async def test_transcribe_audio_file_not_found(transcription_service):
 @pytest.mark.asyncio
 async def test_transcribe_extracts_keywords(transcription_service, mock_audio_file):
     """Testa extração de keywords dos segmentos"""
-    mock_segment = Mock()
-    mock_segment.text = "Este é um teste com palavras importantes e relevantes"
-    mock_segment.start = 0.0
-    mock_segment.end = 5.0
+    mock_segment = SimpleNamespace(
+        text="Este é um teste com palavras importantes e relevantes",
+        start=0.0,
+        end=5.0
+    )
     
     mock_model = MagicMock()
-    mock_info = Mock()
-    mock_info.language = "pt"
-    mock_info.language_probability = 0.9
+    mock_info = SimpleNamespace(language="pt", language_probability=0.9)
     
     mock_model.transcribe.return_value = ([mock_segment], mock_info)
     
@@ -98,10 +95,22 @@ async def test_transcribe_extracts_keywords(transcription_service, mock_audio_fi
     assert "um" not in keywords
 
 
+@pytest.mark.asyncio
+async def test_transcribe_keywords_keep_compound_words(transcription_service, mock_audio_file):
+    """Testa que hífen e apóstrofo internos não quebram a palavra"""
+    mock_segment = SimpleNamespace(text="Levei o guarda-chuva, e a caixa d'água!", start=0.0, end=3.0)
+    mock_model = MagicMock()
+    mock_model.transcribe.return_value = ([mock_segment], SimpleNamespace(language="pt", language_probability=0.9))
+    
+    with patch.object(transcription_service, '_load_model', return_value=mock_model):
+        segments = await transcription_service.transcribe_audio(mock_audio_file)
+    
+    assert segments[0].keywords == ["levei", "guarda-chuva", "caixa", "d'água"]
+
+
 def test_get_audio_duration_with_soundfile(transcription_service, mock_audio_file):
     """Testa obtenção de duração do áudio usando soundfile"""
-    mock_info = Mock()
-    mock_info.duration = 45.5
+    mock_info = SimpleNamespace(duration=45.5)
     
     with patch('app.services.audio_transcription_service.sf') as mock_sf:
         mock_sf.info.return_value = mock_info
@@ -110,29 +119,23 @@ def test_get_audio_duration_with_soundfile(transcription_service, mock_audio_fil
     assert duration == 45.5
 
 
-def test_get_audio_duration_fallback_moviepy(transcription_service, mock_audio_file):
-    """Testa fallback para MoviePy quando soundfile não disponível"""
-    mock_audio = Mock()
-    mock_audio.duration = 60.0
+def test_get_audio_duration_fallback_ffprobe(transcription_service, mock_audio_file):
+    """Testa fallback para ffprobe quando soundfile não disponível"""
+    mock_result = SimpleNamespace(stdout="60.0\n")
     
-    with patch('app.services.audio_transcription_service.sf', side_effect=ImportError):
-        with patch('app.services.audio_transcription_service.AudioFileClip') as mock_clip:
-            mock_clip.return_value = mock_audio
+    with patch('app.services.audio_transcription_service.sf', None):
+        with patch('app.services.audio_transcription_service.subprocess.run', return_value=mock_result) as mock_run:
             duration = transcription_service.get_audio_duration(mock_audio_file)
     
     assert duration == 60.0
-    mock_audio.close.assert_called_once()
+    assert mock_run.call_args.args[0][0] == "ffprobe"
 
 
 @pytest.mark.asyncio
-async def test_transcribe_with_specific_language(transcription_service, mock_audio_file, mock_whisper_segments):
+async def test_transcribe_with_specific_language(transcription_service, mock_audio_file, whisper_mock_pair):
     """Testa transcrição com idioma específico"""
-    mock_model = MagicMock()
-    mock_info = Mock()
+    mock_model, mock_info = whisper_mock_pair
     mock_info.language = "en"
-    mock_info.language_probability = 0.98
-    
-    mock_model.transcribe.return_value = (mock_whisper_segments, mock_info)
     
     with patch.object(transcription_service, '_load_model', return_value=mock_model):
         await transcription_service.transcribe_audio(mock_audio_file, language="en")
@@ -141,3 +144,27 @@ async def test_transcribe_with_specific_language(transcription_service, mock_aud
     call_args = mock_model.transcribe.call_args
     assert call_args.kwargs['language'] == "en"
 
+
+@pytest.mark.asyncio
+async def test_stream_segments_yields_in_order(transcription_service, mock_audio_file, mock_whisper_segments):
+    """Testa que os segmentos são emitidos um a um, na ordem do áudio"""
+    mock_model = MagicMock()
+    mock_info = SimpleNamespace(language="pt", language_probability=0.95)
+    
+    mock_model.transcribe.return_value = (iter(mock_whisper_segments), mock_info)
+    
+    with patch.object(transcription_service, '_load_model', return_value=mock_model):
+        start_times = [
+            segment.start_time
+            async for segment in transcription_service.stream_segments(mock_audio_file)
+        ]
+    
+    assert start_times == [0.0, 3.5]
+
+
+@pytest.mark.asyncio
+async def test_stream_segments_propagates_errors(transcription_service, mock_audio_file):
+    """Testa que erros do Whisper chegam ao consumidor"""
+    with patch.object(transcription_service, '_load_model', side_effect=RuntimeError("boom")):
+        with pytest.raises(RuntimeError):
+            await transcription_service.transcribe_audio(mock_audio_file)
@@ -11,6 +11,13 @@ def matcher_service():
     return ImageMatcherService(min_confidence=0.3)
 
 
+@pytest.fixture
+def mock_ollama():
+    """Patch de ollama.generate compartilhado pelos testes; cada teste define a resposta"""
+    with patch('app.services.image_matcher_service.ollama.generate') as mock_generate:
+        yield mock_generate
+
+
 @pytest.fixture
 def sample_images(tmp_path):
     """Cria imagens de exemplo"""
@@ -24,6 +31,12 @@ def sample_images(tmp_path):
     return images_dir
 
 
+@pytest.fixture
+def available_images(matcher_service, sample_images):
+    """Imagens de exemplo já escaneadas"""
+    return matcher_service.find_images(sample_images)
+
+
 @pytest.fixture
 def sample_segments():
     """Cria segmentos de exemplo"""
@@ -98,19 +111,21 @@ def test_find_images_directory_not_found(matcher_service):
 
 
 @pytest.mark.asyncio
-async def test_find_best_matches_with_ollama(matcher_service, sample_segments, sample_images):
+async def test_find_best_matches_with_ollama(matcher_service, sample_segments, available_images, mock_ollama):
     """Testa matching com Ollama"""
-    available_images = matcher_service.find_images(sample_images)
+    # Mock da resposta do Ollama: todos os segmentos em uma única chamada
+    mock_ollama_response = {"response": (
+        '{"matches": ['
+        '{"segment": 1, "image": 1, "score": 0.85}, '  # carro_vermelho
+        '{"segment": 2, "image": 2, "score": 0.92}'  # paisagem_praia
+        ']}'
+    )}
     
-    # Mock da resposta do Ollama
-    mock_ollama_response_1 = {"response": "1|0.85"}  # carro_vermelho
-    mock_ollama_response_2 = {"response": "2|0.92"}  # paisagem_praia
+    mock_ollama.return_value = mock_ollama_response
     
-    with patch('app.services.image_matcher_service.ollama.generate') as mock_ollama:
-        mock_ollama.side_effect = [mock_ollama_response_1, mock_ollama_response_2]
-        
-        matches = await matcher_service.find_best_matches(sample_segments, available_images)
+    matches = await matcher_service.find_best_matches(sample_segments, available_images)
     
+    assert mock_ollama.call_count == 1
     assert len(matches) == 2
     assert all(isinstance(m, ImageMatch) for m in matches)
     
@@ -124,17 +139,12 @@ async def test_find_best_matches_with_ollama(matcher_service, sample_segments, s
 
 
 @pytest.mark.asyncio
-async def test_find_best_matches_with_fallback(matcher_service, sample_segments, sample_images):
+async def test_find_best_matches_with_fallback(matcher_service, sample_segments, available_images, mock_ollama):
     """Testa fallback quando Ollama retorna score baixo"""
-    available_images = matcher_service.find_images(sample_images)
-    
     # Mock com score muito baixo
-    mock_ollama_response = {"response": "1|0.15"}
+    mock_ollama.return_value = {"response": "1|0.15"}
     
-    with patch('app.services.image_matcher_service.ollama.generate') as mock_ollama:
-        mock_ollama.return_value = mock_ollama_response
-        
-        matches = await matcher_service.find_best_matches(sample_segments[:1], available_images)
+    matches = await matcher_service.find_best_matches(sample_segments[:1], available_images)
     
     # Deve usar fallback (score <= 0.5)
     assert len(matches) == 1
@@ -142,10 +152,8 @@ async def test_find_best_matches_with_fallback(matcher_service, sample_segments,
 
 
 @pytest.mark.asyncio
-async def test_match_segment_prefers_less_used_images(matcher_service, sample_images):
+async def test_match_segment_prefers_less_used_images(matcher_service, available_images, mock_ollama):
     """Testa que fallback prefere imagens menos usadas"""
-    available_images = matcher_service.find_images(sample_images)
-    
     segment = TranscriptionSegment(
         text="Texto genérico sem match claro",
         start_time=0.0,
@@ -160,27 +168,58 @@ async def test_match_segment_prefers_less_used_images(matcher_service, sample_im
     }
     
     # Mock Ollama com score baixo para forçar fallback
-    with patch('app.services.image_matcher_service.ollama.generate') as mock_ollama:
-        mock_ollama.return_value = {"response": "1|0.1"}
-        
-        match = await matcher_service._match_segment_to_image(
-            segment, available_images, used_images
-        )
+    mock_ollama.return_value = {"response": "1|0.1"}
+    
+    match = await matcher_service._match_segment_to_image(
+        segment, available_images, used_images
+    )
     
     # Deve preferir imagem menos usada no fallback
     assert match.image.path in [img.path for img in available_images]
 
 
+def test_fallback_match_scores_keywords_and_usage(matcher_service, available_images, sample_segments):
+    """Testa que o fallback pontua keywords do texto e penaliza imagens usadas"""
+    # "paisagem" e "praia" aparecem no texto
+    image, score = matcher_service._fallback_match(sample_segments[1], available_images, {})
+    assert image.filename == "paisagem_praia.png"
+    assert score == 0.5
+    
+    # Uso intenso derruba a imagem abaixo das demais
+    used_images = {image.path: 10}
+    image, _ = matcher_service._fallback_match(sample_segments[1], available_images, used_images)
+    assert image.filename == "carro_vermelho.jpg"
+
+
+def test_keyword_candidates_prefilter(matcher_service, tmp_path):
+    """Testa que o prompt recebe só as candidatas mais relevantes"""
+    images_dir = tmp_path / "many"
+    images_dir.mkdir()
+    for i in range(12):
+        (images_dir / f"imagem_generica_{i:02d}.jpg").write_text("fake image")
+    (images_dir / "zebra_savana.jpg").write_text("fake image")
+    available_images = matcher_service.find_images(images_dir)
+    
+    segment = TranscriptionSegment(
+        text="Uma zebra atravessando a savana",
+        start_time=0.0,
+        end_time=5.0,
+        keywords=["zebra", "atravessando", "savana"]
+    )
+    
+    candidates = matcher_service._keyword_candidates([segment], available_images)
+    
+    assert len(candidates) == 8
+    assert candidates[0].filename == "zebra_savana.jpg"
+
+
 @pytest.mark.asyncio
-async def test_ollama_match_handles_invalid_response(matcher_service, sample_segments, sample_images):
+async def test_ollama_match_handles_invalid_response(matcher_service, sample_segments, available_images, mock_ollama):
     """Testa tratamento de resposta inválida do Ollama"""
-    available_images = matcher_service.find_images(sample_images)
-    
     # Mock com resposta malformada
-    with patch('app.services.image_matcher_service.ollama.generate') as mock_ollama:
-        mock_ollama.return_value = {"response": "resposta inválida sem formato"}
-        
-        image, score = await matcher_service._ollama_match(sample_segments[0], available_images)
+    mock_ollama.return_value = {"response": "resposta inválida sem formato"}
+    
+    image, score = await matcher_service._ollama_match(sample_segments[0], available_images)
     
     # Deve retornar primeira imagem com score baixo
     assert image == available_images[0]
@@ -1,10 +1,10 @@
 import pytest
 from pathlib import Path
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
-from PIL import Image
+import cv2
 import numpy as np
 
-from app.services.story_video_service import StoryVideoService
+from app.services.story_video_service import StoryVideoService, X264_ARGS
 from app.models.story_video_schemas import (
     TranscriptionSegment,
     ImageInfo,
@@ -14,30 +14,30 @@ from app.models.story_video_schemas import (
 )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def story_service():
-    """Fixture para o serviço de criação de vídeos"""
+    """Fixture para o serviço de criação de vídeos (compartilhado: monta transcrição e matcher)"""
     return StoryVideoService()
 
 
-@pytest.fixture
-def mock_audio_file(tmp_path):
-    """Cria um arquivo de áudio mock"""
-    audio_file = tmp_path / "narration.mp3"
+@pytest.fixture(scope="module")
+def mock_audio_file(tmp_path_factory):
+    """Cria um arquivo de áudio mock (somente leitura, compartilhado pelo módulo)"""
+    audio_file = tmp_path_factory.mktemp("audio") / "narration.mp3"
     audio_file.write_text("mock audio")
     return audio_file
 
 
-@pytest.fixture
-def mock_images_dir(tmp_path):
-    """Cria diretório com imagens mock"""
-    images_dir = tmp_path / "images"
-    images_dir.mkdir()
+@pytest.fixture(scope="module")
+def mock_images_dir(tmp_path_factory):
+    """Cria diretório com imagens mock (somente leitura, compartilhado pelo módulo)"""
+    images_dir = tmp_path_factory.mktemp("images")
     
-    # Criar imagens reais para teste
+    # Criar imagens reais para teste (um único buffer BGR reaproveitado)
+    pixels = np.empty((100, 100, 3), np.uint8)
     for i, name in enumerate(["intro.jpg", "middle.jpg", "end.jpg"]):
-        img = Image.new('RGB', (100, 100), color=(i * 50, 100, 150))
-        img.save(images_dir / name)
+        pixels[:] = (150, 100, i * 50)
+        cv2.imwrite(str(images_dir / name), pixels)
     
     return images_dir
 
@@ -134,85 +134,126 @@ def test_build_timeline(story_service, mock_matches):
     assert timeline[2].end_time == 16.0
 
 
-def test_fit_image_to_resolution_portrait(story_service):
-    """Testa ajuste de imagem para resolução vertical (TikTok)"""
-    # Criar imagem horizontal
-    img = Image.new('RGB', (1920, 1080), color=(255, 0, 0))
-    
-    # Ajustar para vertical TikTok
-    result = story_service._fit_image_to_resolution(img, (1080, 1920))
-    
-    assert result.size == (1080, 1920)
-
-
-def test_fit_image_to_resolution_landscape(story_service):
-    """Testa ajuste de imagem horizontal"""
-    # Criar imagem vertical
-    img = Image.new('RGB', (1080, 1920), color=(0, 255, 0))
-    
-    # Ajustar para horizontal
-    result = story_service._fit_image_to_resolution(img, (1920, 1080))
+def test_build_timeline_sorts_unordered_matches(story_service, mock_matches):
+    """Testa que a timeline é ordenada por start_time mesmo com matches fora de ordem"""
+    timeline = story_service._build_timeline(list(reversed(mock_matches)))
     
-    assert result.size == (1920, 1080)
+    assert [item.start_time for item in timeline] == [0.0, 5.0, 12.0]
+    assert [item.image_path for item in timeline] == [
+        "/fake/intro.jpg", "/fake/middle.jpg", "/fake/end.jpg"
+    ]
 
 
-def test_create_image_clip_smooth_style(story_service, mock_images_dir):
-    """Testa criação de clip com estilo smooth"""
-    img_path = list(mock_images_dir.glob("*.jpg"))[0]
-    
-    clip = story_service._create_image_clip(
-        image_path=img_path,
+def test_clip_filter_smooth_style(story_service):
+    """Testa filtros do estilo smooth (frame repetido + fades, sem zoom)"""
+    chain = story_service._clip_filter(
         duration=5.0,
         resolution=(1080, 1920),
         style="smooth",
         position=0
     )
     
-    assert clip.duration == 5.0
-    assert clip.fps == 30
+    assert "loop=loop=149:size=1:start=0" in chain  # 150 frames a 30fps
+    assert "zoompan" not in chain
+    assert "fade=t=in:st=0:d=0.500" in chain
+    assert "fade=t=out:st=4.500:d=0.500" in chain
 
 
-def test_create_image_clip_dynamic_style(story_service, mock_images_dir):
-    """Testa criação de clip com estilo dynamic"""
-    img_path = list(mock_images_dir.glob("*.jpg"))[0]
-    
-    clip = story_service._create_image_clip(
-        image_path=img_path,
+def test_clip_filter_dynamic_style(story_service):
+    """Testa filtros do estilo dynamic (zoom leve)"""
+    chain = story_service._clip_filter(
         duration=5.0,
         resolution=(1080, 1920),
         style="dynamic",
         position=0
     )
     
-    assert clip.duration == 5.0
-    assert clip.fps == 30
+    assert "zoompan=z='1.0+0.0500*min(on/150,1)'" in chain
+    assert "s=1080x1920" in chain
 
 
-def test_create_image_clip_ken_burns_style(story_service, mock_images_dir):
-    """Testa criação de clip com estilo ken_burns"""
-    img_path = list(mock_images_dir.glob("*.jpg"))[0]
-    
+def test_clip_filter_ken_burns_style(story_service):
+    """Testa que ken_burns alterna zoom in e zoom out"""
     # Testar zoom in (posição par)
-    clip_zoom_in = story_service._create_image_clip(
-        image_path=img_path,
+    zoom_in = story_service._clip_filter(
         duration=5.0,
         resolution=(1080, 1920),
         style="ken_burns",
         position=0
     )
-    
-    assert clip_zoom_in.duration == 5.0
+    assert "z='1.0+0.1500*" in zoom_in
     
     # Testar zoom out (posição ímpar)
-    clip_zoom_out = story_service._create_image_clip(
-        image_path=img_path,
+    zoom_out = story_service._clip_filter(
         duration=5.0,
         resolution=(1080, 1920),
         style="ken_burns",
         position=1
     )
+    assert "z='1.15-0.1500*" in zoom_out
+
+
+def test_cover_filter(story_service):
+    """Testa enquadramento "cover" (escala para cobrir + crop central)"""
+    chain = story_service._cover_filter((1080, 1920))
+    
+    assert "scale=1080:1920:force_original_aspect_ratio=increase" in chain
+    assert "crop=1080:1920" in chain
+
+
+@pytest.mark.asyncio
+async def test_generate_video_reuses_repeated_images(story_service, mock_images_dir, mock_audio_file):
+    """Testa que imagens repetidas no timeline entram uma vez só no FFmpeg"""
+    image = str(sorted(mock_images_dir.glob("*.jpg"))[0])
+    timeline = [
+        TimelineItem(start_time=0.0, end_time=5.0, image_path=image, confidence=0.8),
+        TimelineItem(start_time=5.0, end_time=12.0, image_path=image, confidence=0.7),
+    ]
+    
+    with patch('app.services.story_video_service._video_encoder_args', return_value=tuple(X264_ARGS)):
+        with patch('app.services.story_video_service.run_ffmpeg', new_callable=AsyncMock) as mock_ffmpeg:
+            await story_service._generate_video(
+                timeline=timeline,
+                audio_file=mock_audio_file,
+                output_path=Path("out.mp4"),
+                style="smooth",
+                resolution=(1080, 1920)
+            )
+    
+    args = mock_ffmpeg.call_args[0][0]
+    graph = args[args.index("-filter_complex") + 1]
+    assert args.count("-i") == 2  # Uma imagem + narração
+    assert "split=2[s0_0][s0_1]" in graph
+    assert "1:a" in args
+
+
+@pytest.mark.asyncio
+async def test_generate_video_single_ffmpeg_call(story_service, mock_images_dir, mock_audio_file):
+    """Testa que o vídeo é exportado em uma única chamada ao FFmpeg"""
+    images = sorted(mock_images_dir.glob("*.jpg"))
+    timeline = [
+        TimelineItem(start_time=0.0, end_time=5.0, image_path=str(images[0]), confidence=0.8),
+        TimelineItem(start_time=5.0, end_time=12.0, image_path=str(images[1]), confidence=0.7),
+    ]
+    
+    with patch('app.services.story_video_service._video_encoder_args', return_value=tuple(X264_ARGS)):
+        with patch('app.services.story_video_service.run_ffmpeg', new_callable=AsyncMock) as mock_ffmpeg:
+            await story_service._generate_video(
+                timeline=timeline,
+                audio_file=mock_audio_file,
+                output_path=Path("out.mp4"),
+                style="smooth",
+                resolution=(1080, 1920)
+            )
     
-    assert clip_zoom_out.duration == 5.0
+    mock_ffmpeg.assert_called_once()
+    args = mock_ffmpeg.call_args[0][0]
+    assert args.count("-i") == 3  # Duas imagens + narração
+    assert "2:a" in args  # Áudio da narração é o input depois das imagens
+    assert args[args.index("-t", args.index("-filter_complex")) + 1] == "12.000"
+    assert "concat=n=2:v=1:a=0" in args[args.index("-filter_complex") + 1]
+    # Estilo sem zoom: x264 ajustado para imagens paradas
+    assert args[args.index("-tune") + 1] == "stillimage"
 
 
 @pytest.mark.asyncio
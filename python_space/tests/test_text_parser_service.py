@@ -47,3 +47,10 @@ def test_username_to_author():
     assert text_parser_service._username_to_author("single") == "Single"
 
 
+def test_parse_comments_file_max_count(sample_comments_txt):
+    """Test that parsing stops after max_count comments"""
+    comments = text_parser_service.parse_comments_file(str(sample_comments_txt), max_count=5)
+    
+    assert len(comments) == 5
+    assert comments[0].username == "maria_silva"
+    assert comments[4].username == "juliana_alves"
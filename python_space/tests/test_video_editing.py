@@ -4,7 +4,6 @@ Tests for video editing services
 import pytest
 from pathlib import Path
 from unittest.mock import Mock, patch, AsyncMock, MagicMock
-from moviepy.editor import VideoFileClip
 
 from app.services.capcut_service import CapCutAutomationService
 from app.services.video_analyzer_service import VideoAnalyzerService
@@ -18,26 +17,15 @@ from app.models.video_edit_schemas import (
 class TestCapCutAutomationService:
     """Tests for CapCut automation service"""
     
-    @pytest.fixture
+    @pytest.fixture(scope="session")
     def capcut_service(self):
-        """Create CapCut service instance"""
+        """Create CapCut service instance (shared: construction creates temp dirs and style tables)"""
         return CapCutAutomationService()
     
-    @pytest.fixture
-    def mock_video_clip(self):
-        """Mock VideoFileClip"""
-        clip = MagicMock(spec=VideoFileClip)
-        clip.duration = 30.0
-        clip.w = 1080
-        clip.h = 1920
-        clip.fps = 30
-        clip.fx.return_value = clip
-        clip.fadein.return_value = clip
-        clip.fadeout.return_value = clip
-        clip.subclip.return_value = clip
-        clip.write_videofile = MagicMock()
-        clip.close = MagicMock()
-        return clip
+    @pytest.fixture(autouse=True)
+    def reset_probe_cache(self, capcut_service):
+        """Each test starts with an empty probe cache on the shared service"""
+        capcut_service._probe_cache.clear()
     
     @pytest.fixture
     def mock_comments(self):
@@ -60,20 +48,28 @@ class TestCapCutAutomationService:
             "author": "fe_e_groove"
         }
     
+    @pytest.fixture
+    def mock_ffmpeg(self, capcut_service):
+        """Mock FFmpeg probing and execution (writes an empty output file)"""
+        async def run_ffmpeg(args):
+            Path(args[-1]).write_bytes(b"\0" * 1024)
+        
+        infos = {"duration": 30.0, "video_size": [1080, 1920], "audio_found": True}
+        with patch('app.services.capcut_service.ffmpeg_parse_infos', return_value=infos), \
+                patch('app.services.capcut_service.run_ffmpeg', new=AsyncMock(side_effect=run_ffmpeg)) as mock_run:
+            yield mock_run
+    
     @pytest.mark.asyncio
-    @patch('app.services.capcut_service.VideoFileClip')
     async def test_edit_video_viral_style(
         self,
-        mock_video_class,
         capcut_service,
-        mock_video_clip,
+        mock_ffmpeg,
         mock_comments,
         mock_metadata,
         tmp_path
     ):
         """Test video editing with viral style"""
         # Setup
-        mock_video_class.return_value = mock_video_clip
         video_path = tmp_path / "test_video.mp4"
         video_path.touch()
         
@@ -94,18 +90,110 @@ class TestCapCutAutomationService:
         assert result.subtitles_count >= 0
     
     @pytest.mark.asyncio
-    @patch('app.services.capcut_service.VideoFileClip')
+    async def test_edit_video_single_ffmpeg_pass(
+        self,
+        capcut_service,
+        mock_ffmpeg,
+        mock_comments,
+        mock_metadata,
+        tmp_path
+    ):
+        """Test that every edit step lands in one FFmpeg filtergraph"""
+        video_path = tmp_path / "test_video.mp4"
+        video_path.touch()
+        
+        await capcut_service.edit_video(
+            video_path=video_path,
+            comments=mock_comments,
+            metadata=mock_metadata,
+            style=EditStyle.VIRAL,
+            add_subtitles=True
+        )
+        
+        mock_ffmpeg.assert_awaited_once()
+        args = mock_ffmpeg.await_args.args[0]
+        filtergraph = args[args.index("-filter_complex") + 1]
+        assert "scale=-2:1280" in filtergraph
+        assert "setpts=PTS/1.1" in filtergraph
+        assert "zoompan" in filtergraph
+        assert "fade=t=in" in filtergraph
+        # 5 legendas + marca d'água
+        assert filtergraph.count("overlay=") == 6
+    
+    @pytest.mark.asyncio
+    async def test_probe_cache_is_bounded(
+        self,
+        capcut_service,
+        mock_ffmpeg,
+        mock_comments,
+        mock_metadata,
+        tmp_path
+    ):
+        """Test that only input probes are cached, in an LRU of PROBE_CACHE_SIZE"""
+        video_path = tmp_path / "test_video.mp4"
+        video_path.touch()
+        
+        await capcut_service.edit_video(
+            video_path=video_path,
+            comments=mock_comments,
+            metadata=mock_metadata,
+            style=EditStyle.VIRAL,
+            add_subtitles=False
+        )
+        # O vídeo gerado não entra no cache
+        assert [key[0] for key in capcut_service._probe_cache] == [str(video_path)]
+        
+        with patch('app.services.capcut_service.PROBE_CACHE_SIZE', 2):
+            for i in range(3):
+                other = tmp_path / f"other_{i}.mp4"
+                other.touch()
+                await capcut_service._probe(other)
+        
+        assert [Path(key[0]).name for key in capcut_service._probe_cache] == ["other_1.mp4", "other_2.mp4"]
+    
+    @pytest.mark.asyncio
+    async def test_edit_video_copies_untouched_audio(
+        self,
+        capcut_service,
+        mock_ffmpeg,
+        mock_comments,
+        mock_metadata,
+        tmp_path
+    ):
+        """Test that audio without cuts or speed changes is not re-encoded"""
+        video_path = tmp_path / "test_video.mp4"
+        video_path.touch()
+        
+        probe = {"streams": [{"codec_type": "audio", "codec_name": "aac"}]}
+        with patch.object(capcut_service, '_probe_streams', new=AsyncMock(return_value=probe)):
+            await capcut_service.edit_video(
+                video_path=video_path,
+                comments=mock_comments,
+                metadata=mock_metadata,
+                style=EditStyle.MINIMAL
+            )
+            args = mock_ffmpeg.await_args.args[0]
+            assert args[args.index("-c:a") + 1] == "copy"
+            
+            await capcut_service.edit_video(
+                video_path=video_path,
+                comments=mock_comments,
+                metadata=mock_metadata,
+                style=EditStyle.VIRAL
+            )
+            args = mock_ffmpeg.await_args.args[0]
+            assert args[args.index("-c:a") + 1] == "aac"
+    
+    @pytest.mark.asyncio
     async def test_edit_video_storytelling_style(
         self,
-        mock_video_class,
         capcut_service,
-        mock_video_clip,
+        mock_ffmpeg,
         mock_comments,
         mock_metadata,
         tmp_path
     ):
         """Test video editing with storytelling style"""
-        mock_video_class.return_value = mock_video_clip
         video_path = tmp_path / "test_video.mp4"
         video_path.touch()
         
@@ -121,18 +209,15 @@ class TestCapCutAutomationService:
         assert "fade" in str(result.effects_applied).lower()
     
     @pytest.mark.asyncio
-    @patch('app.services.capcut_service.VideoFileClip')
     async def test_edit_video_with_target_duration(
         self,
-        mock_video_class,
         capcut_service,
-        mock_video_clip,
+        mock_ffmpeg,
         mock_comments,
         mock_metadata,
         tmp_path
     ):
         """Test video editing with target duration"""
-        mock_video_class.return_value = mock_video_clip
         video_path = tmp_path / "test_video.mp4"
         video_path.touch()
         
@@ -148,18 +233,15 @@ class TestCapCutAutomationService:
             assert result is not None
     
     @pytest.mark.asyncio
-    @patch('app.services.capcut_service.VideoFileClip')
     async def test_edit_video_without_subtitles(
         self,
-        mock_video_class,
         capcut_service,
-        mock_video_clip,
+        mock_ffmpeg,
         mock_comments,
         mock_metadata,
         tmp_path
     ):
         """Test video editing without subtitles"""
-        mock_video_class.return_value = mock_video_clip
         video_path = tmp_path / "test_video.mp4"
         video_path.touch()
         
@@ -174,21 +256,13 @@ class TestCapCutAutomationService:
         assert result.subtitles_count == 0
     
     @pytest.mark.asyncio
-    @patch('app.services.capcut_service.VideoFileClip')
-    @patch('app.services.capcut_service.concatenate_videoclips')
     async def test_create_compilation(
         self,
-        mock_concat,
-        mock_video_class,
         capcut_service,
-        mock_video_clip,
+        mock_ffmpeg,
         tmp_path
     ):
         """Test creating compilation from multiple videos"""
-        # Setup
-        mock_video_class.return_value = mock_video_clip
-        mock_concat.return_value = mock_video_clip
-        
         video_paths = [
             tmp_path / "video1.mp4",
             tmp_path / "video2.mp4",
@@ -208,12 +282,44 @@ class TestCapCutAutomationService:
         assert result.style_applied == EditStyle.COMPILATION
         assert "compilation" in result.effects_applied
         assert "fade" in str(result.effects_applied).lower()
+        # 2 segmentos de 30s cabem em 60s, codificados antes do concat final
+        calls = [call.args[0] for call in mock_ffmpeg.await_args_list]
+        assert len(calls) == 3
+        assert all("fade=t=in" in args[args.index("-vf") + 1] for args in calls[:2])
+        assert calls[-1][calls[-1].index("-c") + 1] == "copy"
+        assert result.duration_edited == 60.0
+    
+    @pytest.mark.asyncio
+    async def test_create_compilation_stream_copy(
+        self,
+        capcut_service,
+        mock_ffmpeg,
+        tmp_path
+    ):
+        """Test that uniform inputs are concatenated without re-encoding"""
+        video_paths = [tmp_path / "video1.mp4", tmp_path / "video2.mp4"]
+        for path in video_paths:
+            path.touch()
+        
+        probe = {
+            "streams": [{"codec_type": "video", "codec_name": "h264", "width": 1080, "height": 1920}],
+            "format": {"duration": "40.0"}
+        }
+        with patch.object(capcut_service, '_probe_streams', new=AsyncMock(return_value=probe)):
+            result = await capcut_service.create_compilation(video_paths=video_paths, max_duration=60)
+        
+        args = mock_ffmpeg.await_args.args[0]
+        assert args[args.index("-f") + 1] == "concat"
+        assert args[args.index("-c") + 1] == "copy"
+        assert "stream_copy" in result.effects_applied
+        assert result.duration_original == 80.0
+        assert result.duration_edited == 60.0
 
 
 class TestVideoAnalyzerService:
     """Tests for video analyzer service"""
     
-    @pytest.fixture
+    @pytest.fixture(scope="session")
     def analyzer_service(self):
         """Create analyzer service instance"""
         return VideoAnalyzerService()
@@ -249,11 +355,12 @@ class TestVideoAnalyzerService:
         video_path.touch()
         
         # Execute
-        with patch.object(analyzer_service, '_detect_key_moments', new=AsyncMock(return_value=[])):
-            with patch.object(analyzer_service, '_detect_scene_changes', new=AsyncMock(return_value=[5.0, 10.0, 15.0])):
-                with patch.object(analyzer_service, '_calculate_average_brightness', new=AsyncMock(return_value=128.0)):
-                    with patch.object(analyzer_service, '_calculate_motion_intensity', new=AsyncMock(return_value=0.6)):
-                        result = await analyzer_service.analyze_video(video_path)
+        with patch.object(
+            analyzer_service,
+            '_analyze_single_pass',
+            return_value=([], [5.0, 10.0, 15.0], 128.0, 0.6)
+        ):
+            result = await analyzer_service.analyze_video(video_path)
         
         # Verify
         assert isinstance(result, AnalysisResult)
@@ -300,55 +407,131 @@ class TestVideoAnalyzerService:
         assert total_duration <= 15  # Should not exceed target
     
     @pytest.mark.asyncio
-    async def test_detect_key_moments(self, analyzer_service, mock_video_capture):
-        """Test key moment detection"""
-        import numpy as np
+    async def test_probe_metadata_reads_ffprobe_json(self, analyzer_service, tmp_path):
+        """Test metadata (and real audio detection) from ffprobe output"""
+        import json
+        probe = {
+            "streams": [
+                {"codec_type": "video", "width": 1080, "height": 1920, "avg_frame_rate": "30/1", "nb_frames": "450"},
+            ],
+            "format": {"duration": "15.0"},
+        }
+        process = MagicMock(returncode=0)
+        process.communicate = AsyncMock(return_value=(json.dumps(probe).encode(), b""))
         
-        # Mock frames with different content (simulating scene changes)
-        frames = [
-            np.random.randint(0, 255, (1920, 1080, 3), dtype=np.uint8)
-            for _ in range(10)
-        ]
+        with patch('app.services.ffmpeg_utils.asyncio.create_subprocess_exec', new=AsyncMock(return_value=process)):
+            metadata = await analyzer_service._probe_metadata(tmp_path / "video.mp4")
         
-        mock_video_capture.read.side_effect = [(True, frame) for frame in frames] + [(False, None)]
+        assert metadata == {
+            "fps": 30.0,
+            "frame_count": 450,
+            "width": 1080,
+            "height": 1920,
+            "duration": 15.0,
+            "has_audio": False,
+        }
+    
+    @pytest.mark.asyncio
+    async def test_probe_metadata_prefers_container_duration(self, analyzer_service, tmp_path):
+        """Test frame count comes from format.duration when nb_frames is bogus"""
+        import json
+        probe = {
+            "streams": [
+                {"codec_type": "video", "width": 720, "height": 1280, "avg_frame_rate": "30/1", "nb_frames": "90000"},
+                {"codec_type": "audio"},
+            ],
+            "format": {"duration": "15.0"},
+        }
+        process = MagicMock(returncode=0)
+        process.communicate = AsyncMock(return_value=(json.dumps(probe).encode(), b""))
         
-        with patch('app.services.video_analyzer_service.cv2.cvtColor', side_effect=lambda f, _: f[:, :, 0]):
-            with patch('app.services.video_analyzer_service.cv2.absdiff', return_value=np.full((1920, 1080), 50)):
-                key_moments = await analyzer_service._detect_key_moments(mock_video_capture, 30.0)
+        with patch('app.services.ffmpeg_utils.asyncio.create_subprocess_exec', new=AsyncMock(return_value=process)):
+            metadata = await analyzer_service._probe_metadata(tmp_path / "video.mp4")
         
-        assert isinstance(key_moments, list)
-        assert len(key_moments) <= 20  # Should limit to 20
+        assert metadata["frame_count"] == 450
+        assert metadata["has_audio"] is True
     
-    @pytest.mark.asyncio
-    async def test_calculate_average_brightness(self, analyzer_service, mock_video_capture):
-        """Test average brightness calculation"""
+    @patch('app.services.video_analyzer_service.cv2.VideoCapture')
+    def test_open_capture_falls_back_without_hw_backend(self, mock_capture_class, analyzer_service, tmp_path):
+        """Test default decoder is used when the FFmpeg hw-accelerated open fails"""
+        import cv2
+        from app.services.video_analyzer_service import HW_DECODE_PARAMS
+        hw_capture = MagicMock()
+        hw_capture.isOpened.return_value = False
+        default_capture = MagicMock()
+        mock_capture_class.side_effect = [hw_capture, default_capture]
+        video_path = tmp_path / "video.mp4"
+        
+        cap = analyzer_service._open_capture(video_path)
+        
+        assert cap is default_capture
+        hw_capture.release.assert_called_once()
+        assert mock_capture_class.call_args_list[0].args == (str(video_path), cv2.CAP_FFMPEG, HW_DECODE_PARAMS)
+        assert mock_capture_class.call_args_list[1].args == (str(video_path),)
+    
+    @staticmethod
+    def _frames_capture(frames):
+        """VideoCapture falso que entrega os frames em ordem (grab/retrieve)"""
+        import cv2
+        capture = MagicMock(spec=cv2.VideoCapture)
+        position = {"next": 0, "current": None}
+        
+        def grab():
+            if position["next"] >= len(frames):
+                return False
+            position["current"] = frames[position["next"]]
+            position["next"] += 1
+            return True
+        
+        capture.grab.side_effect = grab
+        capture.retrieve.side_effect = lambda: (True, position["current"])
+        return capture
+    
+    def test_single_pass_key_moments(self, analyzer_service):
+        """Test key moment detection"""
         import numpy as np
         
-        # Create frames with known brightness
-        bright_frame = np.full((1920, 1080, 3), 200, dtype=np.uint8)
-        mock_video_capture.read.return_value = (True, bright_frame)
-        mock_video_capture.get.return_value = 100  # frame count
+        # Alternating black/white frames: every consecutive pair is a scene change
+        frames = [
+            np.full((64, 36, 3), 255 if i % 2 else 0, dtype=np.uint8)
+            for i in range(30)
+        ]
+        capture = self._frames_capture(frames)
         
-        with patch('app.services.video_analyzer_service.cv2.cvtColor', return_value=bright_frame[:, :, 0]):
-            brightness = await analyzer_service._calculate_average_brightness(mock_video_capture)
+        key_moments, scene_changes, _, _ = analyzer_service._analyze_single_pass(capture, 30.0, len(frames))
         
-        assert 0 <= brightness <= 255
+        assert len(key_moments) == 20  # Should limit to 20
+        assert key_moments[0].timestamp == pytest.approx(1 / 30)
+        # Frames 0, 10, 20 are all black: no change every 10 frames
+        assert scene_changes == []
     
-    @pytest.mark.asyncio
-    async def test_calculate_motion_intensity(self, analyzer_service, mock_video_capture):
-        """Test motion intensity calculation"""
+    def test_single_pass_brightness_and_motion(self, analyzer_service):
+        """Test average brightness and motion intensity in the same pass"""
         import numpy as np
         
-        # Create frames with motion
-        frame1 = np.random.randint(0, 255, (1920, 1080), dtype=np.uint8)
-        frame2 = np.random.randint(0, 255, (1920, 1080), dtype=np.uint8)
+        frames = [
+            np.full((64, 36, 3), 200 if i % 2 else 100, dtype=np.uint8)
+            for i in range(60)
+        ]
+        capture = self._frames_capture(frames)
+        
+        _, _, brightness, motion = analyzer_service._analyze_single_pass(capture, 30.0, len(frames))
         
-        mock_video_capture.read.side_effect = [(True, frame1), (True, frame2), (False, None)]
-        mock_video_capture.get.return_value = 60  # frame count
+        # Motion samples every 2 frames (all dark); brightness every 3 frames
+        assert 100 <= brightness <= 200
+        assert motion == 0.0
+        # Every frame decoded once at most
+        assert capture.grab.call_count <= len(frames) + 1
+        assert capture.retrieve.call_count <= len(frames)
+    
+    def test_single_pass_stops_at_end_of_video(self, analyzer_service):
+        """Test that an empty/short video returns neutral metrics"""
+        capture = self._frames_capture([])
         
-        with patch('app.services.video_analyzer_service.cv2.cvtColor', side_effect=[frame1, frame2]):
-            with patch('app.services.video_analyzer_service.cv2.absdiff', return_value=np.full((1920, 1080), 30)):
-                motion = await analyzer_service._calculate_motion_intensity(mock_video_capture)
+        key_moments, scene_changes, brightness, motion = analyzer_service._analyze_single_pass(capture, 30.0, 0)
         
-        assert 0.0 <= motion <= 1.0
+        assert key_moments == []
+        assert scene_changes == []
+        assert brightness == 0.0
+        assert motion == 0.0
 
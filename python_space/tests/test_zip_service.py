@@ -1,19 +1,20 @@
 import pytest
 import zipfile
 from pathlib import Path
-from app.services.zip_service import zip_service
+from unittest.mock import patch
+from app.services.zip_service import TEXT_COMPRESS_LEVEL, zip_service
 
 
-def test_create_package(sample_video_file, sample_comments_txt, temp_dir):
+def test_create_package(sample_video_file, sample_comments_txt, tmp_path):
     """Test creating a complete ZIP package"""
     # Create some dummy image files
     image_paths = []
     for i in range(1, 4):
-        img_path = temp_dir / f"instagram_{i:02d}.png"
+        img_path = tmp_path / f"instagram_{i:02d}.png"
         img_path.write_bytes(b"fake png data")
         image_paths.append(img_path)
     
-    zip_path = temp_dir / "test_package.zip"
+    zip_path = tmp_path / "test_package.zip"
     
     result_path = zip_service.create_package(
         video_path=sample_video_file,
@@ -36,12 +37,52 @@ def test_create_package(sample_video_file, sample_comments_txt, temp_dir):
         assert "instagram_02.png" in files
         assert "instagram_03.png" in files
         
+        # Media is already compressed: stored as-is, text is deflated
+        assert zipf.getinfo("video.mp4").compress_type == zipfile.ZIP_STORED
+        assert zipf.getinfo("instagram_01.png").compress_type == zipfile.ZIP_STORED
+        assert zipf.getinfo("comentarios.txt").compress_type == zipfile.ZIP_DEFLATED
+        
         # Verify README content
         readme_content = zipf.read("README.txt").decode('utf-8')
         assert "INTELIGÊNCIA ARTIFICIAL" in readme_content
         assert "AVISO IMPORTANTE" in readme_content
 
 
+def test_create_package_text_compress_level(sample_video_file, sample_comments_txt, tmp_path):
+    """Test that every deflated member uses TEXT_COMPRESS_LEVEL"""
+    with patch('zipfile._get_compressor', wraps=zipfile._get_compressor) as get_compressor:
+        zip_service.create_package(
+            video_path=sample_video_file,
+            comments_txt_path=sample_comments_txt,
+            image_paths=[],
+            output_path=tmp_path / "level_package.zip"
+        )
+    
+    deflate_levels = [
+        call.args[1] for call in get_compressor.call_args_list
+        if call.args[0] == zipfile.ZIP_DEFLATED
+    ]
+    assert len(deflate_levels) == 2  # comentarios.txt and README.txt
+    assert set(deflate_levels) == {TEXT_COMPRESS_LEVEL}
+
+
+@pytest.mark.asyncio
+async def test_create_package_async(sample_video_file, sample_comments_txt, tmp_path):
+    """Test creating the ZIP package from async code"""
+    zip_path = tmp_path / "async_package.zip"
+    
+    result_path = await zip_service.create_package_async(
+        video_path=sample_video_file,
+        comments_txt_path=sample_comments_txt,
+        image_paths=[],
+        output_path=zip_path
+    )
+    
+    assert result_path == zip_path
+    with zipfile.ZipFile(zip_path, 'r') as zipf:
+        assert set(zipf.namelist()) == {"video.mp4", "comentarios.txt", "README.txt"}
+
+
 def test_generate_readme():
     """Test README generation"""
     readme = zip_service._generate_readme()
@@ -53,11 +94,11 @@ def test_generate_readme():
     assert "TikTok Downloader" in readme
 
 
-def test_cleanup_temp_files(temp_dir):
+def test_cleanup_temp_files(tmp_path):
     """Test cleanup of temporary files"""
     # Create some temp files
-    file1 = temp_dir / "temp1.txt"
-    file2 = temp_dir / "temp2.txt"
+    file1 = tmp_path / "temp1.txt"
+    file2 = tmp_path / "temp2.txt"
     file1.write_text("test")
     file2.write_text("test")
     
@@ -77,3 +118,29 @@ def test_cleanup_nonexistent_files():
     # Should not raise exception
     zip_service.cleanup_temp_files(fake_paths)
 
+
+def test_iter_package(sample_video_file, sample_comments_txt, tmp_path):
+    """Test streaming a ZIP package chunk by chunk"""
+    image_path = tmp_path / "instagram_01.png"
+    image_path.write_bytes(b"fake png data")
+    
+    chunks = list(zip_service.iter_package(
+        video_path=sample_video_file,
+        comments_txt_path=sample_comments_txt,
+        image_paths=[image_path],
+        chunk_size=8
+    ))
+    
+    assert len(chunks) > 1
+    
+    zip_path = tmp_path / "streamed.zip"
+    zip_path.write_bytes(b"".join(chunks))
+    
+    with zipfile.ZipFile(zip_path, 'r') as zipf:
+        assert zipf.testzip() is None
+        assert set(zipf.namelist()) == {
+            "video.mp4", "comentarios.txt", "instagram_01.png", "README.txt"
+        }
+        assert zipf.read("video.mp4") == sample_video_file.read_bytes()
+        assert zipf.getinfo("video.mp4").compress_type == zipfile.ZIP_STORED
+        assert zipf.getinfo("comentarios.txt").compress_type == zipfile.ZIP_DEFLATED